@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks of a set of representative model configurations, to pick up
+performance regressions between versions of the code.
+
+Each scenario is a set of overrides on top of the Duke young forest .cfg file
+and is run in its own process, so the peak memory of one doesn't hide that of
+another. For each scenario the throughput in simulated years per second (of
+run_sim, i.e. not counting reading the forcing and setting up the model), the
+peak resident memory of its process and how much of that was added by setting
+up the model and by running it are reported and saved as JSON, e.g.
+
+    python run_benchmarks.py -o before.json
+    ... change the code ...
+    python run_benchmarks.py -o after.json -c before.json
+
+The comparison exits with status 1 if any scenario has got slower by more
+than the threshold (10% by default).
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import platform
+import tempfile
+import traceback
+import argparse
+import multiprocessing
+from timeit import default_timer
+from gday.gday import Gday
+from gday._version import __version__ as git_revision
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CFG_FNAME = os.path.join(BASE_DIR, "../example/params/"
+                                   "NCEAS_DUKE_model_youngforest_amb.cfg")
+MET_FNAME = os.path.join(BASE_DIR, "../example/met_data/"
+                                   "DUKE_met_data_amb_co2.csv")
+
+
+def run(G):
+    G.run_sim()
+
+def spin_up(G):
+    # the accelerated spin-up, with a fixed number of forcing cycles so the
+    # benchmark has a fixed cost however close to equilibrium the model gets
+    G.accelerate_soil_spin_up(max_cycles=5)
+
+# name -> (description, overrides, spin_up, what to time)
+SCENARIOS = [
+    ("evergreen", ("Evergreen forest, MATE and Penman-Monteith, Duke forcing",
+                   {"control.assim_model": "MATE", "control.trans_model": 1},
+                   False, run)),
+    ("deciduous", ("Deciduous phenology",
+                   {"control.deciduous_model": True}, False, run)),
+    ("grass_grazing", ("C4 grass with daily grazing",
+                       {"control.alloc_model": "GRASSES",
+                        "control.ps_pathway": "C4", "control.grazing": 1},
+                       False, run)),
+    ("ncycle_off", ("Evergreen forest without the N cycle",
+                    {"control.ncycle": False}, False, run)),
+    ("spin_up", ("Accelerated spin-up, at most 5 forcing cycles per stage",
+                 {}, True, spin_up))]
+SCENARIO_NAMES = [name for (name, scenario) in SCENARIOS]
+
+
+def peak_rss_mb():
+    """ Peak resident memory of this process [MB] """
+    # ru_maxrss is in kilobytes on linux, bytes on mac
+    scale = 1.0 if sys.platform == "darwin" else 1024.0
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale /
+            1024.0**2)
+
+def run_scenario(name, out_dir, queue):
+    """ Time a scenario, in a process of its own
+
+    Parameters:
+    ----------
+    name : string
+        scenario name
+    out_dir : string
+        directory for the model output files
+    queue : multiprocessing.Queue
+        the result dictionary is put here
+    """
+    # the process starts with the memory of the one it was forked from
+    start_rss = peak_rss_mb()
+    result = {"error": None}
+    try:
+        (description, overrides, spin, func) = dict(SCENARIOS)[name]
+        overrides = dict(overrides)
+        overrides["files.met_fname"] = MET_FNAME
+        overrides["files.out_fname"] = os.path.join(out_dir, name + ".csv")
+        overrides["files.out_param_fname"] = os.path.join(out_dir,
+                                                          name + ".cfg")
+
+        start = default_timer()
+        G = Gday(CFG_FNAME, spin_up=spin, overrides=overrides)
+        result["setup_seconds"] = default_timer() - start
+        result["setup_rss_mb"] = peak_rss_mb() - start_rss
+
+        # count the years run, the spin-up cycles the forcing
+        nruns = [0]
+        run_sim = G.run_sim
+        def counted_run_sim():
+            nruns[0] += 1
+            return run_sim()
+        G.run_sim = counted_run_sim
+
+        start = default_timer()
+        func(G)
+        result["seconds"] = default_timer() - start
+        result["years"] = nruns[0] * len(G.years)
+    except Exception:
+        result["error"] = traceback.format_exc()
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    if "setup_rss_mb" in result:
+        result["run_rss_mb"] = (result["peak_rss_mb"] - start_rss -
+                                result["setup_rss_mb"])
+    queue.put(result)
+
+def benchmark(names, repeats=3, progress=sys.stderr):
+    """ Run each scenario repeats times, keeping the fastest
+
+    Parameters:
+    ----------
+    names : list of strings
+        scenarios to run
+    repeats : int
+        number of times each scenario is run
+    progress : file, optional
+        progress messages are written here, None to be quiet
+
+    Returns:
+    --------
+    results : dictionary
+        scenario name -> description, years, seconds, setup_seconds,
+        years_per_second, peak_rss_mb, setup_rss_mb, run_rss_mb and error
+        (traceback or None)
+    """
+    out_dir = tempfile.mkdtemp(prefix="gday_bench_")
+    results = {}
+    try:
+        for name in names:
+            best = None
+            peak = 0.0
+            for i in xrange(repeats):
+                queue = multiprocessing.Queue()
+                p = multiprocessing.Process(target=run_scenario,
+                                            args=(name, out_dir, queue))
+                p.start()
+                result = queue.get()
+                p.join()
+                peak = max(peak, result["peak_rss_mb"])
+                if result["error"] is not None:
+                    best = result
+                    break
+                if best is None or result["seconds"] < best["seconds"]:
+                    best = result
+
+            best["peak_rss_mb"] = peak
+            best["description"] = dict(SCENARIOS)[name][0]
+            if best["error"] is None:
+                best["years_per_second"] = best["years"] / best["seconds"]
+                msg = ("%-14s %6.1f years/s %8.1f MB (setup +%.1f, "
+                       "run +%.1f)\n" %
+                       (name, best["years_per_second"], best["peak_rss_mb"],
+                        best["setup_rss_mb"], best["run_rss_mb"]))
+            else:
+                best["years_per_second"] = None
+                msg = ("%-14s failed: %s\n" %
+                       (name, best["error"].strip().splitlines()[-1]))
+            if progress is not None:
+                progress.write(msg)
+            results[name] = best
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    return results
+
+def compare(results, baseline, threshold=0.1, out=sys.stdout):
+    """ Compare the throughput with an earlier set of results
+
+    Parameters:
+    ----------
+    results : dictionary
+        scenario results, see benchmark
+    baseline : dictionary
+        scenario results to compare against
+    threshold : float
+        fractional loss of throughput counted as a regression
+    out : file
+        the comparison table is written here
+
+    Returns:
+    --------
+    regressions : list of strings
+        scenarios which have got slower, or no longer run
+    """
+    regressions = []
+    out.write("%-14s %10s %10s %7s\n" % ("scenario", "baseline", "now",
+                                          "ratio"))
+    for name in sorted(set(results) & set(baseline)):
+        new = results[name]["years_per_second"]
+        old = baseline[name]["years_per_second"]
+        if new is None or old is None:
+            if new is None and old is not None:
+                regressions.append(name)
+            out.write("%-14s %10s %10s\n" %
+                      (name, "failed" if old is None else "%.1f" % old,
+                       "failed" if new is None else "%.1f" % new))
+            continue
+        ratio = new / old
+        flag = ""
+        if ratio < 1.0 - threshold:
+            regressions.append(name)
+            flag = "  slower"
+        out.write("%-14s %10.1f %10.1f %7.2f%s\n" % (name, old, new, ratio,
+                                                     flag))
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark G'DAY")
+    parser.add_argument("scenarios", nargs="*", default=SCENARIO_NAMES,
+                        help="scenarios to run, from: %s" %
+                             ", ".join(SCENARIO_NAMES))
+    parser.add_argument("-o", "--output", default="benchmarks.json",
+                        help="JSON file the results are saved to")
+    parser.add_argument("-r", "--repeats", type=int, default=3,
+                        help="runs of each scenario, the fastest is kept")
+    parser.add_argument("-c", "--compare",
+                        help="JSON file of earlier results to compare with")
+    parser.add_argument("-t", "--threshold", type=float, default=0.1,
+                        help="loss of throughput counted as a regression")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIO_NAMES:
+            parser.error("unknown scenario: %s" % name)
+
+    results = benchmark(args.scenarios, args.repeats)
+    report = {"git_hash": git_revision,
+              "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "repeats": args.repeats,
+              "scenarios": results}
+    f = open(args.output, "w")
+    try:
+        json.dump(report, f, indent=2, sort_keys=True)
+    finally:
+        f.close()
+
+    if args.compare:
+        f = open(args.compare, "r")
+        try:
+            baseline = json.load(f)
+        finally:
+            f.close()
+        sys.stdout.write("\ncompared with %s (%s)\n" %
+                         (args.compare, baseline.get("git_hash")))
+        if compare(results, baseline["scenarios"], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -14,6 +14,7 @@ import matplotlib.pyplot as plt
 import datetime as dt
 import pandas as pd
 from cStringIO import StringIO
+from gday.output_io import read_output
 
 __author__  = "Martin De Kauwe"
 __version__ = "1.0 (12.05.2014)"
@@ -35,22 +36,10 @@ def translate_output(infname, met_fname, binary=False):
     
     # load the rest of the g'day output
     if binary:
-        infname_hdr = infname.split('.')[0] + '.bin.hdr'
-        fp = open("outputs/D1GDAYDUKEAMB.bin.hdr", 'r')
-        lines = fp.readlines()
-        
-        # Get HDR info
-        git_ver = lines[0]
-        vars = lines[1].replace("\n","")
-        nrows = int(lines[2].split("=")[1])
-        ncols = int(lines[3].split("=")[1])
-        
-        # Read the file and setup to match csv style. Perhaps a tad dumb
-        # but makes it consistent with ascii translation code
-        buff = np.fromfile(infname, dtype=np.float32).reshape(nrows, ncols)
-        gday = {}
-        for i, v in enumerate(vars.split(",")):
-            gday[v] = buff[:,i]
+        # the binary output carries its own variable names & git revision
+        out = read_output(infname)
+        git_ver = "#Git_revision_code:%s\n" % (out.git_hash)
+        gday = dict(out)
     else:
         (gday, git_ver) = load_gday_output(infname)
 
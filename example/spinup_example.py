@@ -199,7 +199,9 @@ def main(experiment_id, site, SPIN_UP=None):
                         }
         ad.adjust_param_file(cfg_fname, replace_dict)
         G = model.Gday(cfg_fname, spin_up=True)
-        G.spin_up_pools()
+
+        # re-running with the same spin-up inputs picks up the stored state
+        G.spin_up_pools(cache_dir=os.path.join(base_dir, "spinup_cache"))
         
     
     
@@ -0,0 +1,122 @@
+""" Binary checkpoint/restart files for the model.
+
+Unlike the .cfg file written by PrintOutput.save_state, a checkpoint holds the
+complete model, i.e. the state, the fluxes, control flags and parameters as
+well as the internal state of the model components (e.g. the moving average
+of the growth stress in PlantGrowth.sma and the Phenology accumulators), so a
+run restarted from it carries on exactly as if it had never stopped.
+
+Layout: magic line, one line holding a python dict describing the checkpoint,
+then two pickles written by the same pickler (so shared objects stay shared):
+the model records and then the model itself. The met forcing and the output
+file aren't stored, they are re-attached when the checkpoint is read.
+"""
+
+import ast
+import cPickle as pickle
+from _version import __version__ as git_revision
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+CHECKPOINT_MAGIC = "GDAY_CHECKPOINT 1\n"
+CHECKPOINT_EXT = ".chk"
+
+# persistent ids of the objects which are re-attached on read
+MET_DATA_ID = "met_data"
+MET_DERIVED_ID = "met_derived"
+OUTPUT_ID = "output"
+
+def write_checkpoint(fname, model, header):
+    """ Write a binary checkpoint of the model
+
+    Parameters:
+    -----------
+    fname : string
+        checkpoint filename
+    model : Gday
+        model to checkpoint
+    header : dictionary
+        description of the checkpoint, e.g. the year to restart from, must
+        only hold python literals
+    """
+    external = {id(model.met_data): MET_DATA_ID,
+                id(model.met_data.derived): MET_DERIVED_ID,
+                id(model.pr): OUTPUT_ID}
+
+    def persistent_id(obj):
+        return external.get(id(obj))
+
+    header = dict(header)
+    header["git_hash"] = git_revision
+
+    try:
+        f = open(fname, 'wb')
+    except IOError:
+        raise IOError("Can't open %s file for write" % fname)
+    try:
+        f.write(CHECKPOINT_MAGIC)
+        f.write(repr(header) + "\n")
+        p = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+        p.persistent_id = persistent_id
+        p.dump((model.control, model.params, model.state, model.fluxes,
+                model.files, model.print_opts))
+        p.dump(model)
+    finally:
+        f.close()
+
+class CheckpointReader(object):
+    """ Read a checkpoint in two steps, the records first, so they can be
+    adjusted and the met forcing/output set up from them, then the model. """
+    def __init__(self, fname):
+        """
+        Parameters:
+        ----------
+        fname : string
+            checkpoint filename
+        """
+        try:
+            self.fp = open(fname, 'rb')
+        except IOError:
+            raise IOError('Could not read checkpoint file: "%s"' % fname)
+
+        if self.fp.readline() != CHECKPOINT_MAGIC:
+            self.fp.close()
+            err_msg = '"%s" is not a G\'DAY checkpoint file' % fname
+            raise RuntimeError, err_msg
+        self.header = ast.literal_eval(self.fp.readline().strip())
+        self.external = {}
+        self.up = pickle.Unpickler(self.fp)
+        self.up.persistent_load = self.persistent_load
+
+    def persistent_load(self, pid):
+        if pid not in self.external:
+            err_msg = "Checkpoint refers to %s, which hasn't been set" % pid
+            raise RuntimeError, err_msg
+        return self.external[pid]
+
+    def read_records(self):
+        """ control, params, state, fluxes, files and print options """
+        return self.up.load()
+
+    def read_model(self, met_data, output):
+        """ The model, with the met forcing and output re-attached
+
+        Parameters:
+        ----------
+        met_data : MetForcing
+            meteorological forcing data, including the derived quantities
+        output : PrintOutput
+            daily output writer
+        """
+        self.external[MET_DATA_ID] = met_data
+        self.external[MET_DERIVED_ID] = met_data.derived
+        self.external[OUTPUT_ID] = output
+        try:
+            model = self.up.load()
+        finally:
+            self.fp.close()
+
+        return model
@@ -0,0 +1,68 @@
+""" Registry of the optional model components.
+
+Submodels which are only used under some settings of the control flags (e.g.
+BEWDY or MATE photosynthesis, Ross's optimal root model) are looked up here by
+name, and their module is only imported the first time a model asks for one,
+so a MATE run never imports (or builds) BEWDY, e.g.
+
+    Mate = component_class("mate_c3")
+
+Other implementations can be added with register_component.
+"""
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+# component name -> (module, class)
+COMPONENTS = {"bewdy": ("bewdy", "Bewdy"),
+              "mate_c3": ("mate", "MateC3"),
+              "mate_c4": ("mate", "MateC4"),
+              "rooting_depth": ("optimal_root_model", "RootingDepthModel")}
+
+# classes which have already been imported, by component name
+RESOLVED = {}
+
+
+def register_component(name, module, cls):
+    """ Add (or replace) a component
+
+    Parameters:
+    ----------
+    name : string
+        component name
+    module : string
+        module defining the component, imported when it is first used
+    cls : string
+        class name within the module
+    """
+    COMPONENTS[name] = (module, cls)
+    RESOLVED.pop(name, None)
+
+def component_class(name):
+    """ Class of a component, importing its module if need be
+
+    Parameters:
+    ----------
+    name : string
+        component name, one of COMPONENTS
+
+    Returns:
+    --------
+    cls : class
+        the component's class
+    """
+    try:
+        return RESOLVED[name]
+    except KeyError:
+        pass
+    try:
+        (module_name, class_name) = COMPONENTS[name]
+    except KeyError:
+        err_msg = "Unknown model component: %s" % name
+        raise RuntimeError, err_msg
+    module = __import__(module_name, globals(), locals(), [class_name])
+    cls = RESOLVED[name] = getattr(module, class_name)
+
+    return cls
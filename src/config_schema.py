@@ -0,0 +1,302 @@
+""" Schema of the .cfg file options, derived from the default_* modules.
+
+Every option the model accepts is in a default_* module, so the type of each
+option is taken from its default value and its description (and units, where
+given as "[units: ...]") from the comment next to it. The string control flags
+and the integer switches with a fixed set of settings also have their allowed
+values, e.g.
+
+    SCHEMA["control"]["soil_model"].choices # -> ('FLUX', 'MATRIX')
+    SCHEMA["params"]["slowncmin"].units # -> 'gN/gC'
+
+parse_section converts the strings of a section of the .cfg file to the model
+types and returns every error it finds, rather than stopping (or quietly
+storing None) at the first bad option, see file_parser.ReadConfigFile.
+check_override does the same for a value given in python, e.g. an override.
+"""
+
+import os
+import numbers
+import inspect
+import tokenize
+import default_control
+import default_params
+import default_state
+import default_files
+from records import default_values
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+# allowed values of the control flags, as the model tests for them
+CHOICES = {"alloc_model": ("FIXED", "ALLOMETRIC", "GRASSES"),
+           "assim_model": ("MATE", "BEWDY"),
+           "disturbance": (0, 1),
+           "grazing": (0, 1, 2),
+           "gs_model": ("MEDLYN",),
+           "modeljm": (0, 1, 2),
+           "nuptake_model": (0, 1, 2, 3, 4),
+           "print_options": ("DAILY", "END"),
+           "ps_pathway": ("C3", "C4"),
+           "respiration_model": ("FIXED", "TEMPERATURE", "BIOMASS"),
+           "soil_model": ("FLUX", "MATRIX"),
+           "trans_model": (0, 1, 2)}
+
+TRUE_WORDS = ('true', 't', '1')
+FALSE_WORDS = ('false', 'f', '0')
+
+
+class Option(object):
+    """ One option of a section of the .cfg file.
+
+    kind is one of "bool", "int", "str" (upper case, control flags), "float",
+    "float_or_name" (a float, or a name such as a soil type, for the params
+    and state without a numeric default), "text" (files, taken as it is) and
+    "list" (can't be set from a .cfg file).
+    """
+    __slots__ = ("section", "name", "kind", "default", "choices", "units",
+                 "doc")
+
+    def __init__(self, section, name, kind, default, choices=None, units="",
+                 doc=""):
+        self.section = section
+        self.name = name
+        self.kind = kind
+        self.default = default
+        self.choices = choices
+        self.units = units
+        self.doc = doc
+
+    def parse(self, text):
+        """ Value of the option from its string in the .cfg file
+
+        Parameters:
+        ----------
+        text : string
+            value as written in the .cfg file
+
+        Returns:
+        --------
+        value : bool, int, float, string or None
+            value in the model's type, raises ValueError if text isn't one
+        """
+        value = text.strip()
+        kind = self.kind
+        if kind == "text":
+            return text
+        elif kind == "list":
+            raise ValueError("can't be set from a .cfg file")
+        elif kind == "bool":
+            if value.lower() in TRUE_WORDS:
+                return True
+            elif value.lower() in FALSE_WORDS:
+                return False
+            raise ValueError("%r isn't true or false" % text)
+        elif kind == "int":
+            # switches are also written as true/false in older .cfg files
+            if value.lower() in TRUE_WORDS + FALSE_WORDS:
+                value = int(value.lower() in TRUE_WORDS)
+            else:
+                try:
+                    value = int(value)
+                except ValueError:
+                    raise ValueError("%r isn't an integer" % text)
+        elif kind == "str":
+            value = value.upper()
+        elif value == "None":
+            return None
+        else:
+            try:
+                value = float(value)
+            except ValueError:
+                if (kind == "float" or not value or
+                    not value.replace('_', '').isalpha()):
+                    raise ValueError("%r isn't a number" % text)
+
+        self.check_choice(value, text)
+
+        return value
+
+    def check(self, value):
+        """ Value of the option given in python rather than as a string in
+        the .cfg file, e.g. an override
+
+        Parameters:
+        ----------
+        value : object
+            value, which should be of the option's type
+
+        Returns:
+        --------
+        value : bool, int, float, string, list or None
+            value in the model's type, raises ValueError if it isn't one
+        """
+        kind = self.kind
+        if kind == "bool":
+            if isinstance(value, float) or value not in (0, 1):
+                raise ValueError("%r isn't true or false" % (value,))
+            value = bool(value)
+        elif kind == "int":
+            if not isinstance(value, numbers.Integral):
+                raise ValueError("%r isn't an integer" % (value,))
+            value = int(value)
+        elif kind == "list":
+            if not isinstance(value, (list, tuple)):
+                raise ValueError("%r isn't a list" % (value,))
+        elif kind in ("str", "text"):
+            raise ValueError("%r isn't a string" % (value,))
+        elif value is not None and (not isinstance(value, numbers.Real) or
+                                    isinstance(value, bool)):
+            raise ValueError("%r isn't a number" % (value,))
+        self.check_choice(value, value)
+
+        return value
+
+    def check_choice(self, value, given):
+        """ Raise ValueError if value isn't one of the allowed values """
+        if self.choices is not None and value not in self.choices:
+            raise ValueError("%r isn't one of %s" %
+                             (given, ", ".join(str(c) for c in self.choices)))
+
+
+def option_kind(section, default):
+    """ Kind of option, from its default value, see Option """
+    if section == "files":
+        return "text"
+    elif isinstance(default, bool):
+        return "bool"
+    elif isinstance(default, list):
+        return "list"
+    elif section == "control":
+        return "str" if isinstance(default, basestring) else "int"
+    elif isinstance(default, (int, float)):
+        return "float"
+    return "float_or_name"
+
+def module_comments(module):
+    """ Comment at the end of each assignment of a default_* module
+
+    Parameters:
+    ----------
+    module : module
+        one of the default_* modules
+
+    Returns:
+    --------
+    comments : dictionary
+        variable name -> comment, empty if the source isn't available
+    """
+    comments = {}
+    fname = inspect.getsourcefile(module)
+    if fname is None or not os.path.exists(fname):
+        return comments
+    f = open(fname, "r")
+    try:
+        name = None
+        for (tok_type, tok, start, end,
+             line) in tokenize.generate_tokens(f.readline):
+            if tok_type == tokenize.NAME and start[1] == 0:
+                name = tok
+            elif tok_type == tokenize.COMMENT and name is not None:
+                comments[name] = tok.lstrip("#").strip()
+            elif tok_type == tokenize.NEWLINE:
+                name = None
+    finally:
+        f.close()
+
+    return comments
+
+def section_schema(section, module):
+    """ Options of a section of the .cfg file
+
+    Parameters:
+    ----------
+    section : string
+        section name, e.g. "params"
+    module : module
+        default_* module of the section
+
+    Returns:
+    --------
+    options : dictionary
+        name -> Option
+    """
+    comments = module_comments(module)
+    options = {}
+    for (name, default) in default_values(module):
+        doc = comments.get(name, "")
+        units = ""
+        if "[units:" in doc:
+            units = doc.split("[units:", 1)[1].split("]", 1)[0].strip()
+        choices = CHOICES.get(name) if section == "control" else None
+        options[name] = Option(section, name, option_kind(section, default),
+                               default, choices, units, doc)
+
+    return options
+
+def parse_section(section, items):
+    """ Convert the options of a section of the .cfg file
+
+    Parameters:
+    ----------
+    section : string
+        section name, one of SCHEMA, "print" is taken as it is
+    items : list of tuples
+        (option, string value) as read from the .cfg file
+
+    Returns:
+    --------
+    values : dictionary
+        option -> value, for the options without errors
+    errors : list of strings
+        one message for each bad option
+    """
+    values = {}
+    errors = []
+    options = SCHEMA.get(section)
+    for (name, text) in items:
+        if options is None:
+            values[name] = text
+        elif name not in options:
+            errors.append("[%s] %s isn't a model %s" % (section, name,
+                                                        section))
+        else:
+            try:
+                values[name] = options[name].parse(text)
+            except ValueError, e:
+                errors.append("[%s] %s: %s" % (section, name, e))
+
+    return (values, errors)
+
+def check_override(section, name, value):
+    """ Convert a value given in python for an option, e.g. an override.
+    Strings are parsed as they would be in the .cfg file, anything else has
+    to be of the option's type.
+
+    Parameters:
+    ----------
+    section : string
+        section name, one of SCHEMA
+    name : string
+        option name
+    value : object
+        value given for the option
+
+    Returns:
+    --------
+    value : bool, int, float, string, list or None
+        value in the model's type, raises ValueError if it isn't one
+    """
+    option = SCHEMA[section][name]
+    if isinstance(value, basestring):
+        return option.parse(value)
+
+    return option.check(value)
+
+
+SCHEMA = {"control": section_schema("control", default_control),
+          "params": section_schema("params", default_params),
+          "state": section_schema("state", default_state),
+          "files": section_schema("files", default_files)}
@@ -13,6 +13,7 @@ adjust_rtslow = False
 alloc_model = "FIXED"          # C allocation -> fixed, allometric, or grasses
 assim_model = "MATE"           # bewdy or mate?
 calc_sw_params = False         # false=user supplies field capacity and wilting point, true=calculate them based on cosby et al.
+checkpoint_freq = 0            # write a restart checkpoint every n years of the run, 0=off
 deciduous_model = False        # evergreen_model=False, deciduous_model=True
 disturbance = 0                # 0=No disturbance, 1=Fire
 exudation = False              # 
@@ -32,6 +33,7 @@ print_options = "DAILY"        # "daily"=every timestep, "end"=end of run
 ps_pathway = "C3"              # Photosynthetic pathway, c3/c4
 respiration_model = "FIXED"    # Plant respiration ... Fixed = 0.5, TEMPERATURE or BIOMASS
 strfloat = 0                   # Structural pool input N:C varies=1, fixed=0
+soil_model = "FLUX"            # soil C & N flows, FLUX=pool by pool fluxes, MATRIX=transfer matrix form
 sw_stress_model = 1            # JULES type linear stress func, or Landsberg and Waring non-linear func
 trans_model = 1                # 0=trans from WUE, 1=Penman-Monteith, 2=Priestley-Taylor
 use_eff_nc = 0                 # use constant leaf n:c for  metfrac s
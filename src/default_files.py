@@ -11,3 +11,5 @@ cfg_fname = "/Users/mdekauwe/src/python/GDAY_model/params/duke.cfg"
 met_fname = "/Users/mdekauwe/src/python/GDAY_model/forcing/duke_metdata.gin"
 out_fname = "/Users/mdekauwe/src/python/GDAY_model/duke_output.asc"
 out_param_fname = "/Users/mdekauwe/src/python/GDAY_model/out_gday.cfg"
+checkpoint_fname = ""
+spinup_cache_dir = ""
@@ -0,0 +1,467 @@
+#!/usr/bin/env python
+""" Run an ensemble of G'DAY parameter sets in lock-step.
+
+Rather than running the model once per parameter set, every member is held in
+arrays (one value per member) and each day is evaluated for all members at
+once. All members share the .cfg file, the met forcing and the control flags,
+members differ through the overrides applied on top of the .cfg file, e.g.
+
+    E = GdayEnsemble(fname, [{"sla": 4.0}, {"sla": 5.0}, {"sla": 6.0}])
+    output = E.run_sim()
+    output["lai"] # -> array of shape (ndays, 3)
+"""
+
+import sys
+import numpy as np
+import constants as const
+from file_parser import initialise_model_data, read_config, ModelConfig
+from met_precompute import precompute_met_derived
+from gday import correct_rate_constants, N_RESET_STATE, N_RESET_FLUXES
+from water_balance import SoilMoisture
+from mate import MateC3, MateC4
+from ensemble_plant_growth import EnsemblePlantGrowth
+from ensemble_water_balance import EnsembleWaterBalance
+from ensemble_soil_cn_model import (EnsembleCarbonSoilFlows,
+                                    EnsembleNitrogenSoilFlows,
+                                    EnsembleMatrixCarbonSoilFlows,
+                                    EnsembleMatrixNitrogenSoilFlows)
+from ensemble_utilities import (EnsembleRecord, module_values, vfloat_eq,
+                                vfloat_lt, vfloat_gt)
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+class GdayEnsemble(object):
+    """ N G'DAY parameter sets evaluated together as numpy arrays.
+
+    Each member gives exactly what a Gday run of the same .cfg file with the
+    same overrides would. The daily output is kept in memory and returned by
+    run_sim instead of being written to file.
+
+    Photosynthesis, the water balance and the remaining plant, litter and soil
+    calculations are done for all members at once.
+    """
+    def __init__(self, fname, overrides, met_header=4, forcing=None):
+        """ Set up the ensemble
+
+        Parameters:
+        ----------
+        fname : string or ModelConfig
+            filename of model parameters, including path, or the parsed
+            .cfg file, see file_parser.read_config
+        overrides : list of dictionaries
+            one dictionary of params/state values for each member, see
+            file_parser.apply_overrides
+        met_header : int
+            row number of met file header with variable name
+        forcing : list of MetForcing, optional
+            met forcing of each member, by default each member's met file is
+            read, once for all the members which share it
+        """
+        if len(overrides) == 0:
+            raise RuntimeError, "Ensemble needs at least one member"
+        if forcing is None:
+            forcing = {}
+        elif len(forcing) != len(overrides):
+            err_msg = "Ensemble needs the met forcing of every member"
+            raise RuntimeError, err_msg
+
+        # the .cfg file is read once, each member is the same config with its
+        # own overrides
+        if not isinstance(fname, ModelConfig):
+            fname = read_config(fname)
+
+        params_vals = []
+        state_vals = []
+        fluxes_vals = []
+        met = []
+        window_size = []
+        for i, member_overrides in enumerate(overrides):
+            if isinstance(forcing, dict):
+                member_forcing = forcing
+            else:
+                member_forcing = forcing[i]
+            (control, params, state,
+             files, fluxes, met_data,
+             print_opts) = initialise_model_data(fname, met_header,
+                                                 DUMP=False,
+                                                 overrides=member_overrides,
+                                                 forcing=member_forcing)
+
+            # control flags have to be the same for every member
+            control_vals = module_values(control)
+            if len(met) == 0:
+                self.control = EnsembleRecord([control_vals], shared=True)
+                self.control_vals = control_vals
+                self.print_opts = print_opts
+                self.check_control()
+            elif control_vals != self.control_vals:
+                err_msg = "Ensemble members must share the control flags"
+                raise RuntimeError, err_msg
+            elif (met_data.years != met[0].years or
+                  met_data.days_in_year != met[0].days_in_year):
+                err_msg = "Ensemble members must share the years of forcing"
+                raise RuntimeError, err_msg
+
+            correct_rate_constants(params, output=False)
+            met_data.derived = precompute_met_derived(met_data, params)
+            SoilMoisture(control, params, state, fluxes).initialise_parameters()
+
+            # no information about the N&water limitation, assume there is no
+            # limitation to begin with (see PlantGrowth)
+            if state.prev_sma is None:
+                state.prev_sma = 1.0
+            if state.grw_seas_stress is None:
+                state.grw_seas_stress = 1.0
+
+            # Window size = root lifespan in days...
+            window_size.append(int(1.0 / (params.rdecay * const.NDAYS_IN_YR) *
+                                   const.NDAYS_IN_YR))
+            params_vals.append(module_values(params))
+            state_vals.append(module_values(state))
+            fluxes_vals.append(module_values(fluxes))
+            met.append(met_data)
+
+        self.nmembers = len(met)
+        self.params = EnsembleRecord(params_vals, shared=True)
+        self.state = EnsembleRecord(state_vals)
+        self.fluxes = EnsembleRecord(fluxes_vals)
+        self.met_data = met[0]
+
+        # scalar photosynthesis for each member, used for frost runs
+        if self.control.ps_pathway == "C3":
+            Mate = MateC3
+        else:
+            Mate = MateC4
+        members = []
+        for i in xrange(self.nmembers):
+            params = self.params.member(i)
+            state = self.state.member(i)
+            fluxes = self.fluxes.member(i)
+            members.append(Mate(self.control, params, state, fluxes, met[i]))
+
+        # daylength depends on latitude, so it may differ between members
+        self.daylen = np.column_stack([m.derived["daylen"] for m in met])
+
+        if self.control.soil_model == "MATRIX":
+            (csoil, nsoil) = (EnsembleMatrixCarbonSoilFlows,
+                              EnsembleMatrixNitrogenSoilFlows)
+        else:
+            (csoil, nsoil) = (EnsembleCarbonSoilFlows,
+                              EnsembleNitrogenSoilFlows)
+        self.cs = csoil(self.control, self.params, self.state, self.fluxes,
+                        met)
+        self.ns = nsoil(self.control, self.params, self.state, self.fluxes,
+                        met)
+        self.wb = EnsembleWaterBalance(self.control, self.params, self.state,
+                                       self.fluxes, met)
+        self.pg = EnsemblePlantGrowth(self.control, self.params, self.state,
+                                      self.fluxes, self.met_data, members,
+                                      self.wb, window_size)
+
+        # variables to output, state if it is a state variable, else a flux
+        self.print_state = []
+        self.print_fluxes = []
+        for var in self.print_opts:
+            if hasattr(self.state, var):
+                self.print_state.append(var)
+            else:
+                self.print_fluxes.append(var)
+
+        self.dead = np.zeros(self.nmembers, dtype=bool)
+
+        # calculate initial stuff, e.g. C:N ratios and zero annual flux sum
+        self.day_end_calculations(INIT=True)
+        self.state.pawater_root = self.params.wcapac_root + \
+                                    np.zeros(self.nmembers)
+        self.state.pawater_topsoil = self.params.wcapac_topsoil + \
+                                        np.zeros(self.nmembers)
+        self.state.lai = np.maximum(0.01, (self.params.sla * const.M2_AS_HA /
+                                           const.KG_AS_TONNES /
+                                           self.params.cfracts *
+                                           self.state.shoot))
+
+        self.years = self.met_data.years
+        self.days_in_year = self.met_data.days_in_year
+
+        if self.control.water_stress == False:
+            sys.stderr.write("**** You have turned off the drought stress")
+            sys.stderr.write(", I assume you're debugging??!\n")
+
+    def check_control(self):
+        """ The ensemble supports the evergreen/grass model without
+        disturbance, flag anything else """
+        control = self.control
+        unsupported = [("deciduous_model", control.deciduous_model),
+                       ("grazing", control.grazing in (1, 2)),
+                       ("disturbance", control.disturbance != 0),
+                       ("hurricane", control.hurricane == 1),
+                       ("exudation", control.exudation),
+                       ("model_optroot", control.model_optroot),
+                       ("assim_model", control.assim_model != "MATE"),
+                       ("nuptake_model", control.nuptake_model == 4),
+                       ("respiration_model",
+                        control.respiration_model != "FIXED"),
+                       ("soil_model",
+                        control.soil_model not in ("FLUX", "MATRIX"))]
+        for (flag, bad) in unsupported:
+            if bad:
+                err_msg = ("Ensemble runs don't support this %s setting" %
+                           flag)
+                raise RuntimeError, err_msg
+
+    def run_sim(self):
+        """ Run model simulation!
+
+        Returns:
+        --------
+        output : dictionary
+            "year", "doy" and for each output variable an array of shape
+            (ndays, nmembers)
+        """
+        years = self.years
+        days_in_year = self.days_in_year
+        ndays = int(np.sum(days_in_year))
+
+        out_vars = self.print_state + self.print_fluxes
+        buf = np.empty((len(out_vars), ndays, self.nmembers))
+        year_out = np.empty(ndays, dtype=np.int64)
+        doy_out = np.empty(ndays, dtype=np.int64)
+
+        # cases which don't exist in a scalar run are masked out
+        with np.errstate(divide='ignore', invalid='ignore'):
+            project_day = 0
+            for i, yr in enumerate(years):
+                for doy in xrange(days_in_year[i]):
+
+                    # litterfall rate: C and N fluxes
+                    (fdecay, rdecay) = self.calculate_litter()
+
+                    # photosynthesis & growth
+                    fsoilT = self.cs.soil_temp_factor(project_day)
+                    self.pg.calc_day_growth(project_day, fdecay, rdecay,
+                                            self.daylen[project_day], doy,
+                                            float(days_in_year[i]), i, fsoilT)
+
+                    # soil C & N calculation
+                    self.cs.calculate_csoil_flows(project_day, doy)
+                    self.ns.calculate_nsoil_flows(project_day, doy)
+
+                    if self.control.ncycle == False:
+                        # Turn off all N calculations
+                        self.reset_all_n_pools_and_fluxes()
+
+                    # calculate C:N ratios and increment annual flux sum
+                    self.day_end_calculations(days_in_year[i])
+
+                    # checking if we died during the timestep
+                    self.are_we_dead()
+
+                    year_out[project_day] = yr
+                    doy_out[project_day] = doy + 1
+                    for j, var in enumerate(self.print_state):
+                        buf[j, project_day] = getattr(self.state, var)
+                    offset = len(self.print_state)
+                    for j, var in enumerate(self.print_fluxes):
+                        buf[offset+j, project_day] = getattr(self.fluxes, var)
+
+                    project_day += 1
+
+                # GDAY died in the previous year, re-establish gday for the
+                # next yr
+                if self.dead.any():
+                    self.re_establish_gday()
+
+        output = dict(zip(out_vars, buf))
+        output["year"] = year_out
+        output["doy"] = doy_out
+
+        return output
+
+    def calculate_litter(self):
+        """ C and N litter production, see Litter.calculate_litter
+
+        Returns:
+        --------
+        fdecay : array
+            foliage decay rate [tonnes C/ha/day]
+        rdecay : array
+            fine root decay rate [tonnes C/ha/day]
+        """
+        params = self.params
+        state = self.state
+        fluxes = self.fluxes
+
+        fdecay = self.decay_in_dry_soils(params.fdecay, params.fdecaydry)
+        rdecay = self.decay_in_dry_soils(params.rdecay, params.rdecaydry)
+
+        # litter N:C ratios, roots and shoot
+        ncflit = state.shootnc * (1.0 - params.fretrans)
+        ncrlit = state.rootnc * (1.0 - params.rretrans)
+
+        # C litter production
+        fluxes.deadroots = rdecay * state.root
+        fluxes.deadcroots = params.crdecay * state.croot
+        fluxes.deadstems = params.wdecay * state.stem
+        fluxes.deadbranch = params.bdecay * state.branch
+        fluxes.deadsapwood = ((params.wdecay + params.sapturnover) *
+                              state.sapwood)
+        fluxes.deadleaves = fdecay * state.shoot
+
+        # N litter production
+        fluxes.deadleafn = fluxes.deadleaves * ncflit
+        fluxes.deadrootn = fluxes.deadroots * ncrlit
+        fluxes.deadcrootn = (params.crdecay * state.crootn *
+                             (1.0 - params.cretrans))
+        fluxes.deadbranchn = (params.bdecay * state.branchn *
+                              (1.0 - params.bretrans))
+        fluxes.deadstemn = (params.wdecay *
+                            (state.stemnimm + state.stemnmob *
+                            (1.0 - params.wretrans)))
+
+        # no grazing
+        fluxes.ceaten = np.zeros(self.nmembers)
+        fluxes.neaten = np.zeros(self.nmembers)
+
+        return (fdecay, rdecay)
+
+    def decay_in_dry_soils(self, decay_rate, decay_rate_dry):
+        """Decay rates (e.g. leaf litterfall) can increase in dry soil, see
+        Litter.decay_in_dry_soils
+
+        Parameters:
+        -----------
+        decay_rate : float, array
+            default model parameter decay rate [tonnes C/ha/day]
+        decay_rate_dry : float, array
+            default model parameter dry deacy rate [tonnes C/ha/day]
+
+        Returns:
+        --------
+        decay_rate : array
+            adjusted deacy rate if the soil is dry [tonnes C/ha/day]
+        """
+        # turn into fraction...
+        smc_root = self.state.pawater_root / self.params.wcapac_root
+
+        new_decay_rate = (decay_rate_dry - (decay_rate_dry - decay_rate) *
+                         (smc_root - self.params.watdecaydry) /
+                         (self.params.watdecaywet - self.params.watdecaydry))
+
+        new_decay_rate = np.where(vfloat_lt(new_decay_rate, decay_rate),
+                                  decay_rate, new_decay_rate)
+        new_decay_rate = np.where(vfloat_gt(new_decay_rate, decay_rate_dry),
+                                  decay_rate_dry, new_decay_rate)
+
+        return new_decay_rate
+
+    def day_end_calculations(self, days_in_year=None, INIT=False):
+        """Calculate derived values from state variables, see
+        Gday.day_end_calculations
+
+        Parameters:
+        -----------
+        days_in_year : integer
+            number of days in the current year
+        INIT : logical
+            logical defining whether it is the first day of the simulation
+        """
+        state = self.state
+
+        # update N:C of plant pool
+        state.shootnc = np.where(vfloat_eq(state.shoot, 0.0), 0.0,
+                                 state.shootn / state.shoot)
+
+        # Explicitly set the shoot N:C
+        if self.control.ncycle == False:
+            state.shootnc = (np.zeros(self.nmembers) +
+                             self.params.prescribed_leaf_NC)
+
+        state.rootnc = np.where(vfloat_eq(state.root, 0.0), 0.0,
+                                np.maximum(0.0, state.rootn / state.root))
+
+        # total plant, soil & litter nitrogen
+        state.soiln = (state.inorgn + state.activesoiln +
+                       state.slowsoiln + state.passivesoiln)
+        state.litternag = state.structsurfn + state.metabsurfn
+        state.litternbg = state.structsoiln + state.metabsoiln
+        state.littern = state.litternag + state.litternbg
+        state.plantn = (state.shootn + state.rootn + state.crootn +
+                        state.branchn + state.stemn)
+        state.totaln = state.plantn + state.littern + state.soiln
+
+        # total plant, soil, litter and system carbon
+        state.soilc = state.activesoil + state.slowsoil + state.passivesoil
+        state.littercag = state.structsurf + state.metabsurf
+        state.littercbg = state.structsoil + state.metabsoil
+        state.litterc = state.littercag + state.littercbg
+        state.plantc = (state.root + state.croot + state.shoot +
+                        state.stem + state.branch)
+        state.totalc = state.soilc + state.litterc + state.plantc
+
+        # optional constant passive pool
+        if self.control.passiveconst == True:
+            state.passivesoil = (np.zeros(self.nmembers) +
+                                 self.params.passivesoilz)
+            state.passivesoiln = (np.zeros(self.nmembers) +
+                                  self.params.passivesoilnz)
+
+        if INIT == False:
+            #Required so max leaf & root N:C can depend on Age
+            state.age = state.age + 1.0 / days_in_year
+
+    def are_we_dead(self):
+        """ Simplistic scheme to allow members to die and re-establish the
+        following year, see Gday.are_we_dead """
+        state = self.state
+        dead = vfloat_eq(state.lai, 0.0)
+        if not dead.any():
+            return
+
+        # i.e. we have just died put stem C into struct litter
+        # works for grasses as this would be zero anyway
+        just_died = dead & ~self.dead
+        state.structsurf = np.where(just_died, state.stem, state.structsurf)
+        state.structsurfn = np.where(just_died, state.stemn,
+                                     state.structsurfn)
+
+        # Need to zero stuff for output state and fluxes.
+        for var in ["age", "branch", "branchn", "cstore", "nstore", "root",
+                    "rootn", "sapwood", "shoot", "shootn", "stem", "stemn",
+                    "stemnimm", "stemnmob"]:
+            setattr(state, var, np.where(dead, 0.0, getattr(state, var)))
+
+        self.dead |= dead
+
+    def re_establish_gday(self):
+        """ grow dead members from seed the following year, see
+        Gday.re_establish_gday """
+        state = self.state
+        dead = self.dead
+        state.lai = np.where(dead, 0.01, state.lai)
+
+        # C/N = 25 of default pools.
+        if self.control.alloc_model == "GRASSES":
+            seed = [("age", 0.0), ("branch", 0.0), ("branchn", 0.0),
+                    ("cstore", 0.001), ("nstore", 0.00004), ("root", 0.001),
+                    ("rootn", 0.00004), ("sapwood", 0.0), ("shoot", 0.001),
+                    ("shootn", 0.00004), ("stem", 0.0), ("stemn", 0.0),
+                    ("stemnimm", 0.0), ("stemnmob", 0.0), ("croot", 0.0),
+                    ("crootn", 0.0)]
+        else:
+            seed = [("branch", 0.001), ("branchn", 0.00004),
+                    ("croot", 0.001), ("crootn", 0.00004),
+                    ("sapwood", 0.001), ("stem", 0.001), ("stemn", 0.00004),
+                    ("stemnimm", 0.00004), ("stemnmob", 0.0)]
+        for (var, value) in seed:
+            setattr(state, var, np.where(dead, value, getattr(state, var)))
+
+    def reset_all_n_pools_and_fluxes(self):
+        """ N-Cycle is turned off, reset everything at the end of the day,
+        see Gday.reset_all_n_pools_and_fluxes """
+        for var in N_RESET_STATE:
+            setattr(self.state, var, np.zeros(self.nmembers))
+        for var in N_RESET_FLUXES:
+            setattr(self.fluxes, var, np.zeros(self.nmembers))
@@ -0,0 +1,783 @@
+""" Plant growth for an ensemble of parameter sets, see plant_growth.py.
+
+The daily allocation of C and N is done for all members at once, with the
+branches of the scalar model replaced by masks. Photosynthesis uses the batch
+version of MATE and the water balance EnsembleWaterBalance.
+"""
+
+import numpy as np
+import constants as const
+from ensemble_utilities import (vfloat_eq, vfloat_lt, vfloat_gt, vfloat_le,
+                                vfloat_ge, stack_members,
+                                EnsembleMovingAverage)
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+class EnsemblePlantGrowth(object):
+    """ G'DAY plant growth module, ensemble version.
+
+    Follows PlantGrowth operation by operation, so each member evolves exactly
+    as it would in a scalar run.
+    """
+    def __init__(self, control, params, state, fluxes, met_data, members, wb,
+                 window_size):
+        """
+        Parameters
+        ----------
+        control : integers, object
+            model control flags
+        params: EnsembleRecord
+            model parameters
+        state: EnsembleRecord
+            model state
+        fluxes : EnsembleRecord
+            model fluxes
+        met_data : MetForcing
+            meteorological forcing data
+        members : list
+            scalar photosynthesis object for each member
+        wb : EnsembleWaterBalance
+            water balance
+        window_size : int, array
+            root lifespan [days] of each member, sets the stress window
+        """
+        self.params = params
+        self.fluxes = fluxes
+        self.control = control
+        self.state = state
+        self.met_data = met_data
+        self.members = members
+        self.nmembers = len(members)
+        self.wb = wb
+
+        # photosynthesis for every member at once, from each member's met
+        # forcing stacked by member, see stack_members
+        self.mt = members[0].__class__(control, params, state, fluxes,
+                                       met_data)
+        met = [m.batch_met_arrays() for m in members]
+        self.ps_met = dict((var, stack_members([m[var] for m in met]))
+                           for var in met[0])
+        self.sma = EnsembleMovingAverage(window_size, self.state.prev_sma)
+        self.tair = stack_members([m.met_data['tair'] for m in members])
+
+    def calc_day_growth(self, project_day, fdecay, rdecay, daylen, doy,
+                        days_in_yr, yr_index, fsoilT):
+        """Evolve plant state, photosynthesis, distribute N and C"
+
+        Parameters:
+        -----------
+        project_day : integer
+            simulation day
+        fdecay : array
+            foliage decay rate
+        rdecay : array
+            fine root decay rate
+        daylen : array
+            daytime length (hrs) of each member
+        """
+        # calculate NPP
+        self.carbon_production(project_day, daylen)
+
+        # calculate water balance. We also need to store the previous days
+        # soil water store
+        previous_topsoil_store = self.state.pawater_topsoil.copy()
+        previous_rootzone_store = self.state.pawater_root.copy()
+        self.wb.calculate_water_balance(project_day, daylen)
+
+        # leaf N:C as a fraction of Ncmaxyoung, i.e. the max N:C ratio of
+        # foliage in young stand
+        nitfac = np.minimum(1.0, self.state.shootnc / self.params.ncmaxfyoung)
+
+        # figure out the C allocation fractions
+        self.calc_carbon_allocation_fracs(nitfac)
+
+        # Distribute new C and N through the system
+        self.carbon_allocation(nitfac)
+
+        (ncbnew, nccnew, ncwimm, ncwnew) = self.calculate_ncwood_ratios(nitfac)
+        recalc_wb = self.nitrogen_allocation(ncbnew, nccnew, ncwimm, ncwnew,
+                                             fdecay, rdecay, project_day,
+                                             fsoilT)
+
+        # Members where NPP was down-regulated because there wasn't enough N
+        # need their water balance recalculated given the lower GPP.
+        if recalc_wb.any():
+            self.state.pawater_topsoil[recalc_wb] = \
+                previous_topsoil_store[recalc_wb]
+            self.state.pawater_root[recalc_wb] = \
+                previous_rootzone_store[recalc_wb]
+            self.wb.calculate_water_balance(project_day, daylen,
+                                            np.flatnonzero(recalc_wb))
+
+        self.update_plant_state(fdecay, rdecay)
+        self.precision_control()
+
+    def calculate_ncwood_ratios(self, nitfac):
+        """ Estimate the N:C ratio in the branch and stem, see
+        PlantGrowth.calculate_ncwood_ratios
+
+        Parameters:
+        -----------
+        nitfac : array
+            leaf N:C as a fraction of the max N:C ratio of foliage in young
+            stand
+
+        Returns:
+        --------
+        ncbnew : array
+            N:C ratio of branch
+        nccnew : array
+            N:C ratio of coarse root
+        ncwimm : array
+            N:C ratio of immobile stem
+        ncwnew : array
+            N:C ratio of mobile stem
+        """
+        ncbnew = (self.params.ncbnew + nitfac *
+                 (self.params.ncbnew - self.params.ncbnewz))
+        nccnew = (self.params.nccnew + nitfac *
+                 (self.params.nccnew - self.params.nccnewz))
+
+        if self.control.fixed_stem_nc == 1:
+            ncwimm = (self.params.ncwimm + nitfac *
+                     (self.params.ncwimm - self.params.ncwimmz))
+            ncwnew = (self.params.ncwnew + nitfac *
+                     (self.params.ncwnew - self.params.ncwnewz))
+        else:
+            ncwimm = np.maximum(0.0, (0.0282 * self.state.shootnc + 0.000234) *
+                                self.params.fhw)
+            ncwnew = np.maximum(0.0, 0.162 * self.state.shootnc - 0.00143)
+
+        return (ncbnew, nccnew, ncwimm, ncwnew)
+
+    def carbon_production(self, project_day, daylen):
+        """ Calculate GPP, NPP and plant respiration, see
+        PlantGrowth.carbon_production
+
+        Parameters:
+        -----------
+        project_day : integer
+            simulation day
+        daylen : array
+            daytime length (hrs)
+        """
+        lai = self.state.lai
+        has_leaves = lai > 0.0
+
+        # total nitrogen content of the canopy
+        leafn = (self.state.shootnc * self.params.cfracts /
+                 self.params.sla * const.KG_AS_G)
+        self.state.ncontent = np.where(has_leaves, leafn * lai, 0.0)
+
+        # fractional ground cover
+        fc = np.where(vfloat_lt(lai, self.params.lai_closed),
+                      lai / self.params.lai_closed, 1.0)
+
+        # fraction of intercepted PAR
+        self.state.fipar = np.where(has_leaves,
+                                    (1.0 - np.exp(-self.params.kext *
+                                                  lai / fc)) * fc, 0.0)
+
+        if self.control.water_stress:
+            (self.state.wtfac_topsoil,
+             self.state.wtfac_root) = self.calculate_soil_water_fac()
+        else:
+            # really this should only be a debugging option!
+            self.state.wtfac_tsoil = np.ones(self.nmembers)
+            self.state.wtfac_root = np.ones(self.nmembers)
+
+        # Estimate photosynthesis
+        if self.control.frost:
+            # frost hardiness is carried from day to day, member by member
+            for i in xrange(self.nmembers):
+                self.members[i].calculate_photosynthesis(project_day,
+                                                       daylen.item(i))
+        else:
+            met_arrays = dict((var, values[project_day])
+                              for (var, values) in self.ps_met.iteritems())
+            out = self.mt.photosynthesis_batch(met_arrays, lai,
+                                               self.state.ncontent,
+                                               self.state.fipar,
+                                               self.state.wtfac_root)
+            for (var, value) in out.iteritems():
+                if hasattr(self.fluxes, var):
+                    setattr(self.fluxes, var, value)
+
+        # Plant respiration assuming carbon-use efficiency.
+        self.fluxes.auto_resp = self.fluxes.gpp * self.params.cue
+
+        # Calculate NPP
+        self.fluxes.npp_gCm2 = self.fluxes.gpp_gCm2 * self.params.cue
+        self.fluxes.npp = self.fluxes.npp_gCm2 * const.GRAM_C_2_TONNES_HA
+
+    def calculate_soil_water_fac(self):
+        """ Estimate a relative water availability factor [0..1], see
+        SoilMoisture.calculate_soil_water_fac
+
+        Returns:
+        --------
+        wtfac_topsoil : array
+            water availability factor for the top soil [0,1]
+        wtfac_root : array
+            water availability factor for the root zone [0,1]
+        """
+        smc_topsoil = self.state.pawater_topsoil / self.params.wcapac_topsoil
+        smc_root = self.state.pawater_root / self.params.wcapac_root
+
+        if self.control.sw_stress_model == 0:
+            wtfac_topsoil = smc_topsoil**self.params.qs
+            wtfac_root = smc_root**self.params.qs
+
+        elif self.control.sw_stress_model == 1:
+            wtfac_topsoil = 1.0 / (1.0 + ((1.0 - smc_topsoil) /
+                                          self.params.ctheta_topsoil)**
+                                          self.params.ntheta_topsoil)
+            wtfac_root = 1.0 / (1.0 + ((1.0 - smc_root) /
+                                       self.params.ctheta_root)**
+                                       self.params.ntheta_root)
+
+        elif self.control.sw_stress_model == 2:
+            psi_swp_topsoil = np.where(vfloat_eq(smc_topsoil, 0.0), -1.5,
+                                       self.params.psi_sat_topsoil *
+                                       (smc_topsoil /
+                                        self.params.theta_sat_topsoil)**
+                                       -self.params.b_topsoil)
+            psi_swp_root = np.where(vfloat_eq(smc_root, 0.0), -1.5,
+                                    self.params.psi_sat_root *
+                                    (smc_root / self.params.theta_sat_root)**
+                                    -self.params.b_root)
+            b = 0.66
+            wtfac_topsoil = np.exp(b * psi_swp_topsoil)
+            wtfac_root = np.exp(b * psi_swp_root)
+
+        return (wtfac_topsoil, wtfac_root)
+
+    def calc_carbon_allocation_fracs(self, nitfac):
+        """Carbon allocation fractions to move photosynthate through the plant,
+        see PlantGrowth.calc_carbon_allocation_fracs
+
+        Parameters:
+        -----------
+        nitfac : array
+            leaf N:C as a fraction of 'Ncmaxfyoung' (max 1.0)
+        """
+        params = self.params
+        state = self.state
+        fluxes = self.fluxes
+
+        if self.control.alloc_model == "FIXED":
+            fluxes.alleaf = (params.c_alloc_fmax + nitfac *
+                            (params.c_alloc_fmax - params.c_alloc_fmin))
+            fluxes.alroot = (params.c_alloc_rmax + nitfac *
+                            (params.c_alloc_rmax - params.c_alloc_rmin))
+            fluxes.albranch = (params.c_alloc_bmax + nitfac *
+                              (params.c_alloc_bmax - params.c_alloc_bmin))
+
+            # allocate remainder to stem
+            alstem = 1.0 - fluxes.alleaf - fluxes.alroot - fluxes.albranch
+            fluxes.alcroot = params.c_alloc_cmax * alstem
+            fluxes.alstem = alstem - fluxes.alcroot
+
+        elif self.control.alloc_model == "GRASSES":
+            self.calculate_growth_stress_limitation()
+
+            # root allocation given available water & nutrients
+            alroot = (params.c_alloc_rmax * params.c_alloc_rmin /
+                     (params.c_alloc_rmin +
+                     (params.c_alloc_rmax - params.c_alloc_rmin) *
+                      state.prev_sma))
+            alleaf = 1.0 - alroot
+
+            # leaf-to-root ratio under non-stressed conditons, adjusted for
+            # the running mean of N and water stress
+            lr_max = 0.8
+            stress = lr_max * state.prev_sma
+            mis_match = state.shoot / (state.root * stress)
+            reduce_leaf = mis_match > 1.0
+
+            # reduce leaf allocation fraction
+            leaf_cut = np.maximum(params.c_alloc_fmin,
+                                  np.minimum(params.c_alloc_fmax,
+                                             alleaf / mis_match))
+            # reduce root allocation
+            root_cut = np.maximum(params.c_alloc_rmin,
+                                  np.minimum(params.c_alloc_rmax,
+                                             alroot * mis_match))
+
+            fluxes.alleaf = np.where(reduce_leaf, leaf_cut, 1.0 - root_cut)
+            fluxes.alroot = np.where(reduce_leaf, 1.0 - leaf_cut, root_cut)
+            fluxes.alstem = np.zeros(self.nmembers)
+            fluxes.albranch = np.zeros(self.nmembers)
+            fluxes.alcroot = np.zeros(self.nmembers)
+
+        elif self.control.alloc_model == "ALLOMETRIC":
+            self.calculate_growth_stress_limitation()
+
+            # Calculate tree height: allometric reln using the power function
+            state.canht = params.heighto * state.stem**params.htpower
+
+            # LAI to stem sapwood cross-sectional area (As m-2 m-2)
+            arg1 = state.sapwood * const.TONNES_AS_KG * const.M2_AS_HA
+            arg2 = state.canht * params.density * params.cfracts
+            sap_cross_sec_area = arg1 / arg2
+            leaf2sap = state.lai / sap_cross_sec_area
+
+            # Allocation to leaves dependant on height
+            leaf2sa_target = np.where(
+                vfloat_le(state.canht, params.height0), params.leafsap0,
+                np.where(vfloat_ge(state.canht, params.height1),
+                         params.leafsap1,
+                         params.leafsap0 +
+                         ((params.leafsap1 - params.leafsap0) *
+                          (state.canht - params.height0) /
+                          (params.height1 - params.height0))))
+
+            alleaf = self.alloc_goal_seek(leaf2sap, leaf2sa_target,
+                                          params.c_alloc_fmax,
+                                          params.targ_sens)
+
+            # root allocation given available water & nutrients
+            alroot = (params.c_alloc_rmax * params.c_alloc_rmin /
+                     (params.c_alloc_rmin +
+                     (params.c_alloc_rmax - params.c_alloc_rmin) *
+                      state.prev_sma))
+
+            # leaf-to-root ratio under non-stressed conditons
+            lr_max = 1.0
+            stress = lr_max * state.prev_sma
+
+            # calculate imbalance, based on *biomass*, catching a floating
+            # point reset of root C mass
+            mis_match = np.where(vfloat_eq(state.root, 0.0), 1.9,
+                                 state.shoot / (state.root * stress))
+            reduce_leaf = mis_match > 1.0
+            reduce_root = mis_match < 1.0
+
+            # reduce leaf allocation fraction
+            leaf_cut = np.maximum(params.c_alloc_fmin,
+                                  np.minimum(params.c_alloc_fmax,
+                                             alleaf / mis_match))
+            root_gain = alroot + np.maximum(params.c_alloc_rmin,
+                                            alleaf - leaf_cut)
+
+            # reduce root allocation
+            root_cut = np.maximum(params.c_alloc_rmin,
+                                  np.minimum(params.c_alloc_rmax,
+                                             alroot * mis_match))
+            reduction = np.maximum(0.0, alroot - root_cut)
+            leaf_gain = alleaf + np.maximum(params.c_alloc_fmax, reduction)
+
+            alleaf = np.where(reduce_leaf, leaf_cut,
+                              np.where(reduce_root, leaf_gain, alleaf))
+            alroot = np.where(reduce_leaf, root_gain,
+                              np.where(reduce_root, root_cut, alroot))
+
+            # Allocation to branch and coarse root dependent on relationship
+            # with the stem
+            target_branch = params.branch0 * state.stem**params.branch1
+            albranch = self.alloc_goal_seek(state.branch, target_branch,
+                                            params.c_alloc_bmax,
+                                            params.targ_sens)
+
+            coarse_root_target = params.croot0 * state.stem**params.croot1
+            alcroot = self.alloc_goal_seek(state.croot, coarse_root_target,
+                                           params.c_alloc_cmax,
+                                           params.targ_sens)
+
+            # Ensure we don't end up with alloc fractions that make no
+            # physical sense.
+            left_over = 1.0 - alroot - alleaf
+            too_much = (albranch + alcroot) > left_over
+            no_croot = vfloat_eq(state.croot, 0.0)
+            alcroot = np.where(too_much,
+                               np.where(no_croot, 0.0, 0.3 * left_over),
+                               alcroot)
+            albranch = np.where(too_much,
+                                np.where(no_croot, 0.5 * left_over,
+                                         0.3 * left_over), albranch)
+
+            fluxes.alleaf = alleaf
+            fluxes.alroot = alroot
+            fluxes.albranch = albranch
+            fluxes.alcroot = alcroot
+            fluxes.alstem = 1.0 - alroot - albranch - alleaf - alcroot
+        else:
+            raise AttributeError('Unknown C allocation model')
+
+        # Total allocation should be one
+        total_alloc = (fluxes.alroot + fluxes.alleaf + fluxes.albranch +
+                       fluxes.alstem + fluxes.alcroot)
+        if np.any(vfloat_gt(total_alloc, 1.0)):
+            raise RuntimeError, "Allocation fracs > 1"
+
+    def alloc_goal_seek(self, simulated, target, alloc_max, sensitivity):
+        """ see PlantGrowth.alloc_goal_seek """
+        frac = 0.5 + 0.5 * (1.0 - simulated / target) / sensitivity
+
+        return np.maximum(0.0, alloc_max * np.minimum(1.0, frac))
+
+    def calculate_growth_stress_limitation(self):
+        """ Calculate level of stress due to nitrogen or water availability,
+        see PlantGrowth.calculate_growth_stress_limitation """
+        nf = self.state.shootnc
+        nlim = np.where(nf < self.params.nf_min, 0.0,
+                        np.where(nf < self.params.nf_crit,
+                                 (nf - self.params.nf_min) /
+                                 (self.params.nf_crit - self.params.nf_min),
+                                 1.0))
+
+        current_limitation = np.maximum(0.1, np.minimum(nlim,
+                                                        self.state.wtfac_root))
+        self.state.prev_sma = self.sma(current_limitation)
+
+    def nitrogen_allocation(self, ncbnew, nccnew, ncwimm, ncwnew, fdecay,
+                            rdecay, project_day, fsoilT):
+        """ Nitrogen distribution - allocate available N through system, see
+        PlantGrowth.nitrogen_allocation
+
+        Returns:
+        --------
+        recalc_wb : logical, array
+            members where NPP was down-regulated and so the water balance
+            needs recalculating
+        """
+        params = self.params
+        state = self.state
+        fluxes = self.fluxes
+
+        fluxes.retrans = self.nitrogen_retrans(fdecay, rdecay)
+        fluxes.nuptake = self.calculate_nuptake(project_day, fsoilT)
+
+        # Mineralised nitrogen lost from the system by volatilisation/leaching
+        fluxes.nloss = params.rateloss * state.inorgn
+
+        # total nitrogen to allocate
+        ntot = np.maximum(0.0, fluxes.nuptake + fluxes.retrans)
+
+        # allocate N to pools with fixed N:C ratios
+        fluxes.npstemimm = fluxes.npp * fluxes.alstem * ncwimm
+        fluxes.npstemmob = fluxes.npp * fluxes.alstem * (ncwnew - ncwimm)
+        fluxes.npbranch = fluxes.npp * fluxes.albranch * ncbnew
+        fluxes.npcroot = fluxes.npp * fluxes.alcroot * nccnew
+
+        # If we have allocated more N than we have available
+        #  - cut back N prodn
+        arg = (fluxes.npstemimm + fluxes.npstemmob + fluxes.npbranch +
+               fluxes.npcroot)
+        if self.control.fixleafnc == False and self.control.ncycle:
+            recalc_wb = vfloat_gt(arg, ntot)
+        else:
+            recalc_wb = np.zeros(self.nmembers, dtype=bool)
+
+        if recalc_wb.any():
+            cut = recalc_wb
+            no_shoot = vfloat_eq(state.shoot, 0.0)
+            sla_conv = (params.sla * const.M2_AS_HA /
+                        (const.KG_AS_TONNES * params.cfracts))
+
+            # how much LAI has already been increased by, before cpleaf is
+            # reduced
+            lai_inc = np.where(no_shoot, 0.0,
+                               fluxes.cpleaf * sla_conv -
+                               (fluxes.deadleaves + fluxes.ceaten) *
+                               state.lai / state.shoot)
+
+            fluxes.npp = np.where(cut, fluxes.npp *
+                                  (ntot / (fluxes.npstemimm +
+                                           fluxes.npstemmob +
+                                           fluxes.npbranch)), fluxes.npp)
+
+            # need to adjust growth values accordingly as well
+            fluxes.cpleaf = np.where(cut, fluxes.npp * fluxes.alleaf,
+                                     fluxes.cpleaf)
+            fluxes.cproot = np.where(cut, fluxes.npp * fluxes.alroot,
+                                     fluxes.cproot)
+            fluxes.cpcroot = np.where(cut, fluxes.npp * fluxes.alcroot,
+                                      fluxes.cpcroot)
+            fluxes.cpbranch = np.where(cut, fluxes.npp * fluxes.albranch,
+                                       fluxes.cpbranch)
+            fluxes.cpstem = np.where(cut, fluxes.npp * fluxes.alstem,
+                                     fluxes.cpstem)
+
+            fluxes.npbranch = np.where(cut, fluxes.npp * fluxes.albranch *
+                                       ncbnew, fluxes.npbranch)
+            fluxes.npstemimm = np.where(cut, fluxes.npp * fluxes.alstem *
+                                        ncwimm, fluxes.npstemimm)
+            fluxes.npstemmob = np.where(cut, fluxes.npp * fluxes.alstem *
+                                        (ncwnew - ncwimm), fluxes.npstemmob)
+            fluxes.npcroot = np.where(cut, fluxes.npp * fluxes.alcroot *
+                                      nccnew, fluxes.npcroot)
+
+            # Also need to recalculate GPP and thus Ra
+            fluxes.gpp = np.where(cut, fluxes.npp / params.cue, fluxes.gpp)
+            conv = const.G_AS_TONNES / const.M2_AS_HA
+            fluxes.gpp_gCm2 = np.where(cut, fluxes.gpp / conv,
+                                       fluxes.gpp_gCm2)
+            fluxes.gpp_am = np.where(cut, fluxes.gpp_gCm2 / 2.0,
+                                     fluxes.gpp_am)
+            fluxes.gpp_pm = np.where(cut, fluxes.gpp_gCm2 / 2.0,
+                                     fluxes.gpp_pm)
+            fluxes.auto_resp = np.where(cut, fluxes.gpp - fluxes.npp,
+                                        fluxes.auto_resp)
+
+            # Now reduce LAI for down-regulated growth.
+            lai = state.lai - lai_inc
+            lai = lai + (fluxes.cpleaf * sla_conv -
+                         (fluxes.deadleaves + fluxes.ceaten) *
+                         lai / state.shoot)
+            state.lai = np.where(cut, np.where(no_shoot, 0.0, lai), state.lai)
+
+        ntot = ntot - (fluxes.npbranch + fluxes.npstemimm +
+                       fluxes.npstemmob + fluxes.npcroot)
+        ntot = np.maximum(0.0, ntot)
+
+        # allocate remaining N to flexible-ratio pools
+        fluxes.npleaf = (ntot * fluxes.alleaf /
+                        (fluxes.alleaf + fluxes.alroot * params.ncrfac))
+        fluxes.nproot = ntot - fluxes.npleaf
+
+        return recalc_wb
+
+    def nitrogen_retrans(self, fdecay, rdecay):
+        """ Nitrogen retranslocated from senesced plant matter, see
+        PlantGrowth.nitrogen_retrans """
+        params = self.params
+        state = self.state
+
+        leafretransn = params.fretrans * fdecay * state.shootn
+        rootretransn = params.rretrans * rdecay * state.rootn
+        crootretransn = params.cretrans * params.crdecay * state.crootn
+        branchretransn = params.bretrans * params.bdecay * state.branchn
+        stemretransn = (params.wretrans * params.wdecay * state.stemnmob +
+                        params.retransmob * state.stemnmob)
+
+        # store for NCEAS output
+        self.fluxes.leafretransn = leafretransn
+
+        return (leafretransn + rootretransn + crootretransn + branchretransn +
+                stemretransn)
+
+    def calculate_nuptake(self, project_day, fsoilT):
+        """ N uptake depends on the rate at which soil mineral N is made
+        available to the plants, see PlantGrowth.calculate_nuptake
+
+        Returns:
+        --------
+        nuptake : array
+            N uptake
+        """
+        params = self.params
+        state = self.state
+
+        if self.control.nuptake_model == 0:
+            # Constant N uptake
+            nuptake = np.zeros(self.nmembers) + params.nuptakez
+        elif self.control.nuptake_model == 1:
+            # proportional to dynamic inorganic N pool
+            nuptake = params.rateuptake * state.inorgn
+        elif self.control.nuptake_model == 2:
+            # saturating function on root biomass
+            U0 = params.rateuptake * state.inorgn
+            Kr = params.kr
+            nuptake = np.maximum(U0 * state.root / (state.root + Kr), 0.0)
+        elif self.control.nuptake_model == 3:
+            # function of available soil N, soil moisture following a
+            # Michaelis-Menten approach
+            vcn = 1.0 / 0.0215
+            arg1 = (vcn * state.shootn) - state.shoot
+            arg2 = (vcn * state.shootn) + state.shoot
+            ac = params.ac + params.adapt * arg1 / arg2
+            params.ac = np.maximum(np.minimum(1.0, ac), 0.0)
+
+            theta = state.pawater_root / params.wcapac_root
+            ks = 0.9 * theta**3.0 + 0.1
+
+            arg1 = params.nmax * ks * state.inorgn
+            arg2 = params.knl + (ks * state.inorgn)
+            arg3 = np.exp(0.0693 * self.tair[project_day])
+            arg4 = 1.0 - params.ac
+            nuptake = (arg1 / arg2) * arg3 * arg4
+        else:
+            raise AttributeError('Unknown N uptake option')
+
+        return nuptake
+
+    def carbon_allocation(self, nitfac):
+        """ C distribution - allocate available C through system, see
+        PlantGrowth.carbon_allocation
+
+        Parameters:
+        -----------
+        nitfac : array
+            leaf N:C as a fraction of 'Ncmaxfyoung' (max 1.0)
+        """
+        fluxes = self.fluxes
+        state = self.state
+
+        fluxes.cpleaf = fluxes.npp * fluxes.alleaf
+        fluxes.cproot = fluxes.npp * fluxes.alroot
+        fluxes.cpcroot = fluxes.npp * fluxes.alcroot
+        fluxes.cpbranch = fluxes.npp * fluxes.albranch
+        fluxes.cpstem = fluxes.npp * fluxes.alstem
+
+        # SLA of new foliage linearly related to leaf N:C ratio via nitfac
+        self.params.sla = (self.params.slazero + nitfac *
+                          (self.params.slamax - self.params.slazero))
+
+        # update leaf area [m2 m-2]
+        lai = state.lai + (fluxes.cpleaf *
+                           (self.params.sla * const.M2_AS_HA /
+                           (const.KG_AS_TONNES * self.params.cfracts)) -
+                           (fluxes.deadleaves + fluxes.ceaten) *
+                           state.lai / state.shoot)
+        state.lai = np.where(vfloat_eq(state.shoot, 0.0), 0.0, lai)
+
+    def precision_control(self, tolerance=1E-08):
+        """ Detect very low values in state variables and force to zero to
+        avoid rounding and overflow errors, see PlantGrowth.precision_control
+        """
+        state = self.state
+        fluxes = self.fluxes
+
+        low = state.shoot < tolerance
+        if low.any():
+            fluxes.deadleaves = np.where(low, fluxes.deadleaves + state.shoot,
+                                         fluxes.deadleaves)
+            fluxes.deadleafn = np.where(low, fluxes.deadleafn + state.shootn,
+                                        fluxes.deadleafn)
+            state.shoot = np.where(low, 0.0, state.shoot)
+            state.shootn = np.where(low, 0.0, state.shootn)
+
+        low = state.branch < tolerance
+        if low.any():
+            fluxes.deadbranch = np.where(low, fluxes.deadbranch +
+                                         state.branch, fluxes.deadbranch)
+            fluxes.deadbranchn = np.where(low, fluxes.deadbranchn +
+                                          state.branchn, fluxes.deadbranchn)
+            state.branch = np.where(low, 0.0, state.branch)
+            state.branchn = np.where(low, 0.0, state.branchn)
+
+        low = state.root < tolerance
+        if low.any():
+            fluxes.deadrootn = np.where(low, fluxes.deadrootn + state.rootn,
+                                        fluxes.deadrootn)
+            fluxes.deadroots = np.where(low, fluxes.deadroots + state.root,
+                                        fluxes.deadroots)
+            state.root = np.where(low, 0.0, state.root)
+            state.rootn = np.where(low, 0.0, state.rootn)
+
+        low = state.croot < tolerance
+        if low.any():
+            fluxes.deadcrootn = np.where(low, fluxes.deadcrootn +
+                                         state.crootn, fluxes.deadcrootn)
+            fluxes.deadcroots = np.where(low, fluxes.deadcroots +
+                                         state.croot, fluxes.deadcroots)
+            state.croot = np.where(low, 0.0, state.croot)
+            state.crootn = np.where(low, 0.0, state.crootn)
+
+        # stem is seeded to a small value with a CN~25 rather than zeroed
+        low = state.stem < tolerance
+        if low.any():
+            fluxes.deadstems = np.where(low, fluxes.deadstems + state.stem,
+                                        fluxes.deadstems)
+            fluxes.deadstemn = np.where(low, fluxes.deadstemn + state.stemn,
+                                        fluxes.deadstemn)
+            state.stem = np.where(low, 0.001, state.stem)
+            state.stemn = np.where(low, 0.00004, state.stemn)
+            state.stemnimm = np.where(low, 0.00004, state.stemnimm)
+            state.stemnmob = np.where(low, 0.0, state.stemnmob)
+
+        low = state.stemnmob < tolerance
+        if low.any():
+            fluxes.deadstemn = np.where(low, fluxes.deadstemn +
+                                        state.stemnmob, fluxes.deadstemn)
+            state.stemnmob = np.where(low, 0.0, state.stemnmob)
+
+        low = state.stemnimm < tolerance
+        if low.any():
+            fluxes.deadstemn = np.where(low, fluxes.deadstemn +
+                                        state.stemnimm, fluxes.deadstemn)
+            state.stemnimm = np.where(low, 0.00004, state.stemnimm)
+
+    def update_plant_state(self, fdecay, rdecay):
+        """ Daily change in C content, see PlantGrowth.update_plant_state
+
+        Parameters:
+        -----------
+        fdecay : array
+            foliage decay rate
+        rdecay : array
+            fine root decay rate
+        """
+        params = self.params
+        state = self.state
+        fluxes = self.fluxes
+
+        #
+        # Carbon pools
+        #
+        state.shoot = state.shoot + (fluxes.cpleaf - fluxes.deadleaves -
+                                     fluxes.ceaten)
+        state.root = state.root + (fluxes.cproot - fluxes.deadroots)
+        state.croot = state.croot + (fluxes.cpcroot - fluxes.deadcroots)
+        state.branch = state.branch + (fluxes.cpbranch - fluxes.deadbranch)
+        state.stem = state.stem + (fluxes.cpstem - fluxes.deadstems)
+
+        # no stem, e.g. grasses, keep the sapwood at a token value
+        state.sapwood = np.where(state.stem <= 0.01, 0.01,
+                                 state.sapwood + (fluxes.cpstem -
+                                                  fluxes.deadsapwood))
+
+        #
+        # Nitrogen pools
+        #
+        state.shootn = state.shootn + (fluxes.npleaf - fdecay * state.shootn -
+                                       fluxes.neaten)
+        state.branchn = state.branchn + (fluxes.npbranch - params.bdecay *
+                                         state.branchn)
+        state.rootn = state.rootn + (fluxes.nproot - rdecay * state.rootn)
+        state.crootn = state.crootn + (fluxes.npcroot - params.crdecay *
+                                       state.crootn)
+        state.stemnimm = state.stemnimm + (fluxes.npstemimm - params.wdecay *
+                                           state.stemnimm)
+        state.stemnmob = state.stemnmob + (fluxes.npstemmob - params.wdecay *
+                                           state.stemnmob -
+                                           params.retransmob * state.stemnmob)
+        state.stemn = state.stemnimm + state.stemnmob
+
+        #============================
+        # Enforce maximum N:C ratios.
+        # ===========================
+        # maximum leaf n:c ratio is function of stand age
+        age_effect = ((state.age - params.ageyoung) /
+                      (params.ageold - params.ageyoung))
+        ncmaxf = (params.ncmaxfyoung -
+                 (params.ncmaxfyoung - params.ncmaxfold) * age_effect)
+        ncmaxf = np.where(vfloat_lt(ncmaxf, params.ncmaxfold),
+                          params.ncmaxfold, ncmaxf)
+        ncmaxf = np.where(vfloat_gt(ncmaxf, params.ncmaxfyoung),
+                          params.ncmaxfyoung, ncmaxf)
+
+        # If foliage N/C exceeds its max, then N uptake is cut back, but
+        # cannot be reduced below zero.
+        too_high = (state.lai > 0.0) & vfloat_gt(state.shootn,
+                                                 state.shoot * ncmaxf)
+        extras = np.where(too_high, state.shootn - state.shoot * ncmaxf, 0.0)
+        extras = np.where(too_high & vfloat_gt(extras, fluxes.nuptake),
+                          fluxes.nuptake, extras)
+        state.shootn = np.where(too_high, state.shootn - extras, state.shootn)
+        fluxes.nuptake = np.where(too_high, fluxes.nuptake - extras,
+                                  fluxes.nuptake)
+
+        # and the same for the root N:C
+        ncmaxr = ncmaxf * params.ncrfac
+        too_high = vfloat_gt(state.rootn, state.root * ncmaxr)
+        extrar = state.rootn - state.root * ncmaxr
+        extrar = np.where(vfloat_gt(extras + extrar, fluxes.nuptake),
+                          fluxes.nuptake - extras, extrar)
+        state.rootn = np.where(too_high, state.rootn - extrar, state.rootn)
+        fluxes.nuptake = np.where(too_high, fluxes.nuptake - extrar,
+                                  fluxes.nuptake)
@@ -0,0 +1,834 @@
+""" Soil C and N flows for an ensemble of parameter sets, see soil_cn_model.py.
+
+Each method follows its scalar counterpart in CarbonSoilFlows or
+NitrogenSoilFlows, evaluated for every member at once.
+"""
+
+import numpy as np
+import constants as const
+from ensemble_utilities import vfloat_eq, vfloat_lt, vfloat_gt, stack_members
+from soil_cn_model import CarbonSoilMatrix, NitrogenSoilMatrix
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+class EnsembleCarbonSoilFlows(object):
+    """ Plant litter C production is divided btw metabolic and structural """
+
+    def __init__(self, control, params, state, fluxes, met):
+        """
+        Parameters
+        ----------
+        control : integers, object
+            model control flags
+        params: EnsembleRecord
+            model parameters
+        state: EnsembleRecord
+            model state
+        fluxes : EnsembleRecord
+            model fluxes
+        met : list of MetForcing
+            meteorological forcing data of each member
+
+        """
+        self.params = params
+        self.fluxes = fluxes
+        self.control = control
+        self.state = state
+        self.tfac_soil_decomp = stack_members([m.derived['tfac_soil_decomp']
+                                               for m in met])
+
+        # Fraction of C lost due to microbial respiration
+        self.frac_microb_resp = 0.85 - (0.68 * self.params.finesoil)
+
+    def calculate_csoil_flows(self, project_day, doy):
+        """ C from decomposing litter -> active, slow and passive SOM pools.
+
+        Parameters:
+        -----------
+        project_day : integer
+            simulation day
+
+        """
+        params = self.params
+        fluxes = self.fluxes
+
+        # calculate model decay rates
+        self.calculate_decay_rates(project_day)
+
+        # plant litter inputs to the metabolic and structural pools determined
+        # by ratio of lignin/N ratio
+        (lnleaf, lnroot) = self.ligin_nratio()
+        params.fmleaf = self.metafract(lnleaf)
+        params.fmroot = self.metafract(lnroot)
+
+        self.flux_from_grazers() # input from faeces
+        self.partition_plant_litter()
+        self.calculate_cfluxes()
+        fluxes.hetero_resp = self.calculate_soil_respiration()
+
+        # update the C pools
+        self.calculate_cpools()
+
+        # calculate NEP
+        fluxes.nep = (fluxes.npp - fluxes.hetero_resp -
+                      fluxes.ceaten * (1.0 - params.fracfaeces))
+
+        # save fluxes for NCEAS output
+        fluxes.co2_rel_from_surf_struct_litter = fluxes.co2_to_air[0]
+        fluxes.co2_rel_from_soil_struct_litter = fluxes.co2_to_air[1]
+        fluxes.co2_rel_from_surf_metab_litter = fluxes.co2_to_air[2]
+        fluxes.co2_rel_from_soil_metab_litter = fluxes.co2_to_air[3]
+        fluxes.co2_rel_from_active_pool = fluxes.co2_to_air[4]
+        fluxes.co2_rel_from_slow_pool = fluxes.co2_to_air[5]
+        fluxes.co2_rel_from_passive_pool = fluxes.co2_to_air[6]
+
+    def calculate_decay_rates(self, project_day):
+        """ Model decay rates, temperature and moisture dependent, see
+        CarbonSoilFlows.calculate_decay_rates
+
+        Parameters:
+        -----------
+        project_day : int
+            current simulation day (index)
+
+        """
+        params = self.params
+
+        # abiotic decomposition factor
+        adfac = self.state.wtfac_topsoil * self.soil_temp_factor(project_day)
+
+        # Effect of soil texture (silt + clay content) on active SOM turnover
+        soil_text = 1.0 - (0.75 * params.finesoil)
+
+        # Impact of lignin content
+        lignin_cont_leaf = np.exp(-3.0 * params.ligshoot)
+        lignin_cont_root = np.exp(-3.0 * params.ligroot)
+
+        params.decayrate = [params.kdec1 * lignin_cont_leaf * adfac,
+                            params.kdec2 * adfac,
+                            params.kdec3 * lignin_cont_root * adfac,
+                            params.kdec4 * adfac,
+                            params.kdec5 * soil_text * adfac,
+                            params.kdec6 * adfac,
+                            params.kdec7 * adfac]
+
+    def soil_temp_factor(self, project_day):
+        """Soil-temperature activity factor (A9), precomputed for the record
+
+        Parameters:
+        -----------
+        project_day : int
+            current simulation day (index)
+
+        Returns:
+        --------
+        tfac : float
+            soil temperature factor [degC]
+
+        """
+        self.fluxes.tfac_soil_decomp = self.tfac_soil_decomp[project_day]
+        return self.fluxes.tfac_soil_decomp
+
+    def flux_from_grazers(self):
+        """ Input from faeces """
+        if self.control.grazing:
+            arg = (self.params.ligfaeces * self.params.faecescn /
+                   self.params.cfracts)
+            self.params.fmfaeces = self.metafract(arg)
+            self.fluxes.faecesc = self.fluxes.ceaten * self.params.fracfaeces
+        else:
+            self.params.fmfaeces = 0.0
+            self.fluxes.faecesc = np.zeros(self.state.shoot.shape)
+
+    def ligin_nratio(self):
+        """ Estimate Lignin/N ratio, see CarbonSoilFlows.ligin_nratio
+
+        Returns:
+        --------
+        lnleaf : array
+            lignin:N ratio of leaf
+        lnroot : array
+            lignin:N ratio of fine root
+        """
+        nc_leaf_litter = self.ratio_of_litternc_to_live_leafnc()
+        nc_root_litter = self.ratio_of_litternc_to_live_rootnc()
+
+        # catch divide by zero if we have no leaves/roots
+        lnleaf = np.where(vfloat_eq(nc_leaf_litter, 0.0), 0.0,
+                          self.params.ligshoot / self.params.cfracts /
+                          nc_leaf_litter)
+        lnroot = np.where(vfloat_eq(nc_root_litter, 0.0), 0.0,
+                          self.params.ligroot / self.params.cfracts /
+                          nc_root_litter)
+
+        return (lnleaf, lnroot)
+
+    def ratio_of_litternc_to_live_leafnc(self):
+        """ratio of litter N:C to live leaf N:C """
+        if self.control.use_eff_nc:
+            return self.params.liteffnc * (1.0 - self.params.fretrans)
+
+        return np.where(vfloat_eq(self.fluxes.deadleaves, 0.0), 0.0,
+                        self.fluxes.deadleafn / self.fluxes.deadleaves)
+
+    def ratio_of_litternc_to_live_rootnc(self):
+        """ratio of litter N:C to live root N:C """
+        if self.control.use_eff_nc:
+            return (self.params.liteffnc * self.params.ncrfac *
+                   (1.0 - self.params.rretrans))
+
+        return np.where(vfloat_eq(self.fluxes.deadroots, 0.0), 0.0,
+                        self.fluxes.deadrootn / self.fluxes.deadroots)
+
+    def metafract(self, lig2n):
+        """ Fraction of the litter partitioned to the metabolic pool """
+        return np.maximum(0.0, 0.85 - (0.018 * lig2n))
+
+    def partition_plant_litter(self):
+        """ Partition litter from the plant (surface) and roots into metabolic
+        and structural pools  """
+        fluxes = self.fluxes
+        params = self.params
+
+        # Surface (leaves, branches, stem) Litter
+        fluxes.surf_struct_litter = (fluxes.deadleaves *
+                                     (1.0 - params.fmleaf) +
+                                     fluxes.deadbranch +
+                                     fluxes.deadstems +
+                                     fluxes.faecesc *
+                                     (1.0 - params.fmfaeces))
+        fluxes.surf_metab_litter = (fluxes.deadleaves * params.fmleaf +
+                                    fluxes.faecesc * params.fmfaeces)
+
+        # Root Litter
+        fluxes.soil_struct_litter = (fluxes.deadroots *
+                                     (1.0 - params.fmroot) +
+                                     fluxes.deadcroots)
+        fluxes.soil_metab_litter = fluxes.deadroots * params.fmroot
+
+    def calculate_cfluxes(self):
+        """ C fluxes out of each pool, to the other pools and the air """
+        self.cfluxes_from_structural_pool()
+        self.cfluxes_from_metabolic_pool()
+        self.cfluxes_from_active_pool()
+        self.cfluxes_from_slow_pool()
+        self.cfluxes_from_passive_pool()
+
+    def cfluxes_from_structural_pool(self):
+        """C fluxes from structural pools """
+        fluxes = self.fluxes
+
+        structout_surf = self.state.structsurf * self.params.decayrate[0]
+        structout_soil = self.state.structsoil * self.params.decayrate[2]
+        ligshoot = self.params.ligshoot
+        ligroot = self.params.ligroot
+
+        fluxes.surf_struct_to_slow = structout_surf * ligshoot * 0.7
+        fluxes.surf_struct_to_active = (structout_surf *
+                                        (1.0 - ligshoot) * 0.55)
+        fluxes.soil_struct_to_slow = structout_soil * ligroot * 0.7
+        fluxes.soil_struct_to_active = (structout_soil *
+                                        (1.0 - ligroot) * 0.45)
+
+        # Respiration fluxes
+        fluxes.co2_to_air = [None] * 7
+        fluxes.co2_to_air[0] = (structout_surf *
+                                (ligshoot * 0.3 + (1.0 - ligshoot) * 0.45))
+        fluxes.co2_to_air[1] = (structout_soil *
+                                (ligroot * 0.3 + (1.0 - ligroot) * 0.55))
+
+    def cfluxes_from_metabolic_pool(self):
+        """C fluxes from metabolic pools """
+        fluxes = self.fluxes
+        decayrate = self.params.decayrate
+
+        fluxes.surf_metab_to_active = (self.state.metabsurf *
+                                       decayrate[1] * 0.45)
+        fluxes.soil_metab_to_active = (self.state.metabsoil *
+                                       decayrate[3] * 0.45)
+
+        # Respiration fluxes
+        fluxes.co2_to_air[2] = self.state.metabsurf * decayrate[1] * 0.55
+        fluxes.co2_to_air[3] = self.state.metabsoil * decayrate[3] * 0.55
+
+    def cfluxes_from_active_pool(self):
+        """C fluxes from active pools """
+        activeout = self.state.activesoil * self.params.decayrate[4]
+
+        self.fluxes.active_to_slow = (activeout *
+                                      (1.0 - self.frac_microb_resp - 0.004))
+        self.fluxes.active_to_passive = activeout * 0.004
+
+        # Respiration fluxes
+        self.fluxes.co2_to_air[4] = activeout * self.frac_microb_resp
+
+    def cfluxes_from_slow_pool(self):
+        """C fluxes from slow pools """
+        slowout = self.state.slowsoil * self.params.decayrate[5]
+
+        self.fluxes.slow_to_active = slowout * 0.42
+        self.fluxes.slow_to_passive = slowout * 0.03
+
+        # Respiration fluxes
+        self.fluxes.co2_to_air[5] = slowout * 0.55
+
+    def cfluxes_from_passive_pool(self):
+        """ C fluxes from passive pool """
+        self.fluxes.passive_to_active = (self.state.passivesoil *
+                                         self.params.decayrate[6] * 0.45)
+
+        # Respiration fluxes
+        self.fluxes.co2_to_air[6] = (self.state.passivesoil *
+                                     self.params.decayrate[6] * 0.55)
+
+    def calculate_soil_respiration(self):
+        """ total soil respiration (heterotrophic) flux """
+        soil_resp = sum(self.fluxes.co2_to_air)
+
+        # obey c conservation if assuming a fixed passive pool
+        if self.control.passiveconst == True:
+            soil_resp = (self.fluxes.hetero_resp +
+                         self.fluxes.active_to_passive +
+                         self.fluxes.slow_to_passive -
+                         self.state.passivesoil *
+                         self.params.decayrate[6])
+
+        return soil_resp
+
+    def calculate_cpools(self):
+        """Calculate new soil carbon pools. """
+        fluxes = self.fluxes
+        state = self.state
+        co2_to_air = fluxes.co2_to_air
+
+        state.structsurf = state.structsurf + (fluxes.surf_struct_litter -
+                                              (fluxes.surf_struct_to_slow +
+                                               fluxes.surf_struct_to_active +
+                                               co2_to_air[0]))
+        state.structsoil = state.structsoil + (fluxes.soil_struct_litter -
+                                              (fluxes.soil_struct_to_slow +
+                                               fluxes.soil_struct_to_active +
+                                               co2_to_air[1]))
+        state.metabsurf = state.metabsurf + (fluxes.surf_metab_litter -
+                                            (fluxes.surf_metab_to_active +
+                                             co2_to_air[2]))
+        state.metabsoil = state.metabsoil + (fluxes.soil_metab_litter -
+                                            (fluxes.soil_metab_to_active +
+                                             co2_to_air[3]))
+
+        # store the C SOM fluxes for Nitrogen calculations
+        fluxes.c_into_active = (fluxes.surf_struct_to_active +
+                                fluxes.soil_struct_to_active +
+                                fluxes.surf_metab_to_active +
+                                fluxes.soil_metab_to_active +
+                                fluxes.slow_to_active +
+                                fluxes.passive_to_active)
+        fluxes.c_into_slow = (fluxes.surf_struct_to_slow +
+                              fluxes.soil_struct_to_slow +
+                              fluxes.active_to_slow)
+        fluxes.c_into_passive = (fluxes.active_to_passive +
+                                 fluxes.slow_to_passive)
+
+        state.activesoil = state.activesoil + (fluxes.c_into_active -
+                                              (fluxes.active_to_slow +
+                                               fluxes.active_to_passive +
+                                               co2_to_air[4]))
+        state.slowsoil = state.slowsoil + (fluxes.c_into_slow -
+                                          (fluxes.slow_to_active +
+                                           fluxes.slow_to_passive +
+                                           co2_to_air[5]))
+        state.passivesoil = state.passivesoil + (fluxes.c_into_passive -
+                                                (fluxes.passive_to_active +
+                                                 co2_to_air[6]))
+
+        self.precision_control()
+
+    def precision_control(self, tolerance=1E-08):
+        """ Detect very low values in state variables and force to zero to
+        avoid rounding and overflow errors """
+        fluxes = self.fluxes
+        state = self.state
+
+        low = state.metabsurf < tolerance
+        if low.any():
+            excess = state.metabsurf
+            fluxes.surf_metab_to_active = np.where(low, excess * 0.45,
+                                                   fluxes.surf_metab_to_active)
+            fluxes.co2_to_air[2] = np.where(low, excess * 0.55,
+                                            fluxes.co2_to_air[2])
+            state.metabsurf = np.where(low, 0.0, state.metabsurf)
+
+        low = state.metabsoil < tolerance
+        if low.any():
+            excess = state.metabsoil
+            fluxes.soil_metab_to_active = np.where(low, excess * 0.45,
+                                                   fluxes.soil_metab_to_active)
+            fluxes.co2_to_air[3] = np.where(low, excess * 0.55,
+                                            fluxes.co2_to_air[3])
+            state.metabsoil = np.where(low, 0.0, state.metabsoil)
+
+
+class EnsembleNitrogenSoilFlows(object):
+    """ Calculate daily nitrogen fluxes"""
+    def __init__(self, control, params, state, fluxes, met):
+        """
+        Parameters
+        ----------
+        control : integers, object
+            model control flags
+        params: EnsembleRecord
+            model parameters
+        state: EnsembleRecord
+            model state
+        fluxes : EnsembleRecord
+            model fluxes
+        met : list of MetForcing
+            meteorological forcing data of each member
+
+        """
+        self.params = params
+        self.fluxes = fluxes
+        self.control = control
+        self.state = state
+        self.ndep = stack_members([m['ndep'] for m in met])
+
+        # Fraction of C lost due to microbial respiration
+        self.frac_microb_resp = 0.85 - (0.68 * self.params.finesoil)
+
+    def calculate_nsoil_flows(self, project_day, doy):
+        """ N from decomposing litter -> active, slow and passive SOM pools.
+
+        Parameters:
+        -----------
+        project_day : integer
+            simulation day
+
+        """
+        fluxes = self.fluxes
+        fluxes.ninflow = self.ndep[project_day]
+
+        # n from faeces and urine
+        self.grazer_inputs()
+
+        (nsurf, nsoil) = self.inputs_from_plant_litter()
+        self.partition_plant_litter_n(nsurf, nsoil)
+
+        # SOM nitrogen effluxes
+        self.calculate_nfluxes()
+
+        # gross N mineralisation
+        fluxes.ngross = self.calculate_n_mineralisation()
+
+        # calculate N immobilisation
+        (fluxes.nimmob, active_nc_slope,
+         slow_nc_slope, passive_nc_slope) = self.calculate_n_immobilisation()
+
+        # Update model soil N pools
+        self.calculate_npools(active_nc_slope, slow_nc_slope, passive_nc_slope)
+
+        # calculate N net mineralisation
+        fluxes.nmineralisation = (fluxes.ngross - fluxes.nimmob +
+                                  fluxes.nlittrelease)
+
+        if self.control.adjust_rtslow:
+            self.adjust_residence_time_of_slow_pool()
+
+    def grazer_inputs(self):
+        """ Grazer inputs from faeces and urine, flux detd by faeces c:n """
+        params = self.params
+        fluxes = self.fluxes
+        if self.control.grazing:
+            params.faecesn = fluxes.faecesc / params.faecescn
+        else:
+            params.faecesn = np.zeros(fluxes.neaten.shape)
+
+        # make sure faecesn <= total n input to soil from grazing
+        arg = fluxes.neaten * params.fractosoil
+        params.faecesn = np.where(vfloat_gt(params.faecesn, arg),
+                                  fluxes.neaten * params.fractosoil,
+                                  params.faecesn)
+
+        # urine=total-faeces
+        if self.control.grazing:
+            fluxes.nurine = (fluxes.neaten * params.fractosoil -
+                             params.faecesn)
+        else:
+            fluxes.nurine = np.zeros(fluxes.neaten.shape)
+
+        fluxes.nurine = np.where(vfloat_lt(fluxes.nurine, 0.0), 0.0,
+                                 fluxes.nurine)
+
+    def inputs_from_plant_litter(self):
+        """ N inputs from plant litter, surface and soil
+
+        Returns:
+        --------
+        nsurf : array
+            N input from surface pool
+        nsoil : array
+            N input from soil pool
+        """
+        nsurf = (self.fluxes.deadleafn + self.fluxes.deadbranchn +
+                 self.fluxes.deadstemn + self.params.faecesn)
+        nsoil = self.fluxes.deadrootn + self.fluxes.deadcrootn
+
+        return nsurf, nsoil
+
+    def partition_plant_litter_n(self, nsurf, nsoil):
+        """ Partition litter N from the plant (surface) and roots into
+        metabolic and structural pools, see
+        NitrogenSoilFlows.partition_plant_litter_n
+
+        Parameters:
+        -----------
+        nsurf : array
+            N input from surface pool
+        nsoil : array
+            N input from soil pool
+        """
+        fluxes = self.fluxes
+        params = self.params
+
+        if not self.control.strfloat:
+            # constant structural input n:c as per century, if not enough N
+            # for structural, all available N goes to structural
+            n_surf = fluxes.surf_struct_litter / params.structcn
+            n_soil = fluxes.soil_struct_litter / params.structcn
+            fluxes.n_surf_struct_litter = np.where(vfloat_gt(n_surf, nsurf),
+                                                   nsurf, n_surf)
+            fluxes.n_soil_struct_litter = np.where(vfloat_gt(n_soil, nsoil),
+                                                   nsoil, n_soil)
+        else:
+            # structural input n:c is a fraction of metabolic
+            c_surf_struct_litter = (fluxes.surf_struct_litter *
+                                    params.structrat +
+                                    fluxes.surf_metab_litter)
+            fluxes.n_surf_struct_litter = np.where(
+                vfloat_eq(c_surf_struct_litter, 0.0), 0.0,
+                nsurf * fluxes.surf_struct_litter * params.structrat /
+                c_surf_struct_litter)
+
+            c_soil_struct_litter = (fluxes.soil_struct_litter *
+                                    params.structrat +
+                                    fluxes.soil_metab_litter)
+            fluxes.n_soil_struct_litter = np.where(
+                vfloat_eq(c_soil_struct_litter, 0.0), 0.0,
+                nsurf * fluxes.soil_struct_litter * params.structrat /
+                c_soil_struct_litter)
+
+        # remaining N goes to metabolic pools
+        fluxes.n_surf_metab_litter = nsurf - fluxes.n_surf_struct_litter
+        fluxes.n_soil_metab_litter = nsoil - fluxes.n_soil_struct_litter
+
+    def calculate_nfluxes(self):
+        """ N fluxes out of each pool to the other pools """
+        self.nfluxes_from_structural_pools()
+        self.nfluxes_from_metabolic_pool()
+        self.nfluxes_from_active_pool()
+        self.nfluxes_from_slow_pool()
+        self.nfluxes_from_passive_pool()
+
+    def nfluxes_from_structural_pools(self):
+        """ from structural pool """
+        structout_surf = self.state.structsurfn * self.params.decayrate[0]
+        structout_soil = self.state.structsoiln * self.params.decayrate[2]
+        ligshoot = self.params.ligshoot
+        ligroot = self.params.ligroot
+
+        sigwt = structout_surf / (ligshoot * 0.7 + (1.0 - ligshoot) * 0.55)
+        self.fluxes.n_surf_struct_to_slow = sigwt * ligshoot * 0.7
+        self.fluxes.n_surf_struct_to_active = sigwt * (1.0 - ligshoot) * 0.55
+
+        sigwt = structout_soil / (ligroot * 0.7 + (1. - ligroot) * 0.45)
+        self.fluxes.n_soil_struct_to_slow = sigwt * ligroot * 0.7
+        self.fluxes.n_soil_struct_to_active = sigwt * (1.0 - ligroot) * 0.45
+
+    def nfluxes_from_metabolic_pool(self):
+        """ N fluxes from metabolic pool"""
+        self.fluxes.n_surf_metab_to_active = (self.state.metabsurfn *
+                                              self.params.decayrate[1])
+        self.fluxes.n_soil_metab_to_active = (self.state.metabsoiln *
+                                              self.params.decayrate[3])
+
+    def nfluxes_from_active_pool(self):
+        """ N fluxes from active pool """
+        activeout = self.state.activesoiln * self.params.decayrate[4]
+        sigwt = activeout / (1.0 - self.frac_microb_resp)
+
+        self.fluxes.n_active_to_slow = (sigwt *
+                                        (1.0 - self.frac_microb_resp - 0.004))
+        self.fluxes.n_active_to_passive = sigwt * 0.004
+
+    def nfluxes_from_slow_pool(self):
+        """N fluxes from slow pools """
+        slowout = self.state.slowsoiln * self.params.decayrate[5]
+        sigwt = slowout / 0.45
+
+        self.fluxes.n_slow_to_active = sigwt * 0.42
+        self.fluxes.n_slow_to_passive = sigwt * 0.03
+
+    def nfluxes_from_passive_pool(self):
+        """ N fluxes from passive pool """
+        self.fluxes.n_passive_to_active = (self.state.passivesoiln *
+                                           self.params.decayrate[6])
+
+    def calculate_n_mineralisation(self):
+        """ N gross mineralisation rate, the excess of N outflows over
+        inflows """
+        fluxes = self.fluxes
+        return (fluxes.n_surf_struct_to_slow +
+                fluxes.n_surf_struct_to_active +
+                fluxes.n_soil_struct_to_slow +
+                fluxes.n_soil_struct_to_active +
+                fluxes.n_surf_metab_to_active +
+                fluxes.n_soil_metab_to_active +
+                fluxes.n_active_to_slow +
+                fluxes.n_active_to_passive +
+                fluxes.n_slow_to_active +
+                fluxes.n_slow_to_passive +
+                fluxes.n_passive_to_active)
+
+    def calculate_n_immobilisation(self):
+        """ N immobilised in new soil organic matter, see
+        NitrogenSoilFlows.calculate_n_immobilisation
+
+        Returns:
+        --------
+        nimob : array
+            N immobilsed
+        """
+        params = self.params
+        active_nc_slope = self.calculate_nc_slope(params.actncmax,
+                                                  params.actncmin)
+        slow_nc_slope = self.calculate_nc_slope(params.slowncmax,
+                                                params.slowncmin)
+        passive_nc_slope = self.calculate_nc_slope(params.passncmax,
+                                                   params.passncmin)
+
+        # C flux entering SOM pools - use short names
+        active_influxes = self.fluxes.c_into_active
+        slow_influxes = self.fluxes.c_into_slow
+        passive_influxes = self.fluxes.c_into_passive
+
+        # convert units
+        nmin = params.nmin0 / const.M2_AS_HA * const.G_AS_TONNES
+
+        arg1 = ((params.passncmin - passive_nc_slope * nmin) *
+                 passive_influxes)
+        arg2 = (params.slowncmin - slow_nc_slope * nmin) * slow_influxes
+        arg3 = active_influxes * (params.actncmin - active_nc_slope * nmin)
+        numer1 = arg1 + arg2 + arg3
+
+        arg1 = passive_influxes * params.passncmax
+        arg2 = slow_influxes * params.slowncmax
+        arg3 = active_influxes * params.actncmax
+        numer2 = arg1 + arg2 + arg3
+
+        arg1 = passive_influxes * passive_nc_slope
+        arg2 = slow_influxes * slow_nc_slope
+        arg3 = active_influxes * active_nc_slope
+        denom = arg1 + arg2 + arg3
+
+        # evaluate N immobilisation in new SOM
+        nimmob = numer1 + denom * self.state.inorgn
+        nimmob = np.where(vfloat_gt(nimmob, numer2), numer2, nimmob)
+
+        return (nimmob, active_nc_slope, slow_nc_slope, passive_nc_slope)
+
+    def calculate_nc_slope(self, ncmax, ncmin):
+        """ Returns N:C ratio of the mineral pool slope, see
+        NitrogenSoilFlows.calculate_nc_slope """
+        arg1 = ncmax - ncmin
+        arg2 = self.params.nmincrit - self.params.nmin0
+        conv = const.M2_AS_HA / const.G_AS_TONNES
+
+        return arg1 / arg2 * conv
+
+    def calculate_npools(self, active_nc_slope, slow_nc_slope,
+                         passive_nc_slope):
+        """ Update N pools in the soil, see NitrogenSoilFlows.calculate_npools
+
+        Parameters
+        ----------
+        active_nc_slope : float
+            active NC slope
+        slow_nc_slope: float
+            slow NC slope
+        passive_nc_slope : float
+            passive NC slope
+
+        """
+        params = self.params
+        fluxes = self.fluxes
+        state = self.state
+
+        # N released or fixed from the N inorganic pool is incremented with
+        # each call to nc_limit
+        fluxes.nlittrelease = np.zeros(self.state.inorgn.shape)
+
+        state.structsurfn = state.structsurfn + (fluxes.n_surf_struct_litter -
+                                                (fluxes.n_surf_struct_to_slow +
+                                                 fluxes.n_surf_struct_to_active))
+        if not self.control.strfloat:
+            state.structsurfn = state.structsurfn + \
+                self.nc_limit(state.structsurf, state.structsurfn,
+                              1.0/params.structcn, 1.0/params.structcn)
+
+        state.structsoiln = state.structsoiln + (fluxes.n_soil_struct_litter -
+                                                (fluxes.n_soil_struct_to_slow +
+                                                 fluxes.n_soil_struct_to_active))
+        if not self.control.strfloat:
+            state.structsoiln = state.structsoiln + \
+                self.nc_limit(state.structsoil, state.structsoiln,
+                              1.0/params.structcn, 1.0/params.structcn)
+
+        state.metabsurfn = state.metabsurfn + (fluxes.n_surf_metab_litter -
+                                              fluxes.n_surf_metab_to_active)
+        state.metabsurfn = state.metabsurfn + \
+            self.nc_limit(state.metabsurf, state.metabsurfn, 1.0/25.0,
+                          1.0/10.0)
+
+        state.metabsoiln = state.metabsoiln + (fluxes.n_soil_metab_litter -
+                                              fluxes.n_soil_metab_to_active)
+        state.metabsoiln = state.metabsoiln + \
+            self.nc_limit(state.metabsoil, state.metabsoiln, 1.0/25.0,
+                          1.0/10.0)
+
+        self.precision_control()
+
+        # Update SOM pools
+        n_into_active = (fluxes.n_surf_struct_to_active +
+                         fluxes.n_soil_struct_to_active +
+                         fluxes.n_surf_metab_to_active +
+                         fluxes.n_soil_metab_to_active +
+                         fluxes.n_slow_to_active +
+                         fluxes.n_passive_to_active)
+        n_out_of_active = fluxes.n_active_to_slow + fluxes.n_active_to_passive
+        n_into_slow = (fluxes.n_surf_struct_to_slow +
+                       fluxes.n_soil_struct_to_slow +
+                       fluxes.n_active_to_slow)
+        n_out_of_slow = fluxes.n_slow_to_active + fluxes.n_slow_to_passive
+        n_into_passive = fluxes.n_active_to_passive + fluxes.n_slow_to_passive
+        n_out_of_passive = fluxes.n_passive_to_active
+
+        # N:C of the SOM pools increases linearly btw prescribed min and max
+        # values as the Nconc of the soil increases.
+        arg = (state.inorgn - params.nmin0 / const.M2_AS_HA *
+               const.G_AS_TONNES)
+
+        # active
+        active_nc = params.actncmin + active_nc_slope * arg
+        active_nc = np.where(vfloat_gt(active_nc, params.actncmax),
+                             params.actncmax, active_nc)
+        fixn = self.nc_flux(fluxes.c_into_active, n_into_active, active_nc)
+        state.activesoiln = state.activesoiln + (n_into_active + fixn -
+                                                 n_out_of_active)
+
+        # slow
+        slow_nc = params.slowncmin + slow_nc_slope * arg
+        slow_nc = np.where(vfloat_gt(slow_nc, params.slowncmax),
+                           params.slowncmax, slow_nc)
+        fixn = self.nc_flux(fluxes.c_into_slow, n_into_slow, slow_nc)
+        state.slowsoiln = state.slowsoiln + (n_into_slow + fixn -
+                                             n_out_of_slow)
+
+        # passive
+        pass_nc = params.passncmin + passive_nc_slope * arg
+        pass_nc = np.where(vfloat_gt(pass_nc, params.passncmax),
+                           params.passncmax, pass_nc)
+        fixn = self.nc_flux(fluxes.c_into_passive, n_into_passive, pass_nc)
+        state.passivesoiln = state.passivesoiln + (n_into_passive + fixn -
+                                                   n_out_of_passive)
+
+        # Daily increment of soil inorganic N pool, diff btw in and effluxes
+        state.inorgn = state.inorgn + ((fluxes.ngross + fluxes.ninflow +
+                                        fluxes.nurine - fluxes.nimmob -
+                                        fluxes.nloss - fluxes.nuptake) +
+                                       fluxes.nlittrelease)
+
+    def adjust_residence_time_of_slow_pool(self):
+        """ Flexible residence time of the slow pool for priming simulations,
+        see NitrogenSoilFlows.adjust_residence_time_of_slow_pool """
+        params = self.params
+        fluxes = self.fluxes
+
+        # total flux out of the factive pool
+        fluxes.factive = (fluxes.active_to_slow + fluxes.active_to_passive +
+                          fluxes.co2_to_air[4])
+
+        no_flux = vfloat_eq(fluxes.factive, 0.0)
+        residence_time_slow_pool = np.where(
+            no_flux, 1.0 / (params.kdec6 * const.NDAYS_IN_YR),
+            1.0 / params.prime_y * (fluxes.factive /
+                                    (fluxes.factive + params.prime_z)))
+
+        # GDAY uses decay rates rather than residence times, per day
+        params.kdec6 = np.where(no_flux, params.kdec6,
+                                1.0 / residence_time_slow_pool /
+                                const.NDAYS_IN_YR)
+
+        # Save for outputting purposes only
+        fluxes.rtslow = residence_time_slow_pool
+
+    def nc_limit(self, cpool, npool, ncmin, ncmax):
+        """ Release N to 'Inorgn' pool or fix N from 'Inorgn', in order to
+        keep the  N:C ratio of a litter pool within the range 'ncmin' to
+        'ncmax', see NitrogenSoilFlows.nc_limit
+
+        Returns:
+        --------
+        fix/rel : array
+            amount of N to be added/released from the inorganic pool
+
+        """
+        nmax = cpool * ncmax
+        nmin = cpool * ncmin
+
+        release = vfloat_gt(npool, nmax)
+        fix = ~release & vfloat_lt(npool, nmin)
+        rel = npool - nmax
+        fixn = nmin - npool
+        self.fluxes.nlittrelease = np.where(release,
+                                            self.fluxes.nlittrelease + rel,
+                                            np.where(fix,
+                                                     self.fluxes.nlittrelease -
+                                                     fixn,
+                                                     self.fluxes.nlittrelease))
+
+        return np.where(release, -rel, np.where(fix, fixn, 0.0))
+
+    def nc_flux(self, cflux, nflux, nc_ratio):
+        """ N required to be fixed to normalise the N:C ratio of a net flux """
+        return (cflux * nc_ratio) - nflux
+
+    def precision_control(self, tolerance=1E-08):
+        """ Detect very low values in state variables and force to zero to
+        avoid rounding and overflow errors """
+        state = self.state
+        fluxes = self.fluxes
+
+        low = state.metabsurfn < tolerance
+        if low.any():
+            fluxes.n_surf_metab_to_active = np.where(
+                low, state.metabsurfn, fluxes.n_surf_metab_to_active)
+            state.metabsurfn = np.where(low, 0.0, state.metabsurfn)
+
+        low = state.metabsoiln < tolerance
+        if low.any():
+            fluxes.n_soil_metab_to_active = np.where(
+                low, state.metabsoiln, fluxes.n_soil_metab_to_active)
+            state.metabsoiln = np.where(low, 0.0, state.metabsoiln)
+
+
+class EnsembleMatrixCarbonSoilFlows(CarbonSoilMatrix, EnsembleCarbonSoilFlows):
+    """ EnsembleCarbonSoilFlows with the matrix form of the pool update """
+    pass
+
+
+class EnsembleMatrixNitrogenSoilFlows(NitrogenSoilMatrix,
+                                      EnsembleNitrogenSoilFlows):
+    """ EnsembleNitrogenSoilFlows with the matrix form of the pool update """
+    pass
@@ -0,0 +1,269 @@
+""" Array records and helpers for running an ensemble of G'DAY parameter sets
+in lock-step. Everything here mirrors something in utilities.py or the
+default_* modules, but holds one value per ensemble member. """
+
+import types
+import numpy as np
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+def vfloat_eq(arg1, arg2, tol=1E-14):
+    """arg1 == arg2, elementwise version of utilities.float_eq"""
+    return np.abs(arg1 - arg2) < tol + tol * np.abs(arg2)
+
+def vfloat_lt(arg1, arg2, tol=1E-14):
+    """arg1 < arg2, elementwise version of utilities.float_lt"""
+    return arg2 - arg1 > np.abs(arg1) * tol
+
+def vfloat_gt(arg1, arg2, tol=1E-14):
+    """arg1 > arg2, elementwise version of utilities.float_gt"""
+    return arg1 - arg2 > np.abs(arg1) * tol
+
+def vfloat_le(arg1, arg2, tol=1E-14):
+    """arg1 <= arg2, same definition as utilities.float_le"""
+    return vfloat_lt(arg1, arg2)
+
+def vfloat_ge(arg1, arg2, tol=1E-14):
+    """arg1 >= arg2, same definition as utilities.float_ge"""
+    return vfloat_gt(arg1, arg2)
+
+def vclip(value, min, max):
+    """ elementwise version of utilities.clip """
+    value = np.where(value < min, min, value)
+    return np.where(value > max, max, value)
+
+def stack_members(columns):
+    """ Forcing of every member as one array
+
+    Parameters:
+    -----------
+    columns : list of arrays
+        the same met variable for each member
+
+    Returns:
+    --------
+    stacked : array
+        [ndays, nmembers], or just [ndays] if every member has the same
+        values, which broadcasts against the member arrays
+    """
+    first = np.asarray(columns[0], dtype=np.float64)
+    if all(np.array_equal(first, column) for column in columns[1:]):
+        return first
+    stacked = side_by_side(columns)
+    if stacked is not None:
+        return stacked
+    return np.column_stack(columns).astype(np.float64)
+
+def side_by_side(columns):
+    """ Columns which are evenly spaced through one float64 array, e.g. the
+    neighbouring cells of GdayGrid's forcing, as a read-only [ndays, nmembers]
+    view of that array rather than a copy
+
+    Parameters:
+    -----------
+    columns : list of arrays
+        the same met variable for each member
+
+    Returns:
+    --------
+    stacked : array or None
+        [ndays, nmembers] view, None if the columns aren't laid out that way
+    """
+    columns = [np.asarray(column) for column in columns]
+    first = columns[0]
+    base = memory_owner(first)
+    if (first.ndim != 1 or first.dtype != np.float64 or
+        not isinstance(base, np.ndarray)):
+        return None
+    address = [column.__array_interface__['data'][0] for column in columns]
+    step = address[1] - address[0]
+    for (i, column) in enumerate(columns):
+        if (column.dtype != first.dtype or column.shape != first.shape or
+            column.strides != first.strides or
+            memory_owner(column) is not base or
+            address[i] - address[0] != i * step):
+            return None
+
+    return np.lib.stride_tricks.as_strided(first,
+                                           shape=(len(first), len(columns)),
+                                           strides=(first.strides[0], step),
+                                           writeable=False)
+
+def memory_owner(array):
+    """ the array which owns the memory array is a view of """
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array
+
+def is_number(value):
+    """ int or float, but not a logical """
+    return (isinstance(value, (int, long, float)) and
+            not isinstance(value, bool))
+
+def module_values(obj):
+    """ Copy of the data attributes of one of the model modules/objects, i.e.
+    params, state or fluxes once the .cfg file has been applied.
+
+    Parameters:
+    -----------
+    obj : object
+        model params, state or fluxes
+
+    Returns:
+    --------
+    values : dictionary
+        attribute name -> value, lists are copied
+    """
+    values = {}
+    for key in dir(obj):
+        if key.startswith('_') or not hasattr(obj, key):
+            continue
+        value = getattr(obj, key)
+        if isinstance(value, (types.ModuleType, types.FunctionType,
+                              types.BuiltinFunctionType, types.MethodType,
+                              type)):
+            continue
+        if isinstance(value, list):
+            value = list(value)
+        values[key] = value
+    return values
+
+
+class EnsembleRecord(object):
+    """ params, state or fluxes for every member of an ensemble.
+
+    Numeric attributes are float64 arrays with one value per member. When
+    shared is True (params) numbers that are identical in every member are
+    kept as python scalars, so only the perturbed parameters become arrays.
+    Anything else (strings, None, lists) must be the same for every member.
+    """
+    def __init__(self, members, shared=False):
+        """
+        Parameters:
+        ----------
+        members : list of dictionaries
+            attribute values for each member, see module_values
+        shared : logical
+            keep numbers which don't vary between members as scalars
+        """
+        self.nmembers = len(members)
+        keys = set()
+        for values in members:
+            keys.update(values)
+
+        for key in sorted(keys):
+            vals = [values.get(key) for values in members]
+            if all(is_number(v) for v in vals):
+                if shared and all(v == vals[0] for v in vals):
+                    value = vals[0]
+                else:
+                    value = np.array(vals, dtype=np.float64)
+            elif all(v == vals[0] for v in vals):
+                value = vals[0]
+            else:
+                err_msg = ("Ensemble members must share the value of "
+                           "non-numeric variable: %s" % key)
+                raise RuntimeError, err_msg
+            setattr(self, key, value)
+
+    def member(self, index):
+        """ scalar view of one ensemble member """
+        return MemberView(self, index)
+
+
+class MemberView(object):
+    """ Scalar view of one member of an EnsembleRecord.
+
+    Lets the scalar model components (e.g. MateC3, WaterBalance) be used for
+    a single member: reading an array attribute gives that member's value as
+    a python float and assigning a number writes it back into the array. A
+    scalar attribute that is written to becomes an array the first time.
+    """
+    def __init__(self, record, index):
+        """
+        Parameters:
+        ----------
+        record : EnsembleRecord
+            params, state or fluxes of the ensemble
+        index : int
+            ensemble member
+        """
+        object.__setattr__(self, "_record", record)
+        object.__setattr__(self, "_index", index)
+
+    def __getattr__(self, name):
+        value = getattr(self._record, name)
+        if type(value) is np.ndarray and value.ndim == 1:
+            return value.item(self._index)
+        return value
+
+    def __setattr__(self, name, value):
+        record = self._record
+        current = record.__dict__.get(name)
+        if type(current) is np.ndarray and type(value) is float:
+            current[self._index] = value
+            return
+        if not is_number(value):
+            setattr(record, name, value)
+            return
+
+        if not isinstance(current, np.ndarray) or current.ndim != 1:
+            fill = current if is_number(current) else np.nan
+            current = np.empty(record.nmembers)
+            current.fill(fill)
+            setattr(record, name, current)
+        current[self._index] = value
+
+
+class EnsembleMovingAverage(object):
+    """ utilities.SimpleMovingAverage for every member at once.
+
+    The window of each member is a column of a buffer which holds the most
+    recent value in the last row. Entries outside a member's window are kept
+    at zero so the running sum of each column, taken in the same order as
+    sum() over the deque, gives exactly the scalar result.
+    """
+    def __init__(self, window_size, previous_state=None):
+        """
+        Parameters:
+        ----------
+        window_size : int, array
+            window length for each member
+        previous_state : float, array, optional
+            value to fill the window with, e.g. the previous average
+        """
+        self.window_size = np.asarray(window_size, dtype=np.int64)
+        if np.any(self.window_size <= 0):
+            raise RuntimeError, "window_size must be an integer >0"
+        self.nmembers = self.window_size.size
+        self.max_window = int(self.window_size.max())
+        self.data = np.zeros((self.max_window, self.nmembers))
+        self.count = np.zeros(self.nmembers, dtype=np.int64)
+        if previous_state is not None:
+            previous = np.empty(self.nmembers)
+            previous[:] = previous_state
+            for i, size in enumerate(self.window_size):
+                self.data[self.max_window-size:, i] = previous[i]
+            self.count[:] = self.window_size
+
+        # member columns which need an entry zeroed when the window moves on
+        self.short = np.flatnonzero(self.window_size < self.max_window)
+
+    def __call__(self, n):
+        data = self.data
+        data[:-1] = data[1:]
+        data[-1] = n
+        if self.short.size:
+            row = self.max_window - self.window_size[self.short] - 1
+            data[row, self.short] = 0.0
+        self.count = np.minimum(self.count + 1, self.window_size)
+
+        total = np.cumsum(data, axis=0)[-1]
+        return np.where(self.count == 0, 0.0, total / self.count)
+
+    def reset_stream(self):
+        self.data.fill(0.0)
+        self.count.fill(0)
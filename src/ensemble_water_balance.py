@@ -0,0 +1,373 @@
+""" Water balance for an ensemble of parameter sets, see water_balance.py.
+
+Each method follows its scalar counterpart in WaterBalance or PenmanMonteith,
+evaluated for every member at once, so the soil water stores, the
+Penman-Monteith terms and the water fluxes are all arrays with one value per
+member.
+"""
+
+import numpy as np
+import constants as const
+from water_balance import PenmanMonteith, Penman, PriestleyTaylor
+from ensemble_utilities import vfloat_gt, vfloat_le, vclip, stack_members
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+# met forcing and precomputed met quantities used by the water balance
+WATER_MET_VARS = ("co2", "tair", "tam", "tpm", "rain", "vpd_avg", "vpd_am",
+                  "vpd_pm", "wind", "wind_am", "wind_pm", "atmos_press")
+WATER_DERIVED_VARS = ("net_rad_day", "net_rad_am", "net_rad_pm",
+                      "lambda_day", "lambda_am", "lambda_pm",
+                      "slope_day", "slope_am", "slope_pm",
+                      "rho_day", "rho_am", "rho_pm")
+
+
+class EnsembleWaterBalance(object):
+    """ Dynamic water balance model, ensemble version. """
+
+    def __init__(self, control, params, state, fluxes, met):
+        """
+        Parameters
+        ----------
+        control : integers, object
+            model control flags
+        params: EnsembleRecord
+            model parameters
+        state: EnsembleRecord
+            model state
+        fluxes : EnsembleRecord
+            model fluxes
+        met : list of MetForcing
+            meteorological forcing data of each member, including the
+            precomputed met quantities
+        """
+        self.params = params
+        self.fluxes = fluxes
+        self.control = control
+        self.state = state
+        self.nmembers = len(met)
+
+        # the forcing as [ndays, nmembers], or [ndays] where every member
+        # has the same values
+        self.met = {}
+        for var in WATER_MET_VARS:
+            if var in met[0] and met[0][var] is not None:
+                self.met[var] = stack_members([m[var] for m in met])
+        for var in WATER_DERIVED_VARS:
+            self.met[var] = stack_members([m.derived[var] for m in met])
+
+        self.P = EnsemblePenmanMonteith(dz0v_dh=self.params.dz0v_dh,
+                                        displace_ratio=
+                                            self.params.displace_ratio,
+                                        z0h_z0m=self.params.z0h_z0m)
+
+    def calculate_water_balance(self, day, daylen, index=None):
+        """ Calculate water balance, see WaterBalance.calculate_water_balance
+
+        Parameters:
+        ----------
+        day : int
+            project day.
+        daylen : array
+            length of day in hours.
+        index : int, array, optional
+            only update these members, e.g. where the water balance has to be
+            recalculated after GPP was down-regulated
+        """
+        state = self.state
+        fluxes = self.fluxes
+        met = dict((var, values[day]) for (var, values) in
+                   self.met.iteritems())
+        press = met.get("atmos_press")
+
+        met_terms_day = (met["lambda_day"], met["slope_day"], met["rho_day"])
+        met_terms_am = (met["lambda_am"], met["slope_am"], met["rho_am"])
+        met_terms_pm = (met["lambda_pm"], met["slope_pm"], met["rho_pm"])
+
+        out = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # calculate water fluxes
+            if self.control.trans_model == 0:
+                # transpiration calculated from WUE...
+                out["transpiration"] = np.where(vfloat_gt(fluxes.wue, 0.0),
+                                                fluxes.gpp_gCm2 / fluxes.wue,
+                                                0.0)
+            elif self.control.trans_model == 1:
+                penm = self.calc_transpiration_penmon_am_pm
+                (trans_am, omegax_am,
+                 gs_mol_m2_hfday_am,
+                 ga_mol_m2_hfday_am) = penm(met["net_rad_am"], met["wind_am"],
+                                            met["co2"], daylen, press,
+                                            met["vpd_am"], met["tam"],
+                                            fluxes.gpp_am, met_terms_am)
+
+                (trans_pm, omegax_pm,
+                 gs_mol_m2_hfday_pm,
+                 ga_mol_m2_hfday_pm) = penm(met["net_rad_pm"], met["wind_pm"],
+                                            met["co2"], daylen, press,
+                                            met["vpd_pm"], met["tpm"],
+                                            fluxes.gpp_pm, met_terms_pm)
+
+                # Unit conversions...
+                DAY_2_SEC = 1.0 / (60.0 * 60.0 * daylen)
+                out["omega"] = (omegax_am + omegax_pm) / 2.0
+
+                # output in mol H20 m-2 s-1
+                out["gs_mol_m2_sec"] = ((gs_mol_m2_hfday_am +
+                                         gs_mol_m2_hfday_pm) * DAY_2_SEC)
+                out["ga_mol_m2_sec"] = ((ga_mol_m2_hfday_am +
+                                         ga_mol_m2_hfday_pm) * DAY_2_SEC)
+
+                # mm day-1
+                out["transpiration"] = trans_am + trans_pm
+
+            elif self.control.trans_model == 2:
+                P = PriestleyTaylor()
+                out["transpiration"] = P.calc_evaporation(met["net_rad_day"],
+                                                          met["tair"], press,
+                                                          pt_coeff=1.26,
+                                                          met_terms=
+                                                            met_terms_day)
+            if "transpiration" not in out:
+                out["transpiration"] = fluxes.transpiration
+
+            (out["interception"],
+             out["erain"]) = self.calc_infiltration(met["rain"])
+            out["soil_evap"] = self.calc_soil_evaporation(met["tair"],
+                                                          met["net_rad_day"],
+                                                          press, daylen,
+                                                          met_terms_day)
+            out["et"] = (out["transpiration"] + out["soil_evap"] +
+                         out["interception"])
+            self.update_water_storage(out)
+
+        # write back the members being updated
+        for (var, value) in out.iteritems():
+            record = state if var in ("pawater_topsoil", "pawater_root",
+                                      "delta_sw_store") else fluxes
+            value = np.array(np.broadcast_to(value, (self.nmembers,)))
+            current = getattr(record, var)
+            if index is None or not isinstance(current, np.ndarray):
+                setattr(record, var, value)
+            else:
+                current[index] = value[index]
+
+    def calc_infiltration(self, rain):
+        """ Estimate "effective" rain, see WaterBalance.calc_infiltration
+
+        Parameters:
+        -------
+        rain : float, array
+            rainfall [mm d-1]
+
+        Returns:
+        -------
+        interception : array
+            canopy interception [mm d-1]
+        erain : array
+            effective rainfall [mm d-1]
+        """
+        lai = self.state.lai
+        interception = np.where(lai > 0.0,
+                                (rain * self.params.intercep_frac *
+                                 np.minimum(1.0, lai /
+                                            self.params.max_intercep_lai)),
+                                0.0)
+        erain = np.where(lai > 0.0, rain - interception, np.maximum(0.0, rain))
+
+        return (interception, erain)
+
+    def calc_transpiration_penmon_am_pm(self, net_rad, wind, ca, daylen,
+                                        press, vpd, tair, gpp, met_terms):
+        """ Canopy transpiration using the Penman-Monteith equation using am
+        and pm data, see WaterBalance.calc_transpiration_penmon_am_pm
+
+        Returns:
+        --------
+        trans : array
+            transpiration [mm half day-1]
+        omegax : array
+            decoupling coefficient
+        gs_mol_m2_hfday : array
+            stomatal conductance [mol m-2 half day-1]
+        ga_mol_m2_hfday : array
+            canopy boundary layer conductance [mol m-2 half day-1]
+        """
+        canht = self.state.canht
+        half_day = daylen / 2.0
+
+        # time unit conversions
+        SEC_2_HALF_DAY =  60.0 * 60.0 * half_day
+
+        Tk = tair + const.DEG_TO_KELVIN
+        MOL_SEC_2_M_PER_SEC = const.MM_TO_M / (press / (const.RGAS * Tk))
+        M_PER_SEC_2_MOL_SEC = 1.0 / MOL_SEC_2_M_PER_SEC
+
+        ga_m_per_sec = self.P.canopy_boundary_layer_conductance(wind, canht)
+        gs_mol_m2_sec = self.calc_stomatal_conductance(vpd, ca, half_day,
+                                                       gpp)
+
+        # unit conversions
+        ga_mol_m2_hfday = (ga_m_per_sec * M_PER_SEC_2_MOL_SEC *
+                           SEC_2_HALF_DAY)
+        gs_mol_m2_hfday = gs_mol_m2_sec * SEC_2_HALF_DAY
+        gs_m_per_sec = gs_mol_m2_sec * MOL_SEC_2_M_PER_SEC
+
+        (trans,
+         omegax) = self.P.calc_evaporation(vpd, wind, gs_m_per_sec,
+                                           net_rad, tair, press, canht=canht,
+                                           ga=ga_m_per_sec,
+                                           met_terms=met_terms)
+
+        # convert to mm/half day
+        trans = trans * SEC_2_HALF_DAY
+
+        return (trans, omegax, gs_mol_m2_hfday, ga_mol_m2_hfday)
+
+    def calc_stomatal_conductance(self, vpd, ca, daylen, gpp):
+        """ Stomatal conductance [mol m-2 s-1], see
+        WaterBalance.calc_stomatal_conductance """
+        DAY_2_SEC = 1.0 / (60.0 * 60.0 * daylen)
+
+        gpp_umol_m2_sec = (gpp * const.GRAMS_C_TO_MOL_C * const.MOL_TO_UMOL *
+                           DAY_2_SEC)
+
+        arg1 = 1.6 * (1.0 + self.params.g1 * self.state.wtfac_root /
+                      np.sqrt(vpd))
+        arg2 = gpp_umol_m2_sec / ca
+
+        return arg1 * arg2
+
+    def calc_soil_evaporation(self, tavg, net_rad, press, daylen,
+                              met_terms):
+        """ Top soil evaporation [mm d-1], see
+        WaterBalance.calc_soil_evaporation """
+        P = Penman()
+        soil_evap = P.calc_evaporation(net_rad, tavg, press, met_terms)
+
+        # Surface radiation is reduced by overstory LAI cover
+        soil_evap = np.where(vfloat_gt(self.state.lai, 0.0),
+                             soil_evap * np.exp(-0.398 * self.state.lai),
+                             soil_evap)
+
+        # reduce soil evaporation if top soil is dry
+        soil_evap = soil_evap * self.state.wtfac_topsoil
+        tconv = 60.0 * 60.0 * daylen # seconds to day
+
+        return soil_evap * tconv
+
+    def update_water_storage(self, out):
+        """ Root and top soil plant available water and runoff, see
+        WaterBalance.update_water_storage
+
+        Parameters:
+        -----------
+        out : dictionary
+            the days water fluxes, the soil water stores, runoff and any
+            fluxes reset for a dry root zone are added
+        """
+        params = self.params
+        state = self.state
+
+        # reduce transpiration from the top soil if it is dry
+        trans_frac = (params.fractup_soil * state.wtfac_topsoil)
+
+        # Total soil layer
+        pawater_topsoil = (state.pawater_topsoil +
+                           (out["erain"] -
+                            (out["transpiration"] * trans_frac) -
+                            out["soil_evap"]))
+        pawater_topsoil = vclip(pawater_topsoil, 0.0, params.wcapac_topsoil)
+
+        # Total root zone
+        previous = state.pawater_root
+        pawater_root = (state.pawater_root +
+                        (out["erain"] - out["transpiration"] -
+                         out["soil_evap"]))
+
+        # calculate runoff and remove any excess from rootzone
+        excess = pawater_root > params.wcapac_root
+        runoff = np.where(excess, pawater_root - params.wcapac_root, 0.0)
+        pawater_root = np.where(excess, pawater_root - runoff, pawater_root)
+
+        dry = vfloat_le(pawater_root, 0.0)
+        out["transpiration"] = np.where(dry, 0.0, out["transpiration"])
+        out["soil_evap"] = np.where(dry, 0.0, out["soil_evap"])
+        out["et"] = np.where(dry, out["interception"], out["et"])
+
+        pawater_root = vclip(pawater_root, 0.0, params.wcapac_root)
+
+        out["pawater_topsoil"] = pawater_topsoil
+        out["pawater_root"] = pawater_root
+        out["delta_sw_store"] = pawater_root - previous
+        out["runoff"] = runoff
+
+
+class EnsemblePenmanMonteith(PenmanMonteith):
+    """ PenmanMonteith for arrays of conductances and canopy heights """
+
+    def calc_evaporation(self, vpd, wind, gs, net_rad, tavg, press,
+                         canht=None, ga=None, met_terms=None):
+        """ see PenmanMonteith.calc_evaporation
+
+        Returns:
+        --------
+        et : array
+            evapotranspiration [mm d-1]
+        omega : array
+            decoupling coefficient
+        """
+        if press is None:
+            press = self.calc_atmos_pressure()
+
+        if met_terms is None:
+            lambdax = self.calc_latent_heat_of_vapourisation(tavg)
+            slope = self.calc_slope_of_saturation_vapour_pressure_curve(tavg)
+            rho = self.calc_density_of_air(tavg)
+        else:
+            (lambdax, slope, rho) = met_terms
+
+        gamma = self.calc_pyschrometric_constant(lambdax, press)
+        if ga is None:
+            ga = self.canopy_boundary_layer_conductance(wind, canht)
+
+        e = slope / gamma # chg of latent heat relative to sensible heat of air
+        omega = (e + 1.0) / (e + 1.0 + (ga / gs))
+
+        arg1 = ((slope * net_rad ) + (rho * self.cp * vpd * ga))
+        arg2 = slope + gamma * (1.0 + (ga / gs))
+        et = (arg1 / arg2) / lambdax
+
+        has_gs = vfloat_gt(gs, 0.0)
+        return (np.where(has_gs, et, 0.0), np.where(has_gs, omega, 0.0))
+
+    def canopy_boundary_layer_conductance(self, wind, canht):
+        """ see PenmanMonteith.canopy_boundary_layer_conductance
+
+        Returns:
+        --------
+        ga : array
+            canopy boundary layer conductance [m s-1]
+        """
+        z0m = self.dz0v_dh * canht
+        z0h = self.z0h_z0m * z0m
+        d = self.displace_ratio * canht
+
+        arg1 = self.vk**2 * wind
+        arg2 = np.log((canht - d) / z0m)
+        arg3 = np.log((canht - d) / z0h)
+
+        return arg1 / (arg2 * arg3)
+
+    def calc_slope_of_saturation_vapour_pressure_curve(self, tavg):
+        """ see PenmanMonteith.calc_slope_of_saturation_vapour_pressure_curve
+        """
+        t = tavg + 237.3
+        arg1 = 4098.0 * (0.6108 * np.exp((17.27 * tavg) / t))
+        arg2 = np.power(t, 2.0)
+
+        return (arg1 / arg2)
+
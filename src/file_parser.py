@@ -10,71 +10,228 @@ import re
 import os
 import sys
 import keyword
-import default_params as p
-import default_control as c
-import default_state as s
-import default_files as fi
+from collections import OrderedDict
 import default_fluxes
+from records import Control, Params, State, Fluxes, Files
 import ConfigParser
-from utilities import str2boolean
-
-def initialise_model_data(fname, met_header, DUMP=True):
+import numpy as np
+from config_schema import SCHEMA, parse_section, check_override
+from met_forcing import (MetForcing, read_cached_forcing,
+                         write_cached_forcing, file_digest)
+
+# keywords and str methods can't be model attributes
+BAD_WORDS = frozenset(keyword.kwlist)
+BAD_VARS = frozenset(method for method in dir(str) if method[:2]=='__')
+
+# parsed .cfg files by (path, md5 of the contents), oldest first, see
+# read_config
+CONFIG_CACHE = OrderedDict()
+CONFIG_CACHE_SIZE = 32
+
+def initialise_model_data(fname, met_header, DUMP=True, overrides=None,
+                          forcing=None):
     """ Load default model data, met forcing and return
     If there are user supplied input files initialise model with these instead
 
     Parameters:
     ----------
-    fname : string
+    fname : string or ModelConfig
         filename of input options, parameters. Filename should include path!
+        Or a .cfg file already parsed by read_config, which isn't re-read
     met_header : int
             row number of met file header with variable names
     DUMP : logical
         dump a the default parameters to a file
+    overrides : dictionary, optional
+        values applied on top of the .cfg file, see apply_overrides
+    forcing : MetForcing or dictionary, optional
+        met forcing to use rather than reading the met file, or a dictionary
+        of MetForcing by met filename which files are read into, so models
+        using the same met file share one copy of it. Either way the model
+        gets a view of the forcing, see MetForcing.view
 
     Returns:
     --------
     control : integers, object
         model control flags
-    params: floats, object
+    params: Params
         model parameters
-    state: floats, object
+    state: State
         model state
-    fluxes : floats, object
+    fluxes : Fluxes
         model fluxes
-    met_data : floats, dictionary
+    met_data : MetForcing
         meteorological forcing data
 
     """
-    # if this code is run in a monte carlo fashion python doesn't reimport the
-    # modules with each instances! Force it to
-    reload(default_fluxes)
-    reload(s)
-    reload(c)
-    reload(fi)
-    reload(p)
+    # each model gets its own copy of the defaults, nothing is shared
+    params = Params()
+    state = State()
+    control = Control()
+    files = Files()
+    fluxes = Fluxes()
+
+    if isinstance(fname, ModelConfig):
+        config = fname
+    else:
+        config = read_config(fname)
+    if overrides:
+        config = config.derive(overrides)
+
+    # add default cfg fname, dir incase user wants to dump the defaults
+    files.cfg_fname = config.fname
+
+    user_params = config.sections["params"]
+    user_state = config.sections["state"]
+    user_control = config.sections["control"]
+    user_files = config.sections["files"]
+    user_print = config.sections["print"]
+
+    # get driving data
+    met_fname = config.met_fname()
+    if isinstance(forcing, MetForcing):
+        # the model's derived forcing (e.g. daylength) is its own
+        forcing_data = forcing.view()
+    elif forcing is not None:
+        if met_fname not in forcing:
+            forcing[met_fname] = read_met_forcing(met_fname, met_header)
+        forcing_data = forcing[met_fname].view()
+    else:
+        forcing_data = read_met_forcing(met_fname, met_header)
+
+    # adjust the defaults
+    if DUMP == False:
+        params = adjust_object_attributes(user_params, params)
+        state = adjust_object_attributes(user_state, state)
+        control = adjust_object_attributes(user_control, control)
+        files = adjust_object_attributes(user_files, files)
+        if config.overrides:
+            apply_overrides(config.overrides, params, state, control, files)
+
+    return (control, params, state, files, fluxes, forcing_data, user_print)
+
+def read_config(fname):
+    """ Parse a .cfg file, once, so any number of models can be set up from it
+
+    The parsed file is kept and only parsed again if its contents change,
+    the CONFIG_CACHE_SIZE most recently used files are kept.
+
+    Parameters:
+    ----------
+    fname : string
+        filename of input options, parameters. Filename should include path!
+
+    Returns:
+    --------
+    config : ModelConfig
+        the parsed file, without any overrides
+    """
+    # the modification time and size can't be trusted, a file rewritten
+    # between runs (e.g. by adjust_param_file) can keep both
+    try:
+        f = open(fname, "rb")
+        try:
+            key = (os.path.abspath(fname), file_digest(f.read()))
+        finally:
+            f.close()
+    except IOError:
+        key = None
+    if key in CONFIG_CACHE:
+        sections = CONFIG_CACHE.pop(key)
+        CONFIG_CACHE[key] = sections
+        return ModelConfig(fname, sections)
 
     R = ReadConfigFile(fname)
     config_dict = R.load_files()
     (user_control, user_params, user_state,
         user_files, user_fluxes, user_print) = R.get_config_dicts(config_dict)
+    sections = {"control": user_control, "params": user_params,
+                "state": user_state, "files": user_files, "print": user_print}
+    if key is not None:
+        CONFIG_CACHE[key] = sections
+        while len(CONFIG_CACHE) > CONFIG_CACHE_SIZE:
+            CONFIG_CACHE.popitem(last=False)
 
-    # get driving data
-    forcing_data = read_met_forcing(user_files['met_fname'], met_header)
+    return ModelConfig(fname, sections)
 
-    # read in default modules and then adjust these
-    if DUMP == False:
-        params = adjust_object_attributes(user_params, p)
-        state = adjust_object_attributes(user_state, s)
-        control = adjust_object_attributes(user_control, c)
-        files = adjust_object_attributes(user_files, fi)
-    else:
-        params = p
-        state = s
-        control = c
-        files = fi
+class ModelConfig(object):
+    """ A parsed .cfg file plus overrides on top of it.
+
+    Configs derived from one another share the parsed file, only the
+    overrides are copied, so a calibration or sensitivity loop can set up any
+    number of models from one read of the .cfg file, e.g.
 
-    return (control, params, state, files, default_fluxes, forcing_data,
-            user_print)
+        base = read_config(fname)
+        for sla in (4.0, 5.0, 6.0):
+            G = Gday(base.derive({"params.sla": sla}))
+
+    The parsed sections are never changed once read.
+    """
+    def __init__(self, fname, sections, overrides=None):
+        """
+        Parameters:
+        ----------
+        fname : string
+            filename the config was read from
+        sections : dictionary
+            section name -> dictionary of the values in that section, as
+            ReadConfigFile.buid_dict_from_ini_file returns them
+        overrides : dictionary, optional
+            values applied on top of the .cfg file, see apply_overrides
+        """
+        self.fname = fname
+        self.sections = sections
+        self.overrides = dict(overrides) if overrides else {}
+
+    def derive(self, overrides):
+        """ Config with more overrides, which take precedence over any of
+        this config's
+
+        Parameters:
+        ----------
+        overrides : dictionary
+            values applied on top of the .cfg file, see apply_overrides
+
+        Returns:
+        --------
+        config : ModelConfig
+            new config sharing the parsed .cfg file
+        """
+        merged = dict(self.overrides)
+        merged.update(overrides)
+
+        return ModelConfig(self.fname, self.sections, merged)
+
+    def met_fname(self):
+        """ Met forcing file a model set up from the config will read """
+        if "files.met_fname" in self.overrides:
+            return self.overrides["files.met_fname"]
+        return self.sections["files"]['met_fname']
+
+def met_filename(fname, overrides=None):
+    """ Met forcing file a model set up from the .cfg file will read
+
+    Parameters:
+    ----------
+    fname : string or ModelConfig
+        filename of input options, parameters. Filename should include path!
+        Or a .cfg file already parsed by read_config
+    overrides : dictionary, optional
+        values applied on top of the .cfg file, see apply_overrides
+
+    Returns:
+    --------
+    met_fname : string
+        met forcing filename
+    """
+    if isinstance(fname, ModelConfig):
+        return fname.derive(overrides or {}).met_fname()
+    if overrides and "files.met_fname" in overrides:
+        return overrides["files.met_fname"]
+    R = ReadConfigFile(fname)
+    user_files = R.get_config_dicts(R.load_files())[3]
+
+    return user_files['met_fname']
 
 class ReadConfigFile(object):
     """ Read supplied config file (.cfg/.ini).
@@ -108,12 +265,17 @@ class ReadConfigFile(object):
             config = self.Config.read(self.config_file)
         except (ConfigObjError, IOError), e:
             raise IOError('%s' % e)
+        if not config:
+            raise IOError('Could not read .cfg file: "%s"' % self.config_file)
 
         return config
 
     def get_config_dicts(self, config_dict):
         """ reak config dictionary into small dictionaries based on sections.
 
+        Every section is checked against the schema (see config_schema) before
+        any error is raised, so all the bad options are reported at once.
+
         Parameters:
         -----------
         config_dict : dictionary
@@ -131,72 +293,50 @@ class ReadConfigFile(object):
             model fluxes
 
         """
-        user_files = self.buid_dict_from_ini_file("files")
-        user_params = self.buid_dict_from_ini_file("params")
-        user_control = self.buid_dict_from_ini_file("control")
-        user_state = self.buid_dict_from_ini_file("state")
-        user_print_opts = self.buid_dict_from_ini_file("print")
-
-        # add default cfg fname, dir incase user wants to dump the defaults
-        fi.cfg_fname = self.config_file
+        errors = []
+        user_files = self.buid_dict_from_ini_file("files", errors)
+        user_params = self.buid_dict_from_ini_file("params", errors)
+        user_control = self.buid_dict_from_ini_file("control", errors)
+        user_state = self.buid_dict_from_ini_file("state", errors)
+        user_print_opts = self.buid_dict_from_ini_file("print", errors)
+        if errors:
+            err_msg = ('Error reading .cfg file "%s":\n  %s' %
+                       (self.config_file, "\n  ".join(errors)))
+            raise RuntimeError, err_msg
 
         return (user_control, user_params, user_state, user_files,
                 default_fluxes, user_print_opts)
 
-    def buid_dict_from_ini_file(self, section):
+    def buid_dict_from_ini_file(self, section, errors=None):
         """
         Return the .cfg file as a series of dictionaries depending on which section is called.
 
-        the configparser package reads everything as a string, so we have to cast it
-        ourselves. This isn't entriely straightforward, as we need to (i) catch None's,
-        (ii) catch underscores as isalpha() ignores these and (iii) cast float/ints
+        the configparser package reads everything as a string, each option is
+        cast to the type of its default value, see config_schema.
 
         Parameters:
         -----------
         section : string
             Identifier to grab the relevant section from the .cfg file, e.g. "params"
+        errors : list, optional
+            bad options are added to this list, by default they are raised
 
         Returns:
         --------
         d : dictionary
             dictionary containing stuff from the .cfg file.
         """
-        flags = ['model_optroot', "deciduous_model", \
-                 'water_stress', "fixleafnc", "passiveconst", \
-                 "calc_sw_params",'fixed_stem_nc','exudation',\
-                 'adjust_rtslow', 'ncycle', 'output_ascii',\
-                 'frost']
-        flags_up = ["assim_model", "print_options", "alloc_model", \
-                    "ps_pathway","gs_model", "respiration_model"]
-
-        d = {}
-        options = self.Config.options(section)
-        for option in options:
-            try:
-                value = self.Config.get(section, option)
-                if section == "params" or section == "state":
-                    if value.replace('_','').isalpha() and value != "None":
-                        d[option] = value
-                    elif value.replace('_','').isalpha() and value == "None":
-                        d[option] = None
-                    else:
-                        d[option] = float(value)
-                elif section == "control":
-                    if option in flags:
-                        d[option] = str2boolean(value)
-                    elif option in flags_up:
-                        d[option] = value.upper()
-                    elif value.replace('_','').isalpha() and value != "None":
-                        d[option] = value
-                    elif value.replace('_','').isalpha() and value == "None":
-                        d[option] = None
-                    else:
-                        d[option] = int(value)
-                elif section == "print" or section == "files":
-                    d[option] = value
-            except:
-                print("Error reading .Cfg file into dicitonary: %s!" % option)
-                d[option] = None
+        if self.Config.has_section(section):
+            (d, section_errors) = parse_section(section,
+                                                self.Config.items(section))
+        else:
+            (d, section_errors) = ({}, ["[%s] section is missing" % section])
+        if errors is not None:
+            errors.extend(section_errors)
+        elif section_errors:
+            err_msg = ('Error reading .cfg file "%s":\n  %s' %
+                       (self.config_file, "\n  ".join(section_errors)))
+            raise RuntimeError, err_msg
 
         return d
 
@@ -233,10 +373,15 @@ class ReadConfigFile(object):
 #    return data
 #
 
-def read_met_forcing(fname, met_header, comment='#'):
-    """ Read the driving data into a dictionary
+def read_met_forcing(fname, met_header, comment='#', cache=True):
+    """ Read the driving data into a columnar MetForcing object
     method searches for the hash tag followed by prjday in order to build the
-    named dictionary
+    named columns. All the data lines are parsed in one go by numpy rather
+    than calling float() on each cell.
+
+    The first time a met file is read a binary copy is written alongside it
+    (fname + ".cache"), subsequent reads memory-map that instead of parsing
+    the text as long as the met file hasn't changed.
 
     Parameters:
     -----------
@@ -246,27 +391,45 @@ def read_met_forcing(fname, met_header, comment='#'):
             row number of met file header with variable names
     comment : string, optional
         character defining a comment
+    cache : logical, optional
+        read/write the binary sidecar cache
 
     Returns:
     --------
-    data : dictionary
-        met forcing data
+    data : MetForcing
+        met forcing data, behaves like a dictionary of float64 arrays
 
     """
+    if cache:
+        data = read_cached_forcing(fname, met_header, comment)
+        if data is not None:
+            return data
+
     try:
-        data = {}
         f = open(fname, 'r')
-        for line_number, line in enumerate(f):
-            if line_number == met_header:
-                # remove comment tag
-                var_names = re.sub(r'#', ' ', line).lstrip().rstrip().split(",")
-            elif not line.lstrip().startswith("#"):
-                values = [float(i) for i in line.split(",")]
-                for name, value in zip(var_names, values):
-                    data.setdefault(name, []).append(value)
+        text = f.read()
         f.close()
     except IOError:
         raise IOError('Could not read met file: "%s"' % fname)
+    lines = text.splitlines()
+
+    # remove comment tag
+    var_names = re.sub(comment, ' ', lines[met_header]).strip().split(",")
+    rows = [line for line in lines[met_header+1:]
+            if line.strip() and not line.lstrip().startswith(comment)]
+
+    values = np.fromstring(",".join(rows), dtype=np.float64, sep=",")
+    if values.size != len(rows) * len(var_names):
+        err_msg = 'Met file "%s" has rows that don\'t match the header' % fname
+        raise IOError(err_msg)
+
+    # store variable by variable so each column is contiguous
+    columns = values.reshape(len(rows), len(var_names)).T.copy()
+    data = MetForcing(var_names, columns)
+
+    if cache:
+        write_cached_forcing(fname, met_header, comment, file_digest(text),
+                             data)
 
     return data
 
@@ -288,26 +451,12 @@ def adjust_object_attributes(user_dict, obj):
     """
     # check user hasn't specified a parameter we are not expecting...
     # make sure parameters is not named a reserved python word
-    ignore = ['cfg_fname']
-    special = ['topsoil_type', 'rootsoil_type']
-  
-    bad_words = keyword.kwlist
-    bad_vars = [method for method in dir(str) if method[:2]=='__']
     for key, value in user_dict.iteritems():
         #print key, value
-        if key in bad_words:
+        if key in BAD_WORDS or key in BAD_VARS:
             err_msg = "You cant name your parameter anything from:\n\n %s" \
-                            % bad_words
+                            % sorted(BAD_WORDS)
             raise RuntimeError, err_msg
-        elif key in bad_vars:
-            err_msg = "You cant name your parameter anything from:\n\n %s" \
-                           % bad_words
-            raise RuntimeError, err_msg
-        elif key in special and not ignore:
-            setattr(obj, key, value)
-        elif key in ignore and not special:
-            # we need to keep the default location names for the output dump
-            setattr(obj, key, value)
         elif hasattr(obj, key):
             setattr(obj, key, value)
         else:
@@ -315,6 +464,57 @@ def adjust_object_attributes(user_dict, obj):
             raise RuntimeError, err_msg
     return obj
 
+def apply_overrides(overrides, params, state, control, files=None):
+    """ Change model attributes after the .cfg file has been applied, e.g. to
+    run the same .cfg file with a different set of parameters.
+
+    Keys can be given as "params.x", "state.x", "control.x" or "files.x"; an
+    unqualified key is looked for in the params, then state, then control.
+    Values are checked against the .cfg file schema, strings are parsed as
+    they would be in the .cfg file (so "control.ncycle": "false" is False)
+    and anything else must be of the option's type.
+
+    Parameters:
+    -----------
+    overrides : dictionary
+        attribute name -> new value
+    params: object
+        model parameters
+    state: object
+        model state
+    control : object
+        model control flags
+    files : object, optional
+        model input/output filenames
+
+    """
+    objs = {"params": params, "state": state, "control": control}
+    if files is not None:
+        objs["files"] = files
+    errors = []
+    for key in sorted(overrides):
+        if "." in key:
+            (section, name) = key.split(".", 1)
+            if section not in objs or name not in SCHEMA[section]:
+                section = None
+        else:
+            name = key
+            for section in ("params", "state", "control", None):
+                if section is None or name in SCHEMA[section]:
+                    break
+        if section is None:
+            errors.append("%s: not a variable in the model" % key)
+            continue
+        try:
+            value = check_override(section, name, overrides[key])
+        except ValueError, e:
+            errors.append("%s: %s" % (key, e))
+            continue
+        setattr(objs[section], name, value)
+
+    if errors:
+        err_msg = "Error in the overrides:\n  %s" % "\n  ".join(errors)
+        raise RuntimeError, err_msg
 
 
 if __name__ == "__main__":
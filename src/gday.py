@@ -5,23 +5,56 @@ description.
 """
 
 #import ipdb
+import os
 import sys
 from math import fabs
 import constants as const
-from file_parser import initialise_model_data
+from file_parser import (initialise_model_data, read_met_forcing,
+                         apply_overrides)
+from met_precompute import precompute_met_derived
 from plant_growth import PlantGrowth
 from print_outputs import PrintOutput
 from litter_production import Litter
-from soil_cn_model import CarbonSoilFlows, NitrogenSoilFlows
+from soil_cn_model import (CarbonSoilFlows, NitrogenSoilFlows,
+                           MatrixCarbonSoilFlows, MatrixNitrogenSoilFlows,
+                           SoilSteadyState, CPOOLS, NPOOLS)
 from check_balance import CheckBalance
-from utilities import float_eq, calculate_daylength, uniq
+from utilities import (float_eq, float_gt, aitken_limit,
+                       SimpleMovingAverage)
 from phenology import Phenology
 from disturbance import Disturbance
+from checkpoint import write_checkpoint, CheckpointReader, CHECKPOINT_EXT
+from timing import StageTimer
+from spinup_cache import SpinUpCache, spin_up_key
 
 __author__ = "Martin De Kauwe"
 __version__ = "1.0 (15.02.2011)"
 __email__  = "mdekauwe@gmail.com"
 
+# soil organic matter pools projected forward by Gday.extrapolated_spin_up,
+# the litter pools follow the plant too closely to be worth projecting
+SOM_CPOOLS = CPOOLS[4:]
+SOM_NPOOLS = NPOOLS[4:]
+
+
+# N pools and fluxes zeroed at the end of each day when the N cycle is off,
+# see Gday.reset_all_n_pools_and_fluxes (also used by the ensemble)
+N_RESET_STATE = ("shootn", "rootn", "crootn", "branchn", "stemnimm",
+                 "stemnmob", "structsurfn", "metabsurfn", "structsoiln",
+                 "metabsoiln", "activesoiln", "slowsoiln", "passivesoiln",
+                 "inorgn", "stemn", "nstore")
+N_RESET_FLUXES = ("nuptake", "nloss", "npassive", "ngross", "nimmob",
+                  "nlittrelease", "nmineralisation", "npleaf", "nproot",
+                  "npcroot", "npbranch", "npstemimm", "npstemmob",
+                  "deadleafn", "deadrootn", "deadcrootn", "deadbranchn",
+                  "deadstemn", "neaten", "nurine", "leafretransn",
+                  "n_surf_struct_litter", "n_surf_metab_litter",
+                  "n_soil_struct_litter", "n_soil_metab_litter",
+                  "n_surf_struct_to_slow", "n_soil_struct_to_slow",
+                  "n_surf_struct_to_active", "n_soil_struct_to_active",
+                  "n_surf_metab_to_active", "n_active_to_slow",
+                  "n_active_to_passive", "n_slow_to_active",
+                  "n_slow_to_passive", "n_passive_to_active")
 
 class Gday(object):
     """ The G'DAY (Generic Decomposition And Yield) model.
@@ -43,7 +76,8 @@ class Gday(object):
       873-888.
     * And any of the other McMurtrie papers!
     """
-    def __init__(self, fname=None, DUMP=False, spin_up=False, met_header=4):
+    def __init__(self, fname=None, DUMP=False, spin_up=False, met_header=4,
+                 overrides=None, forcing=None, timing=False):
 
         """ Set up model
 
@@ -56,41 +90,55 @@ class Gday(object):
 
         Parameters:
         ----------
-        fname : string
-            filename of model parameters, including path
+        fname : string or ModelConfig
+            filename of model parameters, including path, or a .cfg file
+            already parsed by file_parser.read_config, e.g. to set up many
+            models from one read of the file
         chk_cmd_line : logical
             parse the cmd line?
         DUMP : logical
             dump a the default parameters to a file
         met_header : in
             row number of met file header with variable name
+        overrides : dictionary, optional
+            params/state/control values applied on top of the .cfg file
+        forcing : MetForcing or dictionary, optional
+            met forcing to use rather than reading the met file, see
+            initialise_model_data
+        timing : logical, optional
+            time each stage of the day loop, see self.timer.report()
         Returns:
         -------
         Nothing
             Controlling class of the model, runs things.
 
         """
-        self.day_output = [] # store daily output
         # initialise model structures and read met data
         (self.control, self.params,
          self.state, self.files,
          self.fluxes, self.met_data,
-         self.print_opts) = initialise_model_data(fname, met_header, DUMP=DUMP)
+         self.print_opts) = initialise_model_data(fname, met_header, DUMP=DUMP,
+                                                overrides=overrides,
+                                                forcing=forcing)
 
         # params are defined in per year, needs to be per day
         # Important this is done here as rate constants elsewhere in the code
         # are assumed to be in units of days not years!
         self.correct_rate_constants(output=False)
 
-        # class instance
-        self.cs = CarbonSoilFlows(self.control, self.params, self.state,
-                                  self.fluxes, self.met_data)
+        # calculate everything which only depends on the met forcing for the
+        # whole record up front, rather than every day
+        self.met_data.derived = precompute_met_derived(self.met_data,
+                                                       self.params)
 
-        self.ns = NitrogenSoilFlows(self.control, self.params, self.state,
-                                    self.fluxes, self.met_data)
+        # class instance
+        self.build_soil_model()
 
         self.lf = Litter(self.control, self.params, self.state, self.fluxes)
 
+        # only used by the accelerated spin-up
+        self.ss = None
+
         self.pg = PlantGrowth(self.control, self.params, self.state,
                               self.fluxes, self.met_data)
 
@@ -152,14 +200,131 @@ class Gday(object):
 
         # figure out the number of years for simulation and the number of
         # days in each year
-        self.years = uniq(self.met_data["year"])
-        self.days_in_year = [self.met_data["year"].count(yr)
-                             for yr in self.years]
+        self.years = self.met_data.years
+        self.days_in_year = self.met_data.days_in_year
+
+        # index of the year run_sim starts from, only set when restarting
+        # from a checkpoint part way through the forcing
+        self.start_yr_index = 0
 
         if self.control.water_stress == False:
             sys.stderr.write("**** You have turned off the drought stress")
             sys.stderr.write(", I assume you're debugging??!\n")
-        
+
+        self.timer = None
+        if timing:
+            self.start_timing()
+
+    @classmethod
+    def from_checkpoint(cls, fname, spin_up=False, met_header=4,
+                        overrides=None, append_output=False):
+        """ Restart the model from a checkpoint written by save_checkpoint
+
+        The model carries on from the year after the checkpoint was written,
+        or from the start of the forcing if it was written at the end of it,
+        e.g. after spinning up. The daily output starts a new output file,
+        unless append_output is set, so give a new "files.out_fname" to keep
+        the earlier output.
+
+        Parameters:
+        ----------
+        fname : string
+            checkpoint filename, including path
+        spin_up : logical
+            are we spinning up?
+        met_header : int
+            row number of met file header with variable name
+        overrides : dictionary, optional
+            params/state/control/files values applied on top of the
+            checkpoint, e.g. to fork a different treatment off a spun-up
+            state, see file_parser.apply_overrides. The components are
+            updated to them, see update_components, but the deciduous model
+            can't be switched on or off.
+        append_output : logical, optional
+            add the daily output to the end of the existing output file, which
+            is first cut back to where it had got to when the checkpoint was
+            written (if it is the file the checkpointed run wrote to)
+
+        Returns:
+        -------
+        G : Gday
+            model, as it was when the checkpoint was written
+        """
+        reader = CheckpointReader(fname)
+        (control, params, state,
+         fluxes, files, print_opts) = reader.read_records()
+
+        # overrides are given in the same units as the .cfg file, i.e. per yr
+        per_day = reader.header["rate_constants_per_day"]
+        if overrides:
+            if per_day:
+                correct_rate_constants(params, output=True)
+            deciduous = control.deciduous_model
+            apply_overrides(overrides, params, state, control, files)
+            if control.deciduous_model != deciduous:
+                err_msg = ("The deciduous model can't be switched on or off "
+                           "on restarting from a checkpoint")
+                raise RuntimeError, err_msg
+            per_day = False
+        if not per_day:
+            correct_rate_constants(params, output=False)
+
+        met_data = read_met_forcing(files.met_fname, met_header)
+        met_data.derived = precompute_met_derived(met_data, params)
+        # the columns in the order of the checkpointed run, as unpickling
+        # print_opts doesn't keep the order of the dict
+        print_vars = None
+        if "print_state" in reader.header:
+            print_vars = (reader.header["print_state"],
+                          reader.header["print_fluxes"])
+        # the output file is cut back to where it had got to when the
+        # checkpoint was written, so the days run again aren't written twice
+        truncate_at = None
+        if append_output and files.out_fname == reader.header.get("out_fname"):
+            truncate_at = reader.header["output_end"]
+        pr = PrintOutput(params, state, fluxes, control, files, print_opts,
+                         append=append_output, print_vars=print_vars,
+                         truncate_at=truncate_at)
+
+        G = reader.read_model(met_data, pr)
+        G.rate_constants_per_day = True
+        if overrides:
+            G.update_components()
+        (G.print_state, G.print_fluxes) = pr.get_vars_to_print()
+        G.spin_up = spin_up
+        G.years = met_data.years
+        G.days_in_year = met_data.days_in_year
+        G.timer = None
+
+        return G
+
+    def build_soil_model(self):
+        """ Soil C & N models of the form set by control.soil_model. They
+        only hold values taken from the params, so can be built again when the
+        params change. """
+        if self.control.soil_model == "FLUX":
+            (csoil, nsoil) = (CarbonSoilFlows, NitrogenSoilFlows)
+        elif self.control.soil_model == "MATRIX":
+            (csoil, nsoil) = (MatrixCarbonSoilFlows, MatrixNitrogenSoilFlows)
+        else:
+            err_msg = "Unknown soil model: %s" % self.control.soil_model
+            raise RuntimeError, err_msg
+        self.cs = csoil(self.control, self.params, self.state, self.fluxes,
+                        self.met_data)
+
+        self.ns = nsoil(self.control, self.params, self.state, self.fluxes,
+                        self.met_data)
+
+    def update_components(self):
+        """ Bring the model components up to date with changed params and
+        control flags, e.g. overrides applied to a checkpoint, so the run
+        carries on as a model built with them would. The components keep
+        their run state, e.g. the growth stress history. """
+        self.build_soil_model()
+        self.pg.update_parameters()
+        if self.control.deciduous_model:
+            self.P.store_transfer_len = self.params.store_transfer_len
+
     def run_sim(self):
         """ Run model simulation! """
         # local variable
@@ -171,14 +336,29 @@ class Gday(object):
             self.db.initialise(years)
 
         
+        # start from the beginning of the forcing unless we are restarting
+        # from a checkpoint
+        start = self.start_yr_index
+        self.start_yr_index = 0
+
+        save_output = (self.control.print_options == "DAILY" and
+                       not self.spin_up)
+
+        # the control flags don't change within a run (the spin-up changes
+        # some between runs), so they are only looked up once
+        deciduous = self.control.deciduous_model
+        disturbance = self.control.disturbance != 0
+        hurricane = self.control.hurricane == 1
+        ncycle_off = self.control.ncycle == False
+        can_die = not deciduous and not disturbance
+
         # ===================== #
         #   Y E A R   L O O P   #
         # ===================== #
-        project_day = 0
-        for i, yr in enumerate(years):
-            self.day_output = [] # empty daily storage list for outpu
-            daylen = calculate_daylength(days_in_year[i], self.params.latitude)
-            if self.control.deciduous_model:
+        project_day = sum(days_in_year[:start])
+        for i, yr in enumerate(years[start:], start):
+            daylen = self.met_data.derived["daylen"][self.met_data.year_slice(yr)]
+            if deciduous:
                 self.P.calculate_phenology_flows(daylen, self.met_data,
                                             days_in_year[i], project_day)
 
@@ -198,11 +378,10 @@ class Gday(object):
                 
                 
                 # Fire Disturbance?
-                if (self.control.disturbance != 0 and
-                    self.params.disturbance_doy == doy):
+                if disturbance and self.params.disturbance_doy == doy:
                     self.db.check_for_fire(yr, self.pg)
                 # Hurricane?
-                elif (self.control.hurricane == 1 and
+                elif (hurricane and
                       self.params.hurricane_yr == yr and
                       self.params.hurricane_doy == doy):
                     self.db.hurricane()
@@ -216,8 +395,10 @@ class Gday(object):
                 # soil C & N calculation
                 self.cs.calculate_csoil_flows(project_day, doy)
                 self.ns.calculate_nsoil_flows(project_day, doy)
+                if self.ss is not None:
+                    self.ss.accumulate()
 
-                if self.control.ncycle == False:
+                if ncycle_off:
                     # Turn off all N calculations
                     self.reset_all_n_pools_and_fluxes()
 
@@ -226,8 +407,7 @@ class Gday(object):
 
                 # checking if we died during the timestep
                 #   - added for desert simulation
-                if (not self.control.deciduous_model and
-                    self.control.disturbance == 0):
+                if can_die:
                     self.are_we_dead()
 
                 #print self.state.plantc, self.state.soilc
@@ -237,8 +417,8 @@ class Gday(object):
                 # ======================= #
                 #   E N D   O F   D A Y   #
                 # ======================= #
-                if not self.spin_up:
-                    self.save_daily_outputs(yr, doy+1)
+                if save_output:
+                    self.pr.save_daily_outputs(yr, doy+1)
 
                 # check the daily water balance
                 #self.cb.check_water_balance(project_day)
@@ -250,7 +430,7 @@ class Gday(object):
             # ========================= #
             
             # Allocate stored C&N for the following year
-            if self.control.deciduous_model:
+            if deciduous:
                 # Using average alloc fracs across growing season instead
                 #self.pg.calc_carbon_allocation_fracs(0.0) #comment this!!
                 self.pg.calculate_average_alloc_fractions(self.P.growing_seas_len)
@@ -266,13 +446,19 @@ class Gday(object):
                 
             # GDAY died in the previous year, re-establish gday for the next yr
             #   - added for desert simulation
-            if (self.dead and not
-                self.control.deciduous_model and
-                self.control.disturbance == 0):
+            if self.dead and can_die:
                 self.re_establish_gday()
 
-            if self.control.print_options == "DAILY" and not self.spin_up:
-                self.print_output_file()
+            if (self.control.checkpoint_freq > 0 and
+                (i + 1) % self.control.checkpoint_freq == 0):
+                # restart from the following year, or the start of the
+                # forcing if this was the last year
+                self.start_yr_index = (i + 1) % len(years)
+                self.save_checkpoint()
+                self.start_yr_index = 0
+
+            if self.timer is not None:
+                self.timer.end_year(yr)
                 
         # close output file
         if self.control.print_options == "END" and not self.spin_up:
@@ -283,8 +469,7 @@ class Gday(object):
         if self.spin_up:
             return (yr, doy+1)
         else:
-            # Need to pass the project day to calculate NROWS for .hdr file
-            self.pr.clean_up(project_day)
+            self.pr.clean_up()
         
     def are_we_dead(self):
         """ Simplistic scheme to allow GDAY to die and re-establish the
@@ -357,12 +542,34 @@ class Gday(object):
             self.state.sapwood = 0.001
         print "re-seeding"
 
-    def spin_up_pools(self, tol=5E-03):
+    def spin_up_pools(self, tol=5E-03, accelerate=False, cache_dir=None,
+                      extrapolate=False):
         """ Spin up model plant & soil pools to equilibrium.
 
         - Examine sequences of 50 years and check if C pools are changing
           by more than 0.005 units per 1000 yrs. Note this check is done in
           units of: kg m-2.
+        - If accelerate is set, the soil pools are first put at their
+          steady state (see accelerate_soil_spin_up), the 1000 yr sequences
+          then just verify the equilibrium, typically taking one or two.
+        - If extrapolate is set, convergence is checked after every cycle of
+          the forcing and the soil pools are jumped ahead to their projected
+          equilibrium, see extrapolated_spin_up.
+        - If a cache directory is given and an earlier spin-up had exactly
+          the same inputs, its spun-up state is used rather than spinning up
+          again, see spinup_cache.py.
+
+        Parameters:
+        -----------
+        tol : float
+            convergence tolerance [kg m-2 per 1000 yrs]
+        accelerate : logical
+            solve for the soil steady state, not used with disturbance
+        cache_dir : string, optional
+            directory of spun-up states, defaults to files.spinup_cache_dir,
+            "" to always spin up
+        extrapolate : logical
+            project the soil pools forward, not used with disturbance
 
         References:
         ----------
@@ -370,6 +577,79 @@ class Gday(object):
         * Murty, D and McMurtrie, R. E. (2000) Ecological Modelling, 134,
           185-205, specifically page 196.
         """
+        if cache_dir is None:
+            cache_dir = self.files.spinup_cache_dir
+
+        spun_up = None
+        if cache_dir:
+            cache = SpinUpCache(cache_dir)
+            key = spin_up_key(self.control, self.params, self.state,
+                              self.met_data, (tol, accelerate, extrapolate))
+            spun_up = cache.load(key, self.met_data, self.pr)
+
+        if spun_up is None:
+            (yr, doy) = self.equilibrate_pools(tol, accelerate, extrapolate)
+            if cache_dir:
+                cache.store(key, self)
+        else:
+            # same inputs as an earlier spin-up, so carry on from its end
+            self.restore_spun_up(spun_up)
+            (yr, doy) = (self.years[-1], self.days_in_year[-1])
+            msg = "Spinup: using the spun-up state in %s\n" % cache.fname(key)
+            sys.stderr.write(msg)
+
+        if self.control.print_options == "DAILY":
+            self.save_daily_outputs(yr, doy)
+        self.pr.clean_up()
+        self.print_output_file()
+
+    def restore_spun_up(self, spun_up):
+        """ Put the model where an earlier spin-up with the same inputs
+        left it, i.e. the params (which change during a run, e.g. sla), the
+        state, the fluxes and the run state of the components, e.g. the
+        growth stress history. The records are copied into the model's own,
+        so the components keep pointing at them.
+
+        Parameters:
+        -----------
+        spun_up : Gday
+            the model at the end of the earlier spin-up, see SpinUpCache.load
+        """
+        for name in ("control", "params", "state", "fluxes"):
+            record = getattr(spun_up, name)
+            getattr(self, name).__setstate__(record.__getstate__())
+        self.rate_constants_per_day = spun_up.rate_constants_per_day
+        self.dead = spun_up.dead
+
+        self.pg.window_size = spun_up.pg.window_size
+        self.pg.sma = SimpleMovingAverage(spun_up.pg.sma.window_size)
+        self.pg.sma.data.extend(spun_up.pg.sma.data)
+        if self.control.deciduous_model:
+            for (name, value) in spun_up.P.__dict__.iteritems():
+                if name not in ("fluxes", "state", "control"):
+                    setattr(self.P, name, value)
+
+    def equilibrate_pools(self, tol=5E-03, accelerate=False,
+                          extrapolate=False):
+        """ Cycle the forcing until the C pools are at equilibrium, see
+        spin_up_pools
+
+        Parameters:
+        -----------
+        tol : float
+            convergence tolerance [kg m-2 per 1000 yrs]
+        accelerate : logical
+            solve for the soil steady state, not used with disturbance
+        extrapolate : logical
+            project the soil pools forward, not used with disturbance
+
+        Returns:
+        --------
+        yr : float
+            last year run
+        doy : int
+            last day run
+        """
         prev_plantc = 99999.9
         prev_soilc = 99999.9
 
@@ -400,6 +680,10 @@ class Gday(object):
                     msg = "Spinup: Soil C - %f\n" % (self.state.soilc)
                     sys.stderr.write(msg)
         else:
+            if accelerate:
+                self.accelerate_soil_spin_up(tol)
+            if extrapolate:
+                return self.extrapolated_spin_up(tol)
 
             while True:
                 if (fabs((prev_plantc*conv) - (self.state.plantc*conv)) < tol and
@@ -418,21 +702,220 @@ class Gday(object):
                           (self.state.plantc, self.state.soilc)
                     sys.stderr.write(msg)
 
-        self.save_daily_outputs(yr, doy)
-        self.pr.clean_up()
-        self.print_output_file()
+        return (yr, doy)
+
+    def extrapolated_spin_up(self, tol=5E-03, ratio_tol=0.1):
+        """ Spin up one cycle of the forcing at a time, jumping the soil
+        pools ahead to their equilibrium.
+
+        Near equilibrium each soil pool approaches its steady state
+        geometrically from one forcing cycle to the next, so once the last
+        four cycles show a steady ratio of successive changes, the limit of
+        the sequence is estimated (Aitken's delta-squared) and the pool is put
+        there, with its N scaled to keep its N:C ratio. The pools then carry
+        on from there until they are projected again or have converged.
+        Convergence is checked after every cycle, on the change over the last
+        20 cycles (since any projection larger than the tolerance), as the 20
+        cycle blocks of spin_up_pools check it, so the spin-up stops within a
+        cycle of reaching equilibrium rather than within 1000 years of it. A
+        single cycle isn't enough, the pools can swing from one to the next.
+
+        Each projection is kept in self.spin_up_projections, as (cycle, pool
+        values before, projected values) and the projected and achieved
+        equilibria are reported at the end.
+
+        Parameters:
+        -----------
+        tol : float
+            convergence tolerance [kg m-2 per 1000 yrs]
+        ratio_tol : float
+            how steady the ratio of the changes has to be, see
+            utilities.aitken_limit
+
+        Returns:
+        --------
+        yr : float
+            last year run
+        doy : int
+            last day run
+        """
+        conv = const.TONNES_HA_2_KG_M2
+        # cycles in the blocks of spin_up_pools
+        block = 20
+
+        # plant & soil C at the start and end of each cycle since the last
+        # projection
+        totals = [(self.state.plantc, self.state.soilc)]
+        history = [] # SOM C pools at the end of each cycle
+        self.spin_up_projections = []
+        ncycles = 0
+        while True:
+            (yr, doy) = self.run_sim() # run the model...
+            ncycles += 1
+            totals.append((self.state.plantc, self.state.soilc))
+            totals = totals[-(block + 1):]
+            if (len(totals) > block and
+                fabs((totals[0][0]*conv) - (self.state.plantc*conv)) < tol and
+                fabs((totals[0][1]*conv) - (self.state.soilc*conv)) < tol):
+                break
+
+            history.append([getattr(self.state, p) for p in SOM_CPOOLS])
+            history = history[-4:]
+            if len(history) == 4:
+                projected = [aitken_limit(values, ratio_tol)
+                             for values in zip(*history)]
+                if any(c is not None for c in projected):
+                    self.spin_up_projections.append((ncycles, history[-1],
+                                                     projected))
+                    soilc = self.state.soilc
+                    self.jump_soil_pools(projected)
+                    history = []
+                    # a jump within the tolerance doesn't spoil the check
+                    if fabs((soilc*conv) - (self.state.soilc*conv)) >= tol:
+                        totals = [(self.state.plantc, self.state.soilc)]
+
+            msg = "Spinup (cycle %d): Plant C - %f, Soil C - %f\n" % \
+                  (ncycles, self.state.plantc, self.state.soilc)
+            sys.stderr.write(msg)
+
+        if self.spin_up_projections:
+            (cycle, before, projected) = self.spin_up_projections[-1]
+            for (i, name) in enumerate(SOM_CPOOLS):
+                if projected[i] is not None:
+                    msg = ("Spinup: %s projected at cycle %d - %f, achieved "
+                           "at cycle %d - %f\n" %
+                           (name, cycle, projected[i], ncycles,
+                            getattr(self.state, name)))
+                    sys.stderr.write(msg)
+
+        return (yr, doy)
+
+    def jump_soil_pools(self, cpools):
+        """ Put the soil C pools at new values, the N pools are scaled to keep
+        each pools N:C ratio
+
+        Parameters:
+        -----------
+        cpools : list
+            C in each pool [t/ha], in the order of SOM_CPOOLS, None leaves the
+            pool as it is
+        """
+        state = self.state
+        for (cname, nname, c) in zip(SOM_CPOOLS, SOM_NPOOLS, cpools):
+            if c is None or not float_gt(c, 0.0):
+                continue
+            old_c = getattr(state, cname)
+            if float_gt(old_c, 0.0):
+                setattr(state, nname, getattr(state, nname) * c / old_c)
+            setattr(state, cname, c)
+        self.day_end_calculations(INIT=True)
+
+    def accelerate_soil_spin_up(self, tol=5E-03, max_cycles=20):
+        """ Put the soil C & N pools at their (approximate) steady state.
+
+        The plant is spun up first by cycling the forcing until plant C stops
+        changing, then the mean litter inputs and decay rates of a cycle are
+        used to solve for the steady state of the soil pools, see
+        SoilSteadyState. As the litter inputs respond to the soil N this is
+        repeated until the solved soil C settles down.
+
+        Parameters:
+        -----------
+        tol : float
+            convergence tolerance [kg m-2 per 1000 yrs]
+        max_cycles : int
+            maximum number of forcing cycles for each of the two stages
+        """
+        conv = const.TONNES_HA_2_KG_M2
+        cycle_tol = tol * len(self.years) / 1000.0
+
+        # plant spin-up
+        prev_plantc = 99999.9
+        for spin_num in xrange(max_cycles):
+            self.run_sim()
+            if fabs((prev_plantc*conv) - (self.state.plantc*conv)) < cycle_tol:
+                break
+            prev_plantc = self.state.plantc
+
+        # soil steady state
+        self.ss = SoilSteadyState(self.control, self.params, self.state,
+                                  self.fluxes)
+        prev_soilc = 99999.9
+        for spin_num in xrange(max_cycles):
+            self.ss.reset()
+            self.run_sim()
+            cpools = self.ss.solve()
+            self.ss.set_pools(cpools)
+            self.day_end_calculations(INIT=True)
+
+            msg = "Spinup (steady state): Plant C - %f, Soil C - %f\n" % \
+                  (self.state.plantc, self.state.soilc)
+            sys.stderr.write(msg)
+            if fabs((prev_soilc*conv) - (self.state.soilc*conv)) < tol:
+                break
+            prev_soilc = self.state.soilc
+        self.ss = None
+
+    def save_checkpoint(self, fname=None):
+        """ Write a binary checkpoint of the complete model, which
+        Gday.from_checkpoint can restart from.
+
+        Parameters:
+        -----------
+        fname : string, optional
+            checkpoint filename, defaults to files.checkpoint_fname or if that
+            isn't set the output filename with a .chk extension
+        """
+        if fname is None:
+            fname = self.files.checkpoint_fname
+        if not fname:
+            fname = os.path.splitext(self.files.out_fname)[0] + CHECKPOINT_EXT
+
+        header = {"met_fname": self.files.met_fname,
+                  "start_yr_index": self.start_yr_index,
+                  "rate_constants_per_day": self.rate_constants_per_day,
+                  "print_state": list(self.print_state),
+                  "print_fluxes": list(self.print_fluxes),
+                  "out_fname": self.files.out_fname,
+                  # the output file holds everything up to the checkpoint
+                  "output_end": self.pr.output_end()}
+
+        # the timed methods can't be pickled
+        timer = self.timer
+        if timer is not None:
+            timer.detach()
+            self.timer = None
+        try:
+            write_checkpoint(fname, self, header)
+        finally:
+            if timer is not None:
+                self.timer = timer
+                timer.attach(self)
+
+    def start_timing(self):
+        """ Time each stage of the day loop from now on, see
+        timing.StageTimer
+
+        Returns:
+        --------
+        timer : StageTimer
+            accumulated times, also kept as self.timer
+        """
+        if self.timer is None:
+            self.timer = StageTimer()
+        self.timer.attach(self)
+
+        return self.timer
 
     def print_output_file(self):
-        """ Either print the daily output file (at the end of the year) or
-        print the final state + param file. """
+        """ Either print the daily output file or print the final state +
+        param file. """
 
-        # print the daily output file, this is done once at the end of each yr
+        # write out any buffered daily output, otherwise this is done
+        # whenever the output buffer fills up
         if self.control.print_options == "DAILY":
-            if self.control.output_ascii:
-                self.pr.write_daily_outputs_file(self.day_output) 
-            else:
-                self.pr.write_daily_outputs_file_to_binary(self.day_output) 
-            
+            self.pr.flush()
+
         # print the final state
         elif self.control.print_options == "END":
             if not self.control.deciduous_model:
@@ -476,19 +959,8 @@ class Gday(object):
         
     def correct_rate_constants(self, output=False):
         """ adjust rate constants for the number of days in years """
-        time_constants = ['rateuptake', 'rateloss', 'retransmob',
-                          'fdecay', 'fdecaydry', 'crdecay','rdecay',
-                          'rdecaydry', 'bdecay', 'wdecay', 'sapturnover',
-                          'kdec1', 'kdec2', 'kdec3', 'kdec4', 'kdec5', 'kdec6',
-                          'kdec7', 'nuptakez','nmax', 'adapt']
-        conv = const.NDAYS_IN_YR
-
-        if output == False:
-            for i in time_constants:
-                setattr(self.params, i, getattr(self.params, i) / conv)
-        else:
-            for i in time_constants:
-                setattr(self.params, i, getattr(self.params, i) * conv)
+        correct_rate_constants(self.params, output=output)
+        self.rate_constants_per_day = not output
 
     def day_end_calculations(self, days_in_year=None, INIT=False):
         """Calculate derived values from state variables.
@@ -554,87 +1026,55 @@ class Gday(object):
             self.state.age += 1.0 / days_in_year
 
     def save_daily_outputs(self, year, doy):
-        """ Save the daily fluxes + state in a big list.
-
-        This should be a more efficient way to write the daily output in a
-        single step at the end of the year.
+        """ Save the daily fluxes + state, see PrintOutput.save_daily_outputs
 
         Parameters:
         -----------
-        project_day : integer
-            simulation day
+        year : float
+            simulation year
+        doy : integer
+            day of year
         """
-        output = [year, doy]
-        output.extend(getattr(self.state, var) for var in self.print_state)
-        output.extend(getattr(self.fluxes, var) for var in self.print_fluxes)
-        self.day_output.append(output)
+        self.pr.save_daily_outputs(year, doy)
        
     def reset_all_n_pools_and_fluxes(self):
         """ If the N-Cycle is turned off the way I am implementing this is to
         do all the calculations and then reset everything at the end. This is a
         waste of resources but saves on multiple IF statements.
         """
-        # State
-        self.state.shootn = 0.0
-        self.state.rootn = 0.0
-        self.state.crootn = 0.0
-        self.state.branchn = 0.0
-        self.state.stemnimm = 0.0
-        self.state.stemnmob = 0.0
-        self.state.structsurfn = 0.0
-        self.state.metabsurfn = 0.0
-        self.state.structsoiln = 0.0
-        self.state.metabsoiln = 0.0
-        self.state.activesoiln = 0.0
-        self.state.slowsoiln = 0.0
-        self.state.passivesoiln = 0.0
-        self.state.inorgn = 0.0
-        self.state.stemn = 0.0
-        self.state.stemnimm = 0.0
-        self.state.stemnmob = 0.0
-        self.state.nstore = 0.0
+        for var in N_RESET_STATE:
+            setattr(self.state, var, 0.0)
+        for var in N_RESET_FLUXES:
+            setattr(self.fluxes, var, 0.0)
+
+
 
-        # Fluxes
-        self.fluxes.nuptake = 0.0
-        self.fluxes.nloss = 0.0
-        self.fluxes.npassive = 0.0
-        self.fluxes.ngross = 0.0
-        self.fluxes.nimmob = 0.0
-        self.fluxes.nlittrelease = 0.0
-        self.fluxes.nmineralisation = 0.0
-        self.fluxes.npleaf = 0.0
-        self.fluxes.nproot = 0.0
-        self.fluxes.npcroot = 0.0
-        self.fluxes.npbranch = 0.0
-        self.fluxes.npstemimm = 0.0
-        self.fluxes.npstemmob = 0.0
-        self.fluxes.deadleafn = 0.0
-        self.fluxes.deadrootn = 0.0
-        self.fluxes.deadcrootn = 0.0
-        self.fluxes.deadbranchn = 0.0
-        self.fluxes.deadstemn = 0.0
-        self.fluxes.neaten = 0.0
-        self.fluxes.nurine = 0.0
-        self.fluxes.leafretransn = 0.0
-        self.fluxes.n_surf_struct_litter = 0.0
-        self.fluxes.n_surf_metab_litter = 0.0
-        self.fluxes.n_soil_struct_litter = 0.0
-        self.fluxes.n_soil_metab_litter = 0.0
-        self.fluxes.n_surf_struct_to_slow = 0.0
-        self.fluxes.n_soil_struct_to_slow = 0.0
-        self.fluxes.n_surf_struct_to_active = 0.0
-        self.fluxes.n_soil_struct_to_active = 0.0
-        self.fluxes.n_surf_metab_to_active = 0.0
-        self.fluxes.n_surf_metab_to_active = 0.0
-        self.fluxes.n_active_to_slow = 0.0
-        self.fluxes.n_active_to_passive = 0.0
-        self.fluxes.n_slow_to_active = 0.0
-        self.fluxes.n_slow_to_passive = 0.0
-        self.fluxes.n_passive_to_active = 0.0
-
-
-
-def main():
+def correct_rate_constants(params, output=False):
+    """ adjust rate constants for the number of days in years
+
+    Parameters:
+    -----------
+    params: floats, object
+        model parameters
+    output : logical
+        convert back from per day to per year, i.e. before saving the state
+    """
+    time_constants = ['rateuptake', 'rateloss', 'retransmob',
+                      'fdecay', 'fdecaydry', 'crdecay','rdecay',
+                      'rdecaydry', 'bdecay', 'wdecay', 'sapturnover',
+                      'kdec1', 'kdec2', 'kdec3', 'kdec4', 'kdec5', 'kdec6',
+                      'kdec7', 'nuptakez','nmax', 'adapt']
+    conv = const.NDAYS_IN_YR
+
+    if output == False:
+        for i in time_constants:
+            setattr(params, i, getattr(params, i) / conv)
+    else:
+        for i in time_constants:
+            setattr(params, i, getattr(params, i) * conv)
+
+
+def main(timing=False):
     """ run a test case of the gday model """
 
     # pylint: disable=C0103
@@ -646,12 +1086,14 @@ def main():
 
     fname = "../example/params/testing.cfg"
 
-    G = Gday(fname)
+    G = Gday(fname, timing=timing)
     G.run_sim()
 
     end_time = time.time()
     sys.stderr.write("\nTotal simulation time: %.3f seconds\n\n" %
                                                     (end_time - start_time))
+    if timing:
+        sys.stderr.write(G.timer.report(by_year=True))
 
 
 def profile_main():
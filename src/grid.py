@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+""" Run G'DAY over many grid cells in one process.
+
+Each cell has its own met forcing and parameters (e.g. soil texture), given
+as overrides on top of a shared .cfg file, e.g.
+
+    cells = [{"files.met_fname": "met/cell_0001.csv",
+              "params.latitude": -33.6, "params.finesoil": 0.4}, ...]
+    G = GdayGrid(fname, cells)
+    output = G.run_sim()
+    output["lai"] # -> array of shape (ndays, ncells)
+
+The forcing of every cell is held in one array, G.forcing [ncells, ndays,
+nvars], each met file is only read once however many cells use it. Cells
+which share their control flags are run together as one GdayEnsemble, so each
+day is evaluated for every cell of a group at once.
+"""
+
+import numpy as np
+from file_parser import initialise_model_data, read_config, ModelConfig
+from met_forcing import MetForcing
+from ensemble import GdayEnsemble
+from ensemble_utilities import module_values
+from utilities import daylength_tables
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+class GdayGrid(object):
+    """ Grid cells grouped by their control flags, each group is run as a
+    GdayEnsemble. Each cell gives exactly what a Gday run of the same .cfg
+    file with the same overrides would. """
+    def __init__(self, fname, cells, met_header=4):
+        """ Set up the grid
+
+        Parameters:
+        ----------
+        fname : string or ModelConfig
+            filename of model parameters, including path, or the parsed
+            .cfg file, see file_parser.read_config
+        cells : list of dictionaries
+            one dictionary of files/params/state/control values for each
+            cell, see file_parser.apply_overrides
+        met_header : int
+            row number of met file header with variable name
+        """
+        if len(cells) == 0:
+            raise RuntimeError, "Grid needs at least one cell"
+
+        self.ncells = len(cells)
+        if not isinstance(fname, ModelConfig):
+            fname = read_config(fname)
+
+        # read each met file once and sort the cells by their control flags
+        met_files = {}
+        cell_met = []
+        latitudes = []
+        groups = {}
+        for i, cell in enumerate(cells):
+            (control, params, state,
+             files, fluxes, met_data,
+             print_opts) = initialise_model_data(fname, met_header,
+                                                 DUMP=False, overrides=cell,
+                                                 forcing=met_files)
+            key = tuple(sorted(module_values(control).iteritems()))
+            groups.setdefault(key, []).append(i)
+            cell_met.append(met_data)
+            latitudes.append(params.latitude)
+        self.groups = [groups[key] for key in sorted(groups)]
+
+        self.forcing = self.gather_forcing(cell_met)
+
+        # daylength of every cell in one go, the cells pick it up from the
+        # cache when their derived forcing is calculated
+        for yr_days in set(cell_met[0].days_in_year):
+            daylength_tables(yr_days, np.unique(latitudes))
+
+        self.ensembles = [GdayEnsemble(fname, [cells[i] for i in index],
+                                       met_header,
+                                       forcing=[self.met[i] for i in index])
+                          for index in self.groups]
+
+    def gather_forcing(self, cell_met):
+        """ Copy the forcing of every cell into one array
+
+        The cells are the last (contiguous) axis of the array, so for each
+        variable the forcing of the cells of a group is a strided view which
+        the vectorised model uses without making its own copy, see
+        ensemble_utilities.stack_members.
+
+        Parameters:
+        ----------
+        cell_met : list of MetForcing
+            met forcing of each cell
+
+        Returns:
+        --------
+        forcing : array
+            [ncells, ndays, nvars] view of the forcing, in the order of
+            self.var_names
+        """
+        first = cell_met[0]
+        self.var_names = first.var_names
+        for i, met_data in enumerate(cell_met):
+            if (met_data.years != first.years or
+                met_data.days_in_year != first.days_in_year):
+                err_msg = ("Grid cell %d doesn't have the same years of "
+                           "forcing as the first cell" % i)
+                raise RuntimeError, err_msg
+            missing = set(self.var_names) - set(met_data.var_names)
+            if missing:
+                err_msg = ("Grid cell %d forcing doesn't have %s" %
+                           (i, ", ".join(sorted(missing))))
+                raise RuntimeError, err_msg
+
+        columns = np.empty((len(self.var_names), first.nrecords, self.ncells))
+        for (i, met_data) in enumerate(cell_met):
+            for (j, var) in enumerate(self.var_names):
+                columns[j,:,i] = met_data[var]
+        self.met = [MetForcing(self.var_names, columns[:,:,i])
+                    for i in xrange(self.ncells)]
+
+        return columns.transpose(2, 1, 0)
+
+    def run_sim(self):
+        """ Run model simulation!
+
+        Returns:
+        --------
+        output : dictionary
+            "year", "doy" and for each output variable an array of shape
+            (ndays, ncells)
+        """
+        output = None
+        for (index, E) in zip(self.groups, self.ensembles):
+            group_output = E.run_sim()
+            if output is None:
+                output = {"year": group_output["year"],
+                          "doy": group_output["doy"]}
+                out_vars = sorted(set(group_output) - set(output))
+                ndays = len(output["year"])
+                for var in out_vars:
+                    output[var] = np.empty((ndays, self.ncells))
+            for var in out_vars:
+                output[var][:,index] = group_output[var]
+
+        return output
+
+    def state(self, names):
+        """ State of every cell, e.g. at the end of run_sim
+
+        Parameters:
+        ----------
+        names : list of strings
+            state variables, e.g. the soil pools
+
+        Returns:
+        --------
+        state : array
+            [ncells, len(names)]
+        """
+        state = np.empty((self.ncells, len(names)))
+        for (index, E) in zip(self.groups, self.ensembles):
+            for (j, name) in enumerate(names):
+                state[index,j] = getattr(E.state, name)
+
+        return state
@@ -2,14 +2,21 @@
 """ Model Any Terrestrial Ecosystem (MATE) model. Full description below """
 
 from math import exp, sqrt, sin, pi
+import numpy as np
 import constants as const
 from utilities import float_eq, float_gt, float_lt
+from ensemble_utilities import vfloat_eq, vfloat_gt, vfloat_lt
 import sys
 
 __author__ = "Martin De Kauwe"
 __version__ = "1.0 (04.03.2014)"
 __email__  = "mdekauwe@gmail.com"
 
+# met forcing used by the batch (array) photosynthesis
+BATCH_MET_VARS = ("tam", "tpm", "vpd_am", "vpd_pm", "co2")
+BATCH_DERIVED_VARS = ("daylen", "gamma_star_am", "gamma_star_pm", "km_am", 
+                      "km_pm")
+
 
 class MateC3(object):
     """ Model Any Terrestrial Ecosystem (MATE) model (C3)
@@ -54,7 +61,10 @@ class MateC3(object):
         self.control = control
         self.state = state
         self.met_data = met_data
-        self.mt = self.params.measurement_temp + const.DEG_TO_KELVIN      
+        self.mt = self.params.measurement_temp + const.DEG_TO_KELVIN
+        
+        # met-only quantities precomputed for the whole record
+        self.derived = getattr(met_data, "derived", None)      
         
     def calculate_photosynthesis(self, day, daylen):
         """ Photosynthesis is calculated assuming GPP is proportional to APAR,
@@ -96,11 +106,18 @@ class MateC3(object):
         # calculate mate params & account for temperature dependencies
         N0 = self.calculate_top_of_canopy_n()
         
-        gamma_star_am = self.calculate_co2_compensation_point(Tk_am)
-        gamma_star_pm = self.calculate_co2_compensation_point(Tk_pm)
-        
-        Km_am = self.calculate_michaelis_menten_parameter(Tk_am)
-        Km_pm = self.calculate_michaelis_menten_parameter(Tk_pm)
+        if self.derived is not None:
+            gamma_star_am = self.derived['gamma_star_am'][day]
+            gamma_star_pm = self.derived['gamma_star_pm'][day]
+            
+            Km_am = self.derived['km_am'][day]
+            Km_pm = self.derived['km_pm'][day]
+        else:
+            gamma_star_am = self.calculate_co2_compensation_point(Tk_am)
+            gamma_star_pm = self.calculate_co2_compensation_point(Tk_pm)
+            
+            Km_am = self.calculate_michaelis_menten_parameter(Tk_am)
+            Km_pm = self.calculate_michaelis_menten_parameter(Tk_pm)
         
         (jmax_am, vcmax_am) = self.calculate_jmax_and_vcmax(Tk_am, N0)
         (jmax_pm, vcmax_pm) = self.calculate_jmax_and_vcmax(Tk_pm, N0)
@@ -682,6 +699,300 @@ class MateC3(object):
                           
         return (total_alpha_limf, total_amax_limf)
 
+    def batch_met_arrays(self, days=slice(None)):
+        """ Met forcing needed by photosynthesis_batch, as arrays
+
+        Parameters:
+        ----------
+        days : slice or int, array
+            project days to extract, defaults to the whole record, e.g.
+            met_data.year_slice(yr) for a single year
+
+        Returns:
+        -------
+        met_arrays : dictionary
+            tam, tpm, vpd_am, vpd_pm, co2, par and daylen, plus the
+            precomputed gamma_star_am/pm and km_am/pm if available
+        """
+        if self.derived is None or "daylen" not in self.derived:
+            err_msg = ("Batch photosynthesis needs the precomputed met "
+                       "quantities, see met_precompute")
+            raise RuntimeError, err_msg
+
+        met_arrays = {}
+        for var in BATCH_MET_VARS:
+            met_arrays[var] = np.asarray(self.met_data[var], 
+                                         dtype=np.float64)[days]
+        if 'par' in self.met_data:
+            met_arrays['par'] = np.asarray(self.met_data['par'],
+                                           dtype=np.float64)[days]
+        else:
+            conv = const.RAD_TO_PAR * const.MJ_TO_MOL * const.MOL_TO_UMOL
+            met_arrays['par'] = np.asarray(self.met_data['sw_rad'],
+                                           dtype=np.float64)[days] * conv
+        for var in BATCH_DERIVED_VARS:
+            if var in self.derived:
+                met_arrays[var] = np.asarray(self.derived[var])[days]
+
+        return met_arrays
+
+    def photosynthesis_batch(self, met_arrays, lai, ncontent, fipar=None,
+                             wtfac_root=1.0):
+        """ calculate_photosynthesis for many days or ensemble members at 
+        once.
+        
+        Every argument broadcasts against the others, so this gives GPP over a
+        whole record for a prescribed LAI/N series (canopy only runs), or a 
+        single day for every member of an ensemble, in which case the params 
+        may be an EnsembleRecord. Operations are carried out in the same order
+        as the scalar version so the results are identical.
+        
+        Frost damage is a day to day recursion and isn't supported.
+
+        Parameters:
+        ----------
+        met_arrays : dictionary
+            tam, tpm, vpd_am, vpd_pm, co2, par [umol m-2 d-1] and daylen [hrs],
+            optionally gamma_star_am/pm and km_am/pm, see batch_met_arrays
+        lai : float, array
+            leaf area index
+        ncontent : float, array
+            canopy N content (g N m-2)
+        fipar : float, array, optional
+            fraction of intercepted PAR, calculated from lai as in 
+            PlantGrowth.carbon_production if not given
+        wtfac_root : float, array, optional
+            root zone water availability factor [0,1], defaults to no stress
+        
+        Returns:
+        -------
+        out : dictionary
+            apar, lue_am, lue_pm, gpp_gCm2, gpp_am, gpp_pm and gpp arrays
+        """
+        if self.control.frost:
+            err_msg = "Batch photosynthesis doesn't support frost damage"
+            raise RuntimeError, err_msg
+        
+        lai = np.asarray(lai, dtype=np.float64)
+        if fipar is None:
+            fipar = self.calculate_fipar_batch(lai)
+        
+        Tk_am = met_arrays['tam'] + const.DEG_TO_KELVIN
+        Tk_pm = met_arrays['tpm'] + const.DEG_TO_KELVIN
+        par = met_arrays['par']
+        daylen = met_arrays['daylen']
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            N0 = self.calculate_top_of_canopy_n_batch(lai, ncontent)
+            
+            if 'gamma_star_am' in met_arrays:
+                gamma_star_am = met_arrays['gamma_star_am']
+                gamma_star_pm = met_arrays['gamma_star_pm']
+                
+                Km_am = met_arrays['km_am']
+                Km_pm = met_arrays['km_pm']
+            else:
+                gamma_star_am = self.arrh_batch(self.params.gamstar25, 
+                                                self.params.eag, Tk_am)
+                gamma_star_pm = self.arrh_batch(self.params.gamstar25, 
+                                                self.params.eag, Tk_pm)
+                
+                Km_am = self.calculate_michaelis_menten_parameter_batch(Tk_am)
+                Km_pm = self.calculate_michaelis_menten_parameter_batch(Tk_pm)
+            
+            (jmax_am, 
+             vcmax_am) = self.calculate_jmax_and_vcmax_batch(Tk_am, N0, 
+                                                             wtfac_root)
+            (jmax_pm, 
+             vcmax_pm) = self.calculate_jmax_and_vcmax_batch(Tk_pm, N0, 
+                                                             wtfac_root)
+            
+            ci_am = self.calculate_ci_batch(met_arrays['vpd_am'], 
+                                            met_arrays['co2'], wtfac_root)
+            ci_pm = self.calculate_ci_batch(met_arrays['vpd_pm'], 
+                                            met_arrays['co2'], wtfac_root)
+            
+            # quantum efficiency calculated for C3 plants
+            alpha_am = self.assim_batch(ci_am, gamma_star_am, 
+                                        a1=self.params.alpha_j/4.0, 
+                                        a2=2.0*gamma_star_am)
+            alpha_pm = self.assim_batch(ci_pm, gamma_star_pm, 
+                                        a1=self.params.alpha_j/4.0, 
+                                        a2=2.0*gamma_star_pm)
+            
+            # Rubisco carboxylation limited rate of photosynthesis
+            ac_am = self.assim_batch(ci_am, gamma_star_am, a1=vcmax_am, 
+                                     a2=Km_am) 
+            ac_pm = self.assim_batch(ci_pm, gamma_star_pm, a1=vcmax_pm, 
+                                     a2=Km_pm) 
+            
+            # Light-limited rate of photosynthesis allowed by RuBP regeneration
+            aj_am = self.assim_batch(ci_am, gamma_star_am, a1=jmax_am/4.0,
+                                     a2=2.0*gamma_star_am)
+            aj_pm = self.assim_batch(ci_pm, gamma_star_pm, a1=jmax_pm/4.0,
+                                     a2=2.0*gamma_star_pm)
+            
+            # light-saturated photosynthesis rate at the top of the canopy
+            asat_am = np.minimum(aj_am, ac_am) 
+            asat_pm = np.minimum(aj_pm, ac_pm) 
+            
+            # LUE (umol C umol-1 PAR)
+            lue_am = self.epsilon_batch(asat_am, par, daylen, alpha_am)
+            lue_pm = self.epsilon_batch(asat_pm, par, daylen, alpha_pm)
+        
+        return self.gpp_batch(lai, par, fipar, lue_am, lue_pm)
+    
+    def calculate_fipar_batch(self, lai):
+        """ fraction of intercepted PAR, see PlantGrowth.carbon_production
+        
+        Parameters:
+        ----------
+        lai : array
+            leaf area index
+        
+        Returns:
+        -------
+        fipar : array
+            fraction of intercepted PAR
+        """
+        fc = np.where(vfloat_lt(lai, self.params.lai_closed),
+                      lai / self.params.lai_closed, 1.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fipar = (1.0 - np.exp(-self.params.kext * lai / fc)) * fc
+        
+        return np.where(lai > 0.0, fipar, 0.0)
+    
+    def gpp_batch(self, lai, par, fipar, lue_am, lue_pm):
+        """ Scale LUE to the canopy, see calculate_photosynthesis 
+        
+        Returns:
+        -------
+        out : dictionary
+            apar, lue_am, lue_pm, gpp_gCm2, gpp_am, gpp_pm and gpp arrays
+        """
+        # use average to simulate canopy photosynthesis
+        lue_avg = (lue_am + lue_pm) / 2.0 
+        
+        # absorbed photosynthetically active radiation (umol m-2 s-1)
+        apar = np.where(vfloat_eq(lai, 0.0), 0.0, par * fipar)
+        apar_half_day = apar / 2.0
+        
+        # convert umol m-2 d-1 -> gC m-2 d-1
+        gpp_gCm2 = apar * lue_avg * const.UMOL_2_GRAMS_C
+        gpp_am = apar_half_day * lue_am * const.UMOL_2_GRAMS_C
+        gpp_pm = apar_half_day * lue_pm * const.UMOL_2_GRAMS_C
+        
+        # g C m-2 to tonnes hectare-1 day-1
+        gpp = gpp_gCm2 * const.GRAM_C_2_TONNES_HA
+        
+        if self.control.nuptake_model == 3:
+            gpp_gCm2 = gpp_gCm2 * self.params.ac
+            gpp_am = gpp_am * self.params.ac
+            gpp_pm = gpp_pm * self.params.ac
+        
+        return {"apar": apar, "lue_am": lue_am, "lue_pm": lue_pm,
+                "gpp_gCm2": gpp_gCm2, "gpp_am": gpp_am, "gpp_pm": gpp_pm,
+                "gpp": gpp}
+    
+    def calculate_top_of_canopy_n_batch(self, lai, ncontent):
+        """ calculate_top_of_canopy_n for arrays of lai and canopy N """
+        N0 = (ncontent * self.params.kext / 
+              (1.0 - np.exp(-self.params.kext * lai)))
+        
+        return np.where(vfloat_gt(lai, 0.0), N0, 0.0)
+    
+    def calculate_michaelis_menten_parameter_batch(self, Tk):
+        """ calculate_michaelis_menten_parameter for an array of Tk """
+        Kc = self.arrh_batch(self.params.kc25, self.params.eac, Tk)
+        Ko = self.arrh_batch(self.params.ko25, self.params.eao, Tk)
+        
+        return Kc * (1.0 + self.params.oi / Ko)
+    
+    def calculate_jmax_and_vcmax_batch(self, Tk, N0, wtfac_root):
+        """ calculate_jmax_and_vcmax for arrays of Tk and N0 """
+        if self.control.modeljm == 0:
+            jmax = self.params.jmax + np.zeros_like(N0)
+            vcmax = self.params.vcmax + np.zeros_like(N0)
+        elif self.control.modeljm == 1: 
+            jmax25 = self.params.jmaxna * N0 + self.params.jmaxnb
+            jmax = self.peaked_arrh_batch(jmax25, self.params.eaj, Tk, 
+                                          self.params.delsj, self.params.edj)
+            vcmax25 = self.params.vcmaxna * N0 + self.params.vcmaxnb
+            vcmax = self.arrh_batch(vcmax25, self.params.eav, Tk) 
+        elif self.control.modeljm == 2: 
+            vcmax25 = self.params.vcmaxna * N0 + self.params.vcmaxnb
+            vcmax = self.arrh_batch(vcmax25, self.params.eav, Tk) 
+            jmax25 = self.params.jv_slope * vcmax25 - self.params.jv_intercept
+            jmax = self.peaked_arrh_batch(jmax25, self.params.eaj, Tk, 
+                                          self.params.delsj, self.params.edj)
+        
+        # reduce photosynthetic capacity with moisture stress
+        jmax = jmax * wtfac_root 
+        vcmax = vcmax * wtfac_root 
+        
+        jmax = self.adj_for_low_temp_batch(jmax, Tk)
+        vcmax = self.adj_for_low_temp_batch(vcmax, Tk)
+        
+        return (jmax, vcmax)
+    
+    def adj_for_low_temp_batch(self, param, Tk, lower_bound=0.0, 
+                               upper_bound=10.0):
+        """ adj_for_low_temp for arrays of param and Tk """
+        Tc = Tk - const.DEG_TO_KELVIN
+        
+        scaled = param * ((Tc - lower_bound) / (upper_bound - lower_bound))
+        return np.where(vfloat_lt(Tc, lower_bound), 0.0,
+                        np.where(vfloat_lt(Tc, upper_bound), scaled, param))
+    
+    def assim_batch(self, ci, gamma_star, a1, a2):
+        """ assim for arrays of ci and gamma_star """
+        return np.where(vfloat_lt(ci, gamma_star), 0.0,
+                        a1 * (ci - gamma_star) / (a2 + ci))
+    
+    def calculate_ci_batch(self, vpd, ca, wtfac_root):
+        """ calculate_ci for arrays of vpd and ca """
+        if self.control.gs_model == "MEDLYN":
+            g1w = self.params.g1 * wtfac_root
+            cica = g1w / (g1w + np.sqrt(vpd))
+            ci = cica * ca
+        else:
+            raise AttributeError('Only Belindas gs model is implemented')
+        return ci
+    
+    def epsilon_batch(self, asat, par, daylen, alpha):
+        """ epsilon for arrays of asat, par, daylen and alpha """
+        delta = 0.16666666667 # subintervals scaler, i.e. 6 intervals
+        h = daylen * const.SECS_IN_HOUR # number of seconds of daylight 
+        
+        # normalised daily irradiance
+        q = pi * self.params.kext * alpha * par / (2.0 * h * asat)
+        integral_g = 0.0 
+        for i in xrange(1, 13, 2):
+            sinx = sin(pi * i / 24.)
+            arg1 = sinx
+            arg2 = 1.0 + q * sinx 
+            # np.power, as ** 2.0 becomes a multiply, which isn't always the
+            # same as the pow() of the scalar version
+            arg3 = (np.sqrt(np.power(1.0 + q * sinx, 2.0) - 
+                    4.0 * self.params.theta * q * sinx))
+            integral_g += arg1 / (arg2 + arg3) * delta
+        lue = alpha * integral_g * pi
+        
+        return np.where(vfloat_gt(asat, 0.0), lue, 0.0)
+    
+    def arrh_batch(self, k25, Ea, Tk):
+        """ arrh for an array of Tk """
+        return k25 * np.exp((Ea * (Tk - self.mt)) / (self.mt * const.RGAS * 
+                                                     Tk))
+    
+    def peaked_arrh_batch(self, k25, Ea, Tk, deltaS, Hd):
+        """ peaked_arrh for an array of Tk """
+        arg1 = self.arrh_batch(k25, Ea, Tk)
+        arg2 = 1.0 + np.exp((self.mt * deltaS - Hd) / (self.mt * const.RGAS))
+        arg3 = 1.0 + np.exp((Tk * deltaS - Hd) / (Tk * const.RGAS))
+        
+        return arg1 * arg2 / arg3
+
 
 class MateC4(MateC3):
     """ Model Any Terrestrial Ecosystem (MATE) model (C4)
@@ -834,6 +1145,122 @@ class MateC4(MateC3):
         # Plant respiration assuming carbon-use efficiency.
         self.fluxes.auto_resp = self.fluxes.gpp - self.fluxes.npp
         
+    def photosynthesis_batch(self, met_arrays, lai, ncontent, fipar=None,
+                             wtfac_root=1.0):
+        """ calculate_photosynthesis for many days or ensemble members at 
+        once, see MateC3.photosynthesis_batch
+
+        Returns:
+        -------
+        out : dictionary
+            apar, lue_am, lue_pm, gpp_gCm2, gpp_am, gpp_pm, gpp, npp_gCm2, npp
+            and auto_resp arrays
+        """
+        lai = np.asarray(lai, dtype=np.float64)
+        if fipar is None:
+            fipar = self.calculate_fipar_batch(lai)
+        
+        Tk_am = met_arrays['tam'] + const.DEG_TO_KELVIN
+        Tk_pm = met_arrays['tpm'] + const.DEG_TO_KELVIN
+        par = met_arrays['par']
+        daylen = met_arrays['daylen']
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            N0 = self.calculate_top_of_canopy_n_batch(lai, ncontent)
+            
+            ci_am = self.calculate_ci_batch(met_arrays['vpd_am'], 
+                                            met_arrays['co2'], wtfac_root)
+            ci_pm = self.calculate_ci_batch(met_arrays['vpd_pm'], 
+                                            met_arrays['co2'], wtfac_root)
+            
+            alpha = self.params.alpha_c4
+            
+            (vcmax_am, 
+             vcmax25_am) = self.calculate_vcmax_parameter_batch(Tk_am, N0, 
+                                                                wtfac_root)
+            (vcmax_pm, 
+             vcmax25_pm) = self.calculate_vcmax_parameter_batch(Tk_pm, N0,
+                                                                wtfac_root)
+            
+            # Rubisco and light-limited capacity (Appendix, 2B)
+            par_per_sec = par / (60.0 * 60.0 * daylen)
+            M_am = self.quadratic_batch(a=self.beta1, 
+                                        b=-(vcmax_am + alpha * par_per_sec), 
+                                        c=(vcmax_am * alpha * par_per_sec)) 
+            M_pm = self.quadratic_batch(a=self.beta1, 
+                                        b=-(vcmax_pm + alpha * par_per_sec), 
+                                        c=(vcmax_pm * alpha * par_per_sec)) 
+            
+            # The limitation of the overall rate by M and CO2 limited flux:
+            A_am = self.quadratic_batch(a=self.beta2, 
+                                        b=-(M_am + self.kslope * ci_am), 
+                                        c=(M_am * self.kslope * ci_am))
+            A_pm = self.quadratic_batch(a=self.beta2, 
+                                        b=-(M_pm + self.kslope * ci_pm), 
+                                        c=(M_pm * self.kslope * ci_pm))
+            
+            Rd_am = self.calc_respiration(Tk_am, vcmax25_am)  
+            Rd_pm = self.calc_respiration(Tk_pm, vcmax25_pm)  
+            
+            asat_am = A_am - Rd_am 
+            asat_pm = A_pm - Rd_pm 
+            
+            # LUE (umol C umol-1 PAR)
+            lue_am = self.epsilon_batch(asat_am, par, daylen, alpha)
+            lue_pm = self.epsilon_batch(asat_pm, par, daylen, alpha)
+        
+        return self.gpp_batch(lai, par, fipar, lue_am, lue_pm)
+    
+    def gpp_batch(self, lai, par, fipar, lue_am, lue_pm):
+        """ Scale LUE to the canopy, see calculate_photosynthesis 
+        
+        Returns:
+        -------
+        out : dictionary
+            apar, lue_am, lue_pm, gpp_gCm2, gpp_am, gpp_pm, gpp, npp_gCm2, npp
+            and auto_resp arrays
+        """
+        lue_avg = (lue_am + lue_pm) / 2.0 
+        
+        apar = np.where(vfloat_eq(lai, 0.0), 0.0, par * fipar)
+        apar_half_day = apar / 2.0
+        
+        # convert umol m-2 d-1 -> gC m-2 d-1
+        gpp_gCm2 = apar * lue_avg * const.UMOL_2_GRAMS_C
+        gpp_am = apar_half_day * lue_am * const.UMOL_2_GRAMS_C
+        gpp_pm = apar_half_day * lue_pm * const.UMOL_2_GRAMS_C
+        npp_gCm2 = gpp_gCm2 * self.params.cue
+        
+        if self.control.nuptake_model == 3:
+            gpp_gCm2 = gpp_gCm2 * self.params.ac
+            gpp_am = gpp_am * self.params.ac
+            gpp_pm = gpp_pm * self.params.ac
+            npp_gCm2 = gpp_gCm2 * self.params.cue
+        
+        # g C m-2 to tonnes hectare-1 day-1
+        gpp = gpp_gCm2 * const.GRAM_C_2_TONNES_HA
+        npp = npp_gCm2 * const.GRAM_C_2_TONNES_HA
+        
+        return {"apar": apar, "lue_am": lue_am, "lue_pm": lue_pm,
+                "gpp_gCm2": gpp_gCm2, "gpp_am": gpp_am, "gpp_pm": gpp_pm,
+                "gpp": gpp, "npp_gCm2": npp_gCm2, "npp": npp,
+                "auto_resp": gpp - npp}
+    
+    def calculate_vcmax_parameter_batch(self, Tk, N0, wtfac_root):
+        """ calculate_vcmax_parameter for arrays of Tk and N0 """
+        Ea = 67294.0
+        Hd = 144568.0
+        delS = 472.0
+        
+        vcmax25 = self.params.vcmaxna * N0 + self.params.vcmaxnb
+        vcmax = self.peaked_arrh_batch(vcmax25, Ea, Tk, delS, Hd)
+        
+        # reduce photosynthetic capacity with moisture stress
+        vcmax = vcmax * wtfac_root
+        vcmax = self.adj_for_low_temp_batch(vcmax, Tk)
+        
+        return vcmax, vcmax25
+
     def calculate_vcmax_parameter(self, Tk, N0):
         """ Calculate the maximum rate of rubisco-mediated carboxylation at the
         top of the canopy
@@ -939,6 +1366,13 @@ class MateC4(MateC3):
         root = (-b - sqrt(d)) / (2.0 * a)	# Negative quadratic equation
 
         return root
+
+    def quadratic_batch(self, a=None, b=None, c=None):
+        """ quadratic for arrays of co-efficients """
+        d = np.power(b, 2.0) - 4.0 * a * c # discriminant, see epsilon_batch
+        root = (-b - np.sqrt(d)) / (2.0 * a)	# Negative quadratic equation
+
+        return root
        
          
 if __name__ == "__main__":
@@ -951,7 +1385,7 @@ if __name__ == "__main__":
     
     from file_parser import initialise_model_data
     import datetime
-    from utilities import float_eq, float_lt, float_gt, calculate_daylength, uniq
+    from utilities import float_eq, float_lt, float_gt, calculate_daylength
     
     met_header = 4
     
@@ -974,10 +1408,10 @@ if __name__ == "__main__":
         
     # figure out the number of years for simulation and the number of
     # days in each year
-    years = uniq(met_data["year"])
+    years = met_data.years
     #years = years[:-1] # dump last year as missing "site" LAI
     
-    days_in_year = [met_data["year"].count(yr) for yr in years]
+    days_in_year = met_data.days_in_year
     
     for i, yr in enumerate(years):
         daylen = calculate_daylength(days_in_year[i], params.latitude)
@@ -1038,7 +1038,7 @@ if __name__ == "__main__":
     
     from file_parser import initialise_model_data
     import datetime
-    from utilities import float_eq, float_lt, float_gt, calculate_daylength, uniq
+    from utilities import float_eq, float_lt, float_gt, calculate_daylength
     
     met_header=4
     
@@ -1066,10 +1066,10 @@ if __name__ == "__main__":
         
     # figure out the number of years for simulation and the number of
     # days in each year
-    years = uniq(met_data["year"])
+    years = met_data.years
     #years = years[:-1] # dump last year as missing "site" LAI
     
-    days_in_year = [met_data["year"].count(yr) for yr in years]
+    days_in_year = met_data.days_in_year
     
     for i, yr in enumerate(years):
         daylen = calculate_daylength(days_in_year[i], params.latitude)
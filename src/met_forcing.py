@@ -0,0 +1,268 @@
+""" Columnar container for the meteorological forcing data and the binary
+sidecar cache that saves re-parsing the met csv file on every model run """
+
+import os
+import ast
+import mmap
+import hashlib
+import tempfile
+import numpy as np
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+class MetColumn(np.ndarray):
+    """ float64 forcing column.
+
+    Indexing a single day hands back a python float rather than a numpy
+    scalar, otherwise every flux calculated from the forcing ends up as a
+    numpy scalar and the daily loop slows to a crawl. Slices and whole column
+    operations are plain numpy.
+    """
+    def __getitem__(self, index):
+        if type(index) is int:
+            return self.item(index)
+        return np.ndarray.__getitem__(self, index)
+
+
+class MetForcing(dict):
+    """ Met forcing stored as one contiguous float64 array per variable.
+
+    The object behaves like the old dictionary of lists, i.e.
+    met_data['tair'][day], 'par' in met_data and met_data['rain'][st:en] all
+    work as before, so the daily code doesn't need to know about it. Whole
+    columns can be handed straight to vectorised code and the year/doy index
+    is built once on load rather than re-counted by the caller.
+    """
+    def __init__(self, var_names, columns):
+        """
+        Parameters:
+        ----------
+        var_names : list of strings
+            variable names, one for each row of columns
+        columns : float, array
+            2D array of forcing data [nvars, nrecords]; each variable is a
+            contiguous row, so no copy is made if it is already float64
+        """
+        dict.__init__(self)
+        columns = np.asarray(columns, dtype=np.float64)
+        if columns.ndim != 2 or columns.shape[0] != len(var_names):
+            err_msg = ("Met data has %d columns but header names %d variables"
+                       % (columns.shape[0], len(var_names)))
+            raise RuntimeError, err_msg
+
+        self.var_names = list(var_names)
+        self.nrecords = columns.shape[1]
+        self.derived = None # filled in by met_precompute
+        for i, name in enumerate(self.var_names):
+            self[name] = columns[i].view(MetColumn)
+
+        self.build_index()
+
+    def view(self):
+        """ MetForcing holding the same columns, without copying them. The
+        derived quantities aren't carried over, they depend on the model
+        parameters (e.g. latitude) so each model computes its own.
+
+        Returns:
+        --------
+        met_data : MetForcing
+            met forcing data
+        """
+        new = MetForcing.__new__(MetForcing)
+        dict.__init__(new, self)
+        new.var_names = list(self.var_names)
+        new.nrecords = self.nrecords
+        new.derived = None
+        new.years = self.years
+        new.days_in_year = self.days_in_year
+        new.year_start = self.year_start
+
+        return new
+
+    def build_index(self):
+        """ Figure out the years in the record, the number of days in each
+        year and where each year starts. Years are kept as python floats so
+        that they match what used to come out of the dictionary of lists. """
+        if "year" not in self:
+            self.years = []
+            self.days_in_year = []
+            self.year_start = []
+            return
+
+        year = self["year"]
+        # order preserving unique, i.e. same as utilities.uniq
+        (uniq_yrs, first) = np.unique(year, return_index=True)
+        order = np.argsort(first)
+        self.years = [float(yr) for yr in uniq_yrs[order]]
+        self.days_in_year = [int(np.sum(year == yr)) for yr in self.years]
+        self.year_start = [int(i) for i in first[order]]
+
+    def year_slice(self, yr):
+        """ slice object selecting the records that belong to year yr
+
+        Parameters:
+        ----------
+        yr : float
+            year of interest
+
+        Returns:
+        --------
+        slice : slice
+            slice into the forcing columns
+        """
+        i = self.years.index(yr)
+        st = self.year_start[i]
+        return slice(st, st + self.days_in_year[i])
+
+
+def shared_forcing(met_data):
+    """ Read-only copy of the met forcing in a block of shared memory.
+
+    The block is an anonymous shared mapping, so processes forked after it is
+    made (e.g. multiprocessing pool workers) all read the same physical pages
+    rather than each holding a copy of the forcing.
+
+    Parameters:
+    -----------
+    met_data : MetForcing
+        met forcing data
+
+    Returns:
+    --------
+    data : MetForcing
+        met forcing data, the columns are views into the shared block
+    """
+    shape = (len(met_data.var_names), met_data.nrecords)
+    block = mmap.mmap(-1, max(1, shape[0] * shape[1] * 8))
+    columns = np.ndarray(shape, dtype=np.float64, buffer=block)
+    for i, name in enumerate(met_data.var_names):
+        columns[i] = met_data[name]
+    columns.flags.writeable = False
+
+    return MetForcing(met_data.var_names, columns)
+
+
+# Sidecar layout: magic line, one line holding a python dict describing the
+# source file and the columns, padded so the float64 block that follows is
+# aligned, then the data stored variable by variable [nvars, nrecords].
+CACHE_MAGIC = "GDAY_MET_CACHE 1\n"
+CACHE_EXT = ".cache"
+CACHE_ALIGN = 64
+
+def cache_fname(fname):
+    """ name of the binary sidecar for the met file fname """
+    return fname + CACHE_EXT
+
+def file_digest(text):
+    """ md5 hex digest of the met file contents """
+    return hashlib.md5(text).hexdigest()
+
+def source_signature(fname):
+    """ (size, mtime) of the met file, cheap check that it hasn't changed """
+    info = os.stat(fname)
+    return (info.st_size, info.st_mtime)
+
+def read_cached_forcing(fname, met_header, comment='#'):
+    """ Memory-map the binary sidecar for the met file if it is still valid
+
+    The cache is valid if the met file has the same size and modification
+    time as when the cache was written, or failing that (e.g. the file was
+    touched or copied) the same content hash. The columns are read-only views
+    into the mapped file, so processes using the same forcing share the pages.
+
+    Parameters:
+    -----------
+    fname : string
+        met forcing filename
+    met_header : int
+        row number of met file header with variable names
+    comment : string, optional
+        character defining a comment
+
+    Returns:
+    --------
+    data : MetForcing or None
+        met forcing data, None if there isn't a usable cache
+    """
+    cname = cache_fname(fname)
+    try:
+        f = open(cname, 'rb')
+        try:
+            if f.readline() != CACHE_MAGIC:
+                return None
+            header = ast.literal_eval(f.readline().strip())
+            offset = f.tell()
+        finally:
+            f.close()
+    except (IOError, OSError, SyntaxError, ValueError):
+        return None
+
+    if (header["met_header"] != met_header or header["comment"] != comment):
+        return None
+    try:
+        if tuple(header["signature"]) != source_signature(fname):
+            f = open(fname, 'r')
+            text = f.read()
+            f.close()
+            if file_digest(text) != header["md5"]:
+                return None
+    except (IOError, OSError):
+        return None
+
+    nvars = len(header["var_names"])
+    columns = np.memmap(cname, dtype='<f8', mode='r', offset=offset,
+                        shape=(nvars, header["nrecords"]))
+
+    return MetForcing(header["var_names"], columns)
+
+def write_cached_forcing(fname, met_header, comment, digest, met_data):
+    """ Write the binary sidecar for the met file.
+
+    The file is written to a temporary file and moved into place so that
+    a concurrent reader never sees half a cache. Failing to write the cache,
+    e.g. a read-only met directory, isn't an error, we just parse next time.
+
+    Parameters:
+    -----------
+    fname : string
+        met forcing filename
+    met_header : int
+        row number of met file header with variable names
+    comment : string
+        character defining a comment
+    digest : string
+        md5 hex digest of the met file contents
+    met_data : MetForcing
+        parsed met forcing data
+    """
+    header = {"var_names": met_data.var_names,
+              "nrecords": met_data.nrecords,
+              "met_header": met_header,
+              "comment": comment,
+              "md5": digest,
+              "signature": source_signature(fname)}
+    header_str = repr(header)
+    npad = (-(len(CACHE_MAGIC) + len(header_str) + 1)) % CACHE_ALIGN
+    header_str += " " * npad + "\n"
+
+    columns = np.empty((len(met_data.var_names), met_data.nrecords),
+                       dtype='<f8')
+    for i, name in enumerate(met_data.var_names):
+        columns[i] = met_data[name]
+
+    path = None
+    try:
+        (fd, path) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fname)))
+        f = os.fdopen(fd, 'wb')
+        f.write(CACHE_MAGIC)
+        f.write(header_str)
+        columns.tofile(f)
+        f.close()
+        os.chmod(path, 0644)
+        os.rename(path, cache_fname(fname))
+    except (IOError, OSError):
+        if path is not None and os.path.exists(path):
+            os.remove(path)
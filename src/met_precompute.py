@@ -0,0 +1,113 @@
+""" Forcing precompute stage.
+
+Quantities which only depend on the met forcing (and fixed parameters), not
+on the model state, are calculated here once for the whole record as arrays
+rather than inside the daily loop. Each function mirrors the scalar method it
+replaces, keeping the same order of operations, so the daily model output only
+differs in the last bit of a few water fluxes (transpiration, et, soil_evap),
+where numpy squares with t*t and the scalar code uses pow().
+"""
+
+import numpy as np
+import constants as const
+from met_forcing import MetColumn
+from utilities import daylength_table
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+def precompute_met_derived(met_data, params):
+    """ Calculate all the met-only derived quantities for the whole record
+
+    Parameters:
+    ----------
+    met_data : MetForcing
+        meteorological forcing data
+    params: floats, object
+        model parameters
+
+    Returns:
+    --------
+    derived : dictionary
+        derived forcing arrays, one value per record
+    """
+    derived = {}
+    daylen = record_daylength(met_data, params.latitude)
+    half_day = daylen / 2.0
+    derived["daylen"] = daylen
+
+    # MATE temperature dependencies
+    mt = params.measurement_temp + const.DEG_TO_KELVIN
+    for period, tname in [("am", "tam"), ("pm", "tpm")]:
+        Tk = met_data[tname] + const.DEG_TO_KELVIN
+        derived["gamma_star_" + period] = arrh(mt, params.gamstar25,
+                                               params.eag, Tk)
+        Kc = arrh(mt, params.kc25, params.eac, Tk)
+        Ko = arrh(mt, params.ko25, params.eao, Tk)
+        derived["km_" + period] = Kc * (1.0 + params.oi / Ko)
+
+    # radiation and Penman-Monteith terms
+    derived["net_rad_day"] = net_radiation(met_data['tair'],
+                                           met_data['sw_rad'], daylen,
+                                           params.albedo)
+    derived["net_rad_am"] = net_radiation(met_data['tam'],
+                                          met_data['sw_rad_am'], half_day,
+                                          params.albedo)
+    derived["net_rad_pm"] = net_radiation(met_data['tpm'],
+                                          met_data['sw_rad_pm'], half_day,
+                                          params.albedo)
+    for period, tname in [("day", "tair"), ("am", "tam"), ("pm", "tpm")]:
+        tavg = met_data[tname]
+        derived["lambda_" + period] = 2.501 - 0.002361 * tavg
+        derived["slope_" + period] = slope_of_svp_curve(tavg)
+        derived["rho_" + period] = 1.292 - (0.00428 * tavg)
+
+    derived["tfac_soil_decomp"] = soil_temp_factor(met_data['tsoil'])
+
+    for key in derived:
+        derived[key] = np.ascontiguousarray(derived[key]).view(MetColumn)
+
+    return derived
+
+def record_daylength(met_data, latitude):
+    """ Daylength [hrs] for every record, see utilities.day_length. Day of
+    year and year length come from the year index of the forcing, each year
+    is copied from the cached table for its length, see
+    utilities.daylength_table """
+    daylen = np.empty(met_data.nrecords)
+    for st, ndays in zip(met_data.year_start, met_data.days_in_year):
+        daylen[st:st+ndays] = daylength_table(ndays, latitude)
+
+    return daylen
+
+def arrh(mt, k25, Ea, Tk):
+    """ Arrhenius temperature dependence, see MateC3.arrh """
+    return k25 * np.exp((Ea * (Tk - mt)) / (mt * const.RGAS * Tk))
+
+def net_radiation(tavg, sw_rad, daylen, albedo):
+    """ Net radiation [MJ m-2 s-1], see WaterBalance.calc_radiation """
+    net_lw = (107.0 - 0.3 * tavg) * daylen * const.WATT_HR_TO_MJ
+    net_rad = np.maximum(0.0, sw_rad * (1.0 - albedo) - net_lw)
+    tconv = 1.0 / (60.0 * 60.0 * daylen)
+
+    return net_rad * tconv
+
+def slope_of_svp_curve(tavg):
+    """ Slope of the saturation vapour pressure curve [kPa degC-1], see
+    PenmanMonteith.calc_slope_of_saturation_vapour_pressure_curve """
+    t = tavg + 237.3
+    arg1 = 4098.0 * (0.6108 * np.exp((17.27 * tavg) / t))
+    arg2 = t**2
+
+    return (arg1 / arg2)
+
+def soil_temp_factor(tsoil):
+    """ Soil-temperature activity factor (A9), see
+    CarbonSoilFlows.soil_temp_factor """
+    # negative number cannot be raised to a fractional power
+    tpos = np.where(tsoil > 0.0, tsoil, 0.0)
+    tfac = 0.0326 + 0.00351 * tpos**1.652 - (tpos / 41.748)**7.19
+
+    return np.where(tsoil > 0.0, np.maximum(tfac, 0.0), 0.0)
@@ -0,0 +1,263 @@
+""" Self-describing binary daily output file and a reader for it.
+
+Layout: magic line, one line holding a python dict describing the file (the
+variable names, their units and the git revision of the code), padded so the
+data that follows is aligned, then any number of chunks. Each chunk is the
+number of rows as a little-endian int64 followed by the rows stored column by
+column as little-endian float64 [nvars, nrows]. A run adds a chunk every time
+the output buffer is written, so a file can be appended to, e.g. when
+restarting from a checkpoint, and a file cut short by a crash is still
+readable up to the last complete chunk.
+"""
+
+import os
+import ast
+import numpy as np
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+OUTPUT_MAGIC = "GDAY_OUTPUT 1\n"
+OUTPUT_ALIGN = 64
+NROWS_DTYPE = np.dtype('<i8')
+DATA_DTYPE = np.dtype('<f8')
+
+# units of the commonly printed variables, anything else is written as ""
+C_N_POOLS = ['shoot', 'root', 'croot', 'branch', 'stem', 'structsurf',
+             'metabsurf', 'structsoil', 'metabsoil', 'activesoil', 'slowsoil',
+             'passivesoil', 'cstore', 'shootn', 'rootn', 'crootn', 'branchn',
+             'sapwood', 'stemnimm', 'stemnmob', 'structsurfn', 'metabsurfn',
+             'structsoiln', 'metabsoiln', 'activesoiln', 'slowsoiln',
+             'passivesoiln', 'inorgn', 'stemn', 'nstore', 'plantc', 'plantn',
+             'soilc', 'soiln', 'litterc', 'littercag', 'littercbg', 'littern',
+             'litternag', 'litternbg', 'totalc', 'totaln']
+C_N_FLUXES = ['gpp', 'npp', 'nep', 'auto_resp', 'hetero_resp', 'nuptake',
+              'nloss', 'ngross', 'nmineralisation', 'nimmob', 'leafretransn',
+              'cpleaf', 'cproot', 'cpcroot', 'cpbranch', 'cpstem', 'npleaf',
+              'nproot', 'npcroot', 'npbranch', 'npstemimm', 'npstemmob',
+              'deadleaves', 'deadroots', 'deadcroots', 'deadbranch',
+              'deadstems', 'deadleafn', 'deadrootn', 'deadcrootn',
+              'deadbranchn', 'deadstemn', 'active_to_slow',
+              'active_to_passive', 'slow_to_active', 'slow_to_passive',
+              'passive_to_active', 'c_into_active', 'c_into_slow',
+              'c_into_passive', 'co2_rel_from_surf_struct_litter',
+              'co2_rel_from_soil_struct_litter',
+              'co2_rel_from_surf_metab_litter',
+              'co2_rel_from_soil_metab_litter', 'co2_rel_from_active_pool',
+              'co2_rel_from_slow_pool', 'co2_rel_from_passive_pool',
+              'root_exc', 'root_exn', 'co2_released_exud']
+WATER_FLUXES = ['et', 'transpiration', 'soil_evap', 'interception', 'runoff',
+                'erain']
+
+UNITS = {'year': 'yr', 'doy': 'd', 'lai': 'm2/m2',
+         'pawater_root': 'mm', 'pawater_topsoil': 'mm',
+         'wtfac_root': '-', 'wtfac_topsoil': '-',
+         'gs_mol_m2_sec': 'mol/m2/s', 'ga_mol_m2_sec': 'mol/m2/s'}
+UNITS.update((var, 't/ha') for var in C_N_POOLS)
+UNITS.update((var, 't/ha/d') for var in C_N_FLUXES)
+UNITS.update((var, 'mm/d') for var in WATER_FLUXES)
+
+
+class OutputWriter(object):
+    """ Write the daily output, a block of rows at a time """
+    def __init__(self, fname, var_names, git_hash, append=False, end=None):
+        """
+        Parameters:
+        ----------
+        fname : string
+            output filename
+        var_names : list of strings
+            name of each column of the output
+        git_hash : string
+            git revision of the code
+        append : logical, optional
+            add to the end of an existing file, which must hold the same
+            variables, rather than starting a new one
+        end : int, optional
+            when appending, cut the file back to this position first, e.g.
+            where the output had got to when a checkpoint was written, rather
+            than to the end of the last complete chunk
+        """
+        self.fname = fname
+        self.var_names = list(var_names)
+        if append and os.path.exists(fname) and os.path.getsize(fname) > 0:
+            (header, offset) = read_header(fname)
+            if header["var_names"] != self.var_names:
+                err_msg = ("Can't append to %s, it holds different variables"
+                           % fname)
+                raise RuntimeError, err_msg
+            if end is None:
+                # drop anything after the last complete chunk
+                chunks = find_chunks(fname, offset, len(self.var_names))
+                end = chunks[-1][2] if chunks else offset
+            elif end < offset or end > os.path.getsize(fname):
+                err_msg = ("Can't append to %s, it doesn't hold the output "
+                           "up to position %d" % (fname, end))
+                raise RuntimeError, err_msg
+            self.fp = open(fname, 'r+b')
+            self.fp.truncate(end)
+            self.fp.seek(0, os.SEEK_END)
+        else:
+            header = {"var_names": self.var_names,
+                      "units": [UNITS.get(var, "") for var in self.var_names],
+                      "git_hash": git_hash}
+            header_str = repr(header)
+            npad = (-(len(OUTPUT_MAGIC) + len(header_str) + 1)) % OUTPUT_ALIGN
+            self.fp = open(fname, 'wb')
+            self.fp.write(OUTPUT_MAGIC)
+            self.fp.write(header_str + " " * npad + "\n")
+
+    def write(self, rows):
+        """ Append a chunk
+
+        Parameters:
+        ----------
+        rows : float, array
+            [nrows, nvars] daily output
+        """
+        rows = np.asarray(rows)
+        if rows.shape[0] == 0:
+            return
+        np.array([rows.shape[0]], dtype=NROWS_DTYPE).tofile(self.fp)
+        np.ascontiguousarray(rows.T, dtype=DATA_DTYPE).tofile(self.fp)
+
+    def tell(self):
+        """ Position of the end of the output written so far """
+        if not self.fp.closed:
+            self.fp.flush()
+        return os.path.getsize(self.fname)
+
+    def close(self):
+        self.fp.close()
+
+
+class GdayOutput(dict):
+    """ Columns of a binary output file, by variable name, plus the units and
+    the git revision of the code which wrote it """
+    def __init__(self, columns, var_names, units, git_hash):
+        dict.__init__(self, columns)
+        self.var_names = var_names
+        self.units = units
+        self.git_hash = git_hash
+
+
+def read_header(fname):
+    """ Header of a binary output file
+
+    Parameters:
+    -----------
+    fname : string
+        output filename
+
+    Returns:
+    --------
+    header : dictionary
+        var_names, units and git_hash
+    offset : int
+        position of the first chunk
+    """
+    try:
+        f = open(fname, 'rb')
+    except IOError:
+        raise IOError('Could not read output file: "%s"' % fname)
+    try:
+        if f.readline() != OUTPUT_MAGIC:
+            err_msg = '"%s" is not a G\'DAY binary output file' % fname
+            raise RuntimeError, err_msg
+        header = ast.literal_eval(f.readline().strip())
+        offset = f.tell()
+    finally:
+        f.close()
+
+    return (header, offset)
+
+def find_chunks(fname, offset, nvars):
+    """ Locate the complete chunks in a binary output file
+
+    Parameters:
+    -----------
+    fname : string
+        output filename
+    offset : int
+        position of the first chunk
+    nvars : int
+        number of variables
+
+    Returns:
+    --------
+    chunks : list of tuples
+        (data offset, nrows, end of chunk) for each chunk
+    """
+    size = os.path.getsize(fname)
+    chunks = []
+    f = open(fname, 'rb')
+    try:
+        while offset + NROWS_DTYPE.itemsize <= size:
+            f.seek(offset)
+            nrows = int(np.fromfile(f, dtype=NROWS_DTYPE, count=1)[0])
+            data_offset = offset + NROWS_DTYPE.itemsize
+            end = data_offset + nrows * nvars * DATA_DTYPE.itemsize
+            if nrows <= 0 or end > size:
+                break
+            chunks.append((data_offset, nrows, end))
+            offset = end
+    finally:
+        f.close()
+
+    return chunks
+
+def read_output(fname, variables=None):
+    """ Read a binary output file
+
+    The file is memory-mapped and only the variables asked for are read. If
+    the file holds a single chunk each column is a view straight into the
+    mapped file, otherwise the pieces of each column are joined.
+
+    Parameters:
+    -----------
+    fname : string
+        output filename
+    variables : list of strings, optional
+        variables to read, defaults to all of them
+
+    Returns:
+    --------
+    data : GdayOutput
+        dictionary of float64 columns, with var_names, units and git_hash
+        attributes
+    """
+    (header, offset) = read_header(fname)
+    var_names = header["var_names"]
+    units = dict(zip(var_names, header["units"]))
+    if variables is None:
+        variables = var_names
+    for var in variables:
+        if var not in var_names:
+            err_msg = "%s isn't in the output file %s" % (var, fname)
+            raise RuntimeError, err_msg
+
+    nvars = len(var_names)
+    pieces = dict((var, []) for var in variables)
+    chunks = find_chunks(fname, offset, nvars)
+    if chunks:
+        mapped = np.memmap(fname, dtype=np.uint8, mode='r')
+    for (data_offset, nrows, end) in chunks:
+        block = np.ndarray((nvars, nrows), dtype=DATA_DTYPE, buffer=mapped,
+                           offset=data_offset)
+        for var in variables:
+            pieces[var].append(block[var_names.index(var)])
+
+    columns = {}
+    for var in variables:
+        if len(pieces[var]) == 1:
+            columns[var] = pieces[var][0]
+        elif len(pieces[var]) == 0:
+            columns[var] = np.zeros(0, dtype=DATA_DTYPE)
+        else:
+            columns[var] = np.concatenate(pieces[var])
+
+    return GdayOutput(columns, list(variables),
+                      dict((var, units[var]) for var in variables),
+                      header["git_hash"])
@@ -5,18 +5,16 @@ from math import exp, log
 import sys
 import constants as const
 from utilities import float_eq, float_lt, float_gt, SimpleMovingAverage, clip
-from utilities import float_le, float_ge
-from bewdy import Bewdy
+from utilities import float_le, float_ge, ControlStrategies
 from water_balance import WaterBalance, SoilMoisture
-from mate import MateC3, MateC4
-from optimal_root_model import RootingDepthModel
+from components import component_class
 
 __author__  = "Martin De Kauwe"
 __version__ = "1.0 (23.02.2011)"
 __email__   = "mdekauwe@gmail.com"
 
 
-class PlantGrowth(object):
+class PlantGrowth(ControlStrategies):
     """ G'DAY plant growth module.
 
     Calls photosynthesis model, water balance and evolve plant state.
@@ -27,6 +25,22 @@ class PlantGrowth(object):
 
     * Note met_forcing is an object with radiation, temp, precip data, etc.
     """
+    # (attribute, control flags, {setting: method}), see bind_strategies
+    STRATEGIES = (
+        ("photosynthesis", ("assim_model",),
+         {"MATE": "photosynthesis_mate", "BEWDY": "photosynthesis_bewdy"}),
+        ("respiration", ("respiration_model",),
+         {"FIXED": "respiration_fixed",
+          "TEMPERATURE": "respiration_not_implemented",
+          "BIOMASS": "respiration_not_implemented"}),
+        ("alloc_fracs", ("alloc_model",),
+         {"FIXED": "alloc_fracs_fixed", "GRASSES": "alloc_fracs_grasses",
+          "ALLOMETRIC": "alloc_fracs_allometric"}),
+        ("calculate_nuptake", ("nuptake_model",),
+         {0: "nuptake_constant", 1: "nuptake_inorgn",
+          2: "nuptake_root_biomass", 3: "nuptake_soil_moisture",
+          4: "nuptake_ocn"}))
+
     def __init__(self, control, params, state, fluxes, met_data):
         """
         Parameters
@@ -48,31 +62,22 @@ class PlantGrowth(object):
         self.control = control
         self.state = state
         self.met_data = met_data
-        self.bw = Bewdy(self.control, self.params, self.state, self.fluxes,
-                        self.met_data)
         self.wb = WaterBalance(self.control, self.params, self.state,
                                self.fluxes, self.met_data)
         
-        
-        if self.control.ps_pathway == "C3":
-            self.mt = MateC3(self.control, self.params, self.state, self.fluxes,
-                             self.met_data)
-        else:
-            self.mt = MateC4(self.control, self.params, self.state, self.fluxes,
-                             self.met_data)
+        # the photosynthesis and root models are only built (and imported)
+        # once the control flags ask for them, see submodel
+        self.submodels = {}
+        self.bind_strategies()
                              
         self.sm = SoilMoisture(self.control, self.params, self.state, 
                                self.fluxes)
         self.sm.initialise_parameters()
         
-        self.rm = RootingDepthModel(d0x=self.params.d0x, r0=self.params.r0, 
-                                    top_soil_depth=self.params.topsoil_depth*const.MM_TO_M)
-        
         # Window size = root lifespan in days...
         # For deciduous species window size is set as the length of the 
         # growing season in the main part of the code
-        self.window_size = (int(1.0 / (self.params.rdecay * const.NDAYS_IN_YR)* 
-                            const.NDAYS_IN_YR))
+        self.window_size = self.calc_window_size()
         #self.window_size = 365
         
         # If we don't have any information about the N&water limitation, i.e.
@@ -87,6 +92,82 @@ class PlantGrowth(object):
         
         self.check_max_NC = True
         
+    def calc_window_size(self):
+        """ Window of the growth stress moving average, the root lifespan
+        in days """
+        return (int(1.0 / (self.params.rdecay * const.NDAYS_IN_YR)* 
+                const.NDAYS_IN_YR))
+
+    def update_parameters(self):
+        """ Set up what is taken from the params and control flags again,
+        after they have been changed, e.g. on restarting from a checkpoint.
+        The growth stress history is kept, as far back as the new window.
+        """
+        # the submodels only hold values taken from the params
+        self.submodels = {}
+        self.bind_strategies()
+        self.wb.update_parameters()
+        self.sm.initialise_parameters()
+        
+        window_size = self.calc_window_size()
+        if window_size != self.window_size:
+            self.window_size = window_size
+            if not self.control.deciduous_model:
+                history = list(self.sma.data)[-window_size:]
+                self.sma = SimpleMovingAverage(window_size)
+                if history:
+                    self.sma.data.extend([history[0]] *
+                                         (window_size - len(history)))
+                    self.sma.data.extend(history)
+
+    def submodel(self, name, *args, **kwargs):
+        """ Optional component of the plant model, built the first time it
+        is used
+
+        Parameters:
+        -----------
+        name : string
+            component name, see components.COMPONENTS
+        args, kwargs : optional
+            passed to the component class, by default the model records
+
+        Returns:
+        --------
+        submodel : object
+            the component instance, the same one every time
+        """
+        try:
+            return self.submodels[name]
+        except KeyError:
+            pass
+        if not args and not kwargs:
+            args = (self.control, self.params, self.state, self.fluxes,
+                    self.met_data)
+        submodel = component_class(name)(*args, **kwargs)
+        self.submodels[name] = submodel
+
+        return submodel
+
+    @property
+    def bw(self):
+        """ BEWDY photosynthesis model """
+        return self.submodel("bewdy")
+
+    @property
+    def mt(self):
+        """ MATE photosynthesis model, of the photosynthetic pathway """
+        if self.control.ps_pathway == "C3":
+            return self.submodel("mate_c3")
+        return self.submodel("mate_c4")
+
+    @property
+    def rm(self):
+        """ Ross's optimal rooting depth model """
+        return self.submodel("rooting_depth", d0x=self.params.d0x,
+                             r0=self.params.r0,
+                             top_soil_depth=(self.params.topsoil_depth *
+                                             const.MM_TO_M))
+
     def calc_day_growth(self, project_day, fdecay, rdecay, daylen, doy, 
                         days_in_yr, yr_index, fsoilT):
         """Evolve plant state, photosynthesis, distribute N and C"
@@ -315,26 +396,31 @@ class PlantGrowth(object):
             self.state.wtfac_root = 1.0
        
         # Estimate photosynthesis 
-        if self.control.assim_model == "BEWDY":
-            self.bw.calculate_photosynthesis(frac_gcover, project_day, daylen)
-        elif self.control.assim_model == "MATE":
-            self.mt.calculate_photosynthesis(project_day, daylen)
-        else:
-            raise AttributeError('Unknown assimilation model')
+        self.photosynthesis(fc, project_day, daylen)
         
         # Calculate plant respiration
-        if self.control.respiration_model == "FIXED":
-            # Plant respiration assuming carbon-use efficiency.
-            self.fluxes.auto_resp = self.fluxes.gpp * self.params.cue
-        elif self.control.respiration_model == "TEMPERATURE":
-            raise RuntimeError, "Not implemented yet" 
-        elif self.control.respiration_model == "BIOMASS":
-            raise RuntimeError, "Not implemented yet" 
+        self.respiration()
         
         # Calculate NPP
         self.fluxes.npp_gCm2 = self.fluxes.gpp_gCm2 * self.params.cue
         self.fluxes.npp = self.fluxes.npp_gCm2 * const.GRAM_C_2_TONNES_HA
         
+    def photosynthesis_mate(self, frac_gcover, project_day, daylen):
+        """ GPP from MATE, assim_model MATE """
+        self.mt.calculate_photosynthesis(project_day, daylen)
+
+    def photosynthesis_bewdy(self, frac_gcover, project_day, daylen):
+        """ GPP from BEWDY, assim_model BEWDY """
+        self.bw.calculate_photosynthesis(frac_gcover, project_day, daylen)
+
+    def respiration_fixed(self):
+        """ Plant respiration assuming carbon-use efficiency,
+        respiration_model FIXED """
+        self.fluxes.auto_resp = self.fluxes.gpp * self.params.cue
+
+    def respiration_not_implemented(self):
+        raise RuntimeError, "Not implemented yet" 
+
     def calc_carbon_allocation_fracs(self, nitfac):
         """Carbon allocation fractions to move photosynthate through the plant.
 
@@ -360,222 +446,7 @@ class PlantGrowth(object):
         McMurtrie, R. E. et al (2000) Plant and Soil, 224, 135-152.
         
         """
-        if self.control.alloc_model == "FIXED":
-        
-            self.fluxes.alleaf = (self.params.c_alloc_fmax + nitfac *
-                                 (self.params.c_alloc_fmax - 
-                                 self.params.c_alloc_fmin))
-            
-            self.fluxes.alroot = (self.params.c_alloc_rmax + nitfac *
-                                 (self.params.c_alloc_rmax - 
-                                 self.params.c_alloc_rmin))
-
-            self.fluxes.albranch = (self.params.c_alloc_bmax + nitfac *
-                                   (self.params.c_alloc_bmax - 
-                                   self.params.c_alloc_bmin))
-        
-            # allocate remainder to stem
-            self.fluxes.alstem = (1.0 - self.fluxes.alleaf - 
-                                  self.fluxes.alroot - 
-                                  self.fluxes.albranch)
-            
-            self.fluxes.alcroot = self.params.c_alloc_cmax * self.fluxes.alstem
-            self.fluxes.alstem -= self.fluxes.alcroot
-            
-        elif self.control.alloc_model == "GRASSES":
-            
-            # if combining grasses with the deciduous model this calculation
-            # is done only during the leaf out period. See above.
-            if not self.control.deciduous_model:
-                self.calculate_growth_stress_limitation()
-            
-            # First figure out root allocation given available water & nutrients
-            # hyperbola shape to allocation
-            self.fluxes.alroot = (self.params.c_alloc_rmax * 
-                                  self.params.c_alloc_rmin / 
-                                 (self.params.c_alloc_rmin + 
-                                 (self.params.c_alloc_rmax - 
-                                  self.params.c_alloc_rmin) * 
-                                  self.state.prev_sma))
-            self.fluxes.alleaf = 1.0 - self.fluxes.alroot
-            
-            
-            # Now adjust root & leaf allocation to maintain balance, accounting 
-            # for stress e.g. -> Sitch et al. 2003, GCB.
-            
-            # leaf-to-root ratio under non-stressed conditons
-            lr_max = 0.8
-            
-            # Calculate adjustment on lr_max, based on current "stress"
-            # calculated from running mean of N and water stress
-            stress = lr_max * self.state.prev_sma
-                      
-            # calculate new allocation fractions based on imbalance ib *biomass*
-            mis_match = self.state.shoot / (self.state.root * stress)
-            
-            # reduce leaf allocation fraction
-            if mis_match > 1.0:
-                adj = self.fluxes.alleaf / mis_match
-                self.fluxes.alleaf = max(self.params.c_alloc_fmin, 
-                                         min(self.params.c_alloc_fmax, adj))
-                self.fluxes.alroot = 1.0 - self.fluxes.alleaf
-            # reduce root allocation    
-            else:
-                adj = self.fluxes.alroot * mis_match
-                self.fluxes.alroot = max(self.params.c_alloc_rmin, 
-                                         min(self.params.c_alloc_rmax, adj))
-                self.fluxes.alleaf = 1.0 - self.fluxes.alroot
-        
-            self.fluxes.alstem = 0.0
-            self.fluxes.albranch = 0.0
-            self.fluxes.alcroot = 0.0
-            
-            
-        elif self.control.alloc_model == "ALLOMETRIC":
-            
-            if not self.control.deciduous_model:
-                self.calculate_growth_stress_limitation()
-            
-            # Calculate tree height: allometric reln using the power function 
-            # (Causton, 1985)
-            self.state.canht = (self.params.heighto * 
-                                self.state.stem**self.params.htpower)
-
-            # LAI to stem sapwood cross-sectional area (As m-2 m-2) 
-            # (dimensionless)
-            # Assume it varies between LS0 and LS1 as a linear function of tree
-            # height (m) 
-            arg1 = self.state.sapwood * const.TONNES_AS_KG * const.M2_AS_HA
-            arg2 = self.state.canht * self.params.density * self.params.cfracts
-            sap_cross_sec_area = arg1 / arg2
-            
-            if not self.control.deciduous_model:
-                leaf2sap = self.state.lai / sap_cross_sec_area
-            else:
-                leaf2sap = self.state.max_lai / sap_cross_sec_area
-
-            # Allocation to leaves dependant on height. Modification of pipe 
-            # theory, leaf-to-sapwood ratio is not constant above a certain 
-            # height, due to hydraulic constraints (Magnani et al 2000; Deckmyn
-            # et al. 2006).
-            
-            if float_le(self.state.canht, self.params.height0):
-                leaf2sa_target = self.params.leafsap0
-            elif float_ge(self.state.canht, self.params.height1):
-                leaf2sa_target = self.params.leafsap1
-            else:
-                arg1 = self.params.leafsap0
-                arg2 = self.params.leafsap1 - self.params.leafsap0
-                arg3 = self.state.canht - self.params.height0
-                arg4 = self.params.height1 - self.params.height0
-                leaf2sa_target = arg1 + (arg2 * arg3 / arg4) 
-                
-            self.fluxes.alleaf = self.alloc_goal_seek(leaf2sap, leaf2sa_target, 
-                                                      self.params.c_alloc_fmax, 
-                                                      self.params.targ_sens) 
-            
-            
-            # figure out root allocation given available water & nutrients
-            # hyperbola shape to allocation, this is adjusted below as we aim
-            # to maintain a functional balance
-            self.fluxes.alroot = (self.params.c_alloc_rmax * 
-                                  self.params.c_alloc_rmin / 
-                                 (self.params.c_alloc_rmin + 
-                                 (self.params.c_alloc_rmax - 
-                                  self.params.c_alloc_rmin) * 
-                                  self.state.prev_sma))
-           
-            # Now adjust root & leaf allocation to maintain balance, accounting 
-            # for stress e.g. -> Sitch et al. 2003, GCB.
-            
-            # leaf-to-root ratio under non-stressed conditons
-            lr_max = 1.0
-            
-            # Calculate adjustment on lr_max, based on current "stress"
-            # calculated from running mean of N and water stress
-            stress = lr_max * self.state.prev_sma
-            
-            
-            # calculate imbalance, based on *biomass*
-            if not self.control.deciduous_model:
-                # Catch for floating point reset of root C mass
-                if float_eq(self.state.root, 0.0):
-                    mis_match = 1.9
-                else:
-                    mis_match = self.state.shoot / (self.state.root * stress)
-            else:                              
-                mis_match = (self.state.max_shoot / 
-                             (self.state.root * stress))
-            
-            # reduce leaf allocation fraction
-            if mis_match > 1.0:
-                orig_af = self.fluxes.alleaf
-                adj = self.fluxes.alleaf / mis_match
-                self.fluxes.alleaf = max(self.params.c_alloc_fmin, 
-                                         min(self.params.c_alloc_fmax, adj))
-                self.fluxes.alroot += (max(self.params.c_alloc_rmin, 
-                                           orig_af - self.fluxes.alleaf))
-            # reduce root allocation    
-            elif mis_match < 1.0:
-                orig_ar = self.fluxes.alroot
-                adj = self.fluxes.alroot * mis_match
-                self.fluxes.alroot = max(self.params.c_alloc_rmin, 
-                                         min(self.params.c_alloc_rmax, adj))
-                
-                reduction = max(0.0, orig_ar - self.fluxes.alroot)
-                self.fluxes.alleaf += max(self.params.c_alloc_fmax, reduction)
-            
-                  
-            # Allocation to branch dependent on relationship between the stem
-            # and branch
-            target_branch = (self.params.branch0 * 
-                             self.state.stem**self.params.branch1)
-            self.fluxes.albranch = self.alloc_goal_seek(self.state.branch, 
-                                                       target_branch, 
-                                                       self.params.c_alloc_bmax, 
-                                                       self.params.targ_sens) 
-            
-            coarse_root_target = (self.params.croot0 * 
-                                  self.state.stem**self.params.croot1)
-            self.fluxes.alcroot = self.alloc_goal_seek(self.state.croot, 
-                                                       coarse_root_target, 
-                                                       self.params.c_alloc_cmax, 
-                                                       self.params.targ_sens) 
-            
-            # Ensure we don't end up with alloc fractions that make no
-            # physical sense. In such a situation assume a bl
-            left_over = (1.0 - self.fluxes.alroot - self.fluxes.alleaf)
-            if (self.fluxes.albranch + self.fluxes.alcroot) > left_over:
-                if float_eq(self.state.croot, 0.0):
-                    self.fluxes.alcroot = 0.0
-                    self.fluxes.alstem = 0.5 * left_over
-                    self.fluxes.albranch = 0.5 * left_over
-                else:    
-                    self.fluxes.alcroot = 0.3 * left_over
-                    self.fluxes.alstem = 0.4 * left_over
-                    self.fluxes.albranch = 0.3 * left_over
-            
-            self.fluxes.alstem = (1.0 - self.fluxes.alroot - 
-                                        self.fluxes.albranch - 
-                                        self.fluxes.alleaf -
-                                        self.fluxes.alcroot)
-               
-               
-            # minimum allocation to leaves - without it tree would die, as this
-            # is done annually.
-            if self.control.deciduous_model:
-                if self.fluxes.alleaf < 0.05:
-                    min_leaf_alloc = 0.05
-                    if self.fluxes.alstem > min_leaf_alloc:
-                        self.fluxes.alstem -= min_leaf_alloc
-                    else:
-                        self.fluxes.alroot -= min_leaf_alloc
-                    self.fluxes.alleaf = min_leaf_alloc
-                
-        else:
-            raise AttributeError('Unknown C allocation model')
-        
-        
+        self.alloc_fracs(nitfac)
         
         #print self.fluxes.alleaf, \
         #          (self.fluxes.alstem + self.fluxes.albranch), \
@@ -594,6 +465,219 @@ class PlantGrowth(object):
         if float_gt(total_alloc, 1.0):
             raise RuntimeError, "Allocation fracs > 1" 
         
+    def alloc_fracs_fixed(self, nitfac):
+        """ Allocation fractions fixed by the leaf N:C, alloc_model FIXED """
+        self.fluxes.alleaf = (self.params.c_alloc_fmax + nitfac *
+                             (self.params.c_alloc_fmax -
+                             self.params.c_alloc_fmin))
+
+        self.fluxes.alroot = (self.params.c_alloc_rmax + nitfac *
+                             (self.params.c_alloc_rmax -
+                             self.params.c_alloc_rmin))
+
+        self.fluxes.albranch = (self.params.c_alloc_bmax + nitfac *
+                               (self.params.c_alloc_bmax -
+                               self.params.c_alloc_bmin))
+
+        # allocate remainder to stem
+        self.fluxes.alstem = (1.0 - self.fluxes.alleaf -
+                              self.fluxes.alroot -
+                              self.fluxes.albranch)
+
+        self.fluxes.alcroot = self.params.c_alloc_cmax * self.fluxes.alstem
+        self.fluxes.alstem -= self.fluxes.alcroot
+
+    def alloc_fracs_grasses(self, nitfac):
+        """ Allocation to leaves and roots only, balanced against the
+        growth stress, alloc_model GRASSES """
+        # if combining grasses with the deciduous model this calculation
+        # is done only during the leaf out period. See above.
+        if not self.control.deciduous_model:
+            self.calculate_growth_stress_limitation()
+
+        # First figure out root allocation given available water & nutrients
+        # hyperbola shape to allocation
+        self.fluxes.alroot = (self.params.c_alloc_rmax *
+                              self.params.c_alloc_rmin /
+                             (self.params.c_alloc_rmin +
+                             (self.params.c_alloc_rmax -
+                              self.params.c_alloc_rmin) *
+                              self.state.prev_sma))
+        self.fluxes.alleaf = 1.0 - self.fluxes.alroot
+
+
+        # Now adjust root & leaf allocation to maintain balance, accounting
+        # for stress e.g. -> Sitch et al. 2003, GCB.
+
+        # leaf-to-root ratio under non-stressed conditons
+        lr_max = 0.8
+
+        # Calculate adjustment on lr_max, based on current "stress"
+        # calculated from running mean of N and water stress
+        stress = lr_max * self.state.prev_sma
+
+        # calculate new allocation fractions based on imbalance ib *biomass*
+        mis_match = self.state.shoot / (self.state.root * stress)
+
+        # reduce leaf allocation fraction
+        if mis_match > 1.0:
+            adj = self.fluxes.alleaf / mis_match
+            self.fluxes.alleaf = max(self.params.c_alloc_fmin,
+                                     min(self.params.c_alloc_fmax, adj))
+            self.fluxes.alroot = 1.0 - self.fluxes.alleaf
+        # reduce root allocation
+        else:
+            adj = self.fluxes.alroot * mis_match
+            self.fluxes.alroot = max(self.params.c_alloc_rmin,
+                                     min(self.params.c_alloc_rmax, adj))
+            self.fluxes.alleaf = 1.0 - self.fluxes.alroot
+
+        self.fluxes.alstem = 0.0
+        self.fluxes.albranch = 0.0
+        self.fluxes.alcroot = 0.0
+
+    def alloc_fracs_allometric(self, nitfac):
+        """ Allocation following the allometric targets of the tree,
+        alloc_model ALLOMETRIC """
+        if not self.control.deciduous_model:
+            self.calculate_growth_stress_limitation()
+
+        # Calculate tree height: allometric reln using the power function
+        # (Causton, 1985)
+        self.state.canht = (self.params.heighto *
+                            self.state.stem**self.params.htpower)
+
+        # LAI to stem sapwood cross-sectional area (As m-2 m-2)
+        # (dimensionless)
+        # Assume it varies between LS0 and LS1 as a linear function of tree
+        # height (m)
+        arg1 = self.state.sapwood * const.TONNES_AS_KG * const.M2_AS_HA
+        arg2 = self.state.canht * self.params.density * self.params.cfracts
+        sap_cross_sec_area = arg1 / arg2
+
+        if not self.control.deciduous_model:
+            leaf2sap = self.state.lai / sap_cross_sec_area
+        else:
+            leaf2sap = self.state.max_lai / sap_cross_sec_area
+
+        # Allocation to leaves dependant on height. Modification of pipe
+        # theory, leaf-to-sapwood ratio is not constant above a certain
+        # height, due to hydraulic constraints (Magnani et al 2000; Deckmyn
+        # et al. 2006).
+
+        if float_le(self.state.canht, self.params.height0):
+            leaf2sa_target = self.params.leafsap0
+        elif float_ge(self.state.canht, self.params.height1):
+            leaf2sa_target = self.params.leafsap1
+        else:
+            arg1 = self.params.leafsap0
+            arg2 = self.params.leafsap1 - self.params.leafsap0
+            arg3 = self.state.canht - self.params.height0
+            arg4 = self.params.height1 - self.params.height0
+            leaf2sa_target = arg1 + (arg2 * arg3 / arg4)
+
+        self.fluxes.alleaf = self.alloc_goal_seek(leaf2sap, leaf2sa_target,
+                                                  self.params.c_alloc_fmax,
+                                                  self.params.targ_sens)
+
+
+        # figure out root allocation given available water & nutrients
+        # hyperbola shape to allocation, this is adjusted below as we aim
+        # to maintain a functional balance
+        self.fluxes.alroot = (self.params.c_alloc_rmax *
+                              self.params.c_alloc_rmin /
+                             (self.params.c_alloc_rmin +
+                             (self.params.c_alloc_rmax -
+                              self.params.c_alloc_rmin) *
+                              self.state.prev_sma))
+
+        # Now adjust root & leaf allocation to maintain balance, accounting
+        # for stress e.g. -> Sitch et al. 2003, GCB.
+
+        # leaf-to-root ratio under non-stressed conditons
+        lr_max = 1.0
+
+        # Calculate adjustment on lr_max, based on current "stress"
+        # calculated from running mean of N and water stress
+        stress = lr_max * self.state.prev_sma
+
+
+        # calculate imbalance, based on *biomass*
+        if not self.control.deciduous_model:
+            # Catch for floating point reset of root C mass
+            if float_eq(self.state.root, 0.0):
+                mis_match = 1.9
+            else:
+                mis_match = self.state.shoot / (self.state.root * stress)
+        else:
+            mis_match = (self.state.max_shoot /
+                         (self.state.root * stress))
+
+        # reduce leaf allocation fraction
+        if mis_match > 1.0:
+            orig_af = self.fluxes.alleaf
+            adj = self.fluxes.alleaf / mis_match
+            self.fluxes.alleaf = max(self.params.c_alloc_fmin,
+                                     min(self.params.c_alloc_fmax, adj))
+            self.fluxes.alroot += (max(self.params.c_alloc_rmin,
+                                       orig_af - self.fluxes.alleaf))
+        # reduce root allocation
+        elif mis_match < 1.0:
+            orig_ar = self.fluxes.alroot
+            adj = self.fluxes.alroot * mis_match
+            self.fluxes.alroot = max(self.params.c_alloc_rmin,
+                                     min(self.params.c_alloc_rmax, adj))
+
+            reduction = max(0.0, orig_ar - self.fluxes.alroot)
+            self.fluxes.alleaf += max(self.params.c_alloc_fmax, reduction)
+
+
+        # Allocation to branch dependent on relationship between the stem
+        # and branch
+        target_branch = (self.params.branch0 *
+                         self.state.stem**self.params.branch1)
+        self.fluxes.albranch = self.alloc_goal_seek(self.state.branch,
+                                                   target_branch,
+                                                   self.params.c_alloc_bmax,
+                                                   self.params.targ_sens)
+
+        coarse_root_target = (self.params.croot0 *
+                              self.state.stem**self.params.croot1)
+        self.fluxes.alcroot = self.alloc_goal_seek(self.state.croot,
+                                                   coarse_root_target,
+                                                   self.params.c_alloc_cmax,
+                                                   self.params.targ_sens)
+
+        # Ensure we don't end up with alloc fractions that make no
+        # physical sense. In such a situation assume a bl
+        left_over = (1.0 - self.fluxes.alroot - self.fluxes.alleaf)
+        if (self.fluxes.albranch + self.fluxes.alcroot) > left_over:
+            if float_eq(self.state.croot, 0.0):
+                self.fluxes.alcroot = 0.0
+                self.fluxes.alstem = 0.5 * left_over
+                self.fluxes.albranch = 0.5 * left_over
+            else:
+                self.fluxes.alcroot = 0.3 * left_over
+                self.fluxes.alstem = 0.4 * left_over
+                self.fluxes.albranch = 0.3 * left_over
+
+        self.fluxes.alstem = (1.0 - self.fluxes.alroot -
+                                    self.fluxes.albranch -
+                                    self.fluxes.alleaf -
+                                    self.fluxes.alcroot)
+
+
+        # minimum allocation to leaves - without it tree would die, as this
+        # is done annually.
+        if self.control.deciduous_model:
+            if self.fluxes.alleaf < 0.05:
+                min_leaf_alloc = 0.05
+                if self.fluxes.alstem > min_leaf_alloc:
+                    self.fluxes.alstem -= min_leaf_alloc
+                else:
+                    self.fluxes.alroot -= min_leaf_alloc
+                self.fluxes.alleaf = min_leaf_alloc
+
     def alloc_goal_seek(self, simulated, target, alloc_max, sensitivity):
         
         # Sensitivity parameter characterises how allocation fraction respond 
@@ -972,118 +1056,126 @@ class PlantGrowth(object):
         
         
     
-    def calculate_nuptake(self, project_day, fsoilT):
-        """ N uptake depends on the rate at which soil mineral N is made 
-        available to the plants.
-        
-        Returns:
-        --------
-        nuptake : float
-            N uptake
-            
-        References:
-        -----------
-        * Dewar and McMurtrie, 1996, Tree Physiology, 16, 161-171.    
+    # calculate_nuptake is bound to one of these by nuptake_model, each
+    # returns the N uptake [t/ha/d]
+    def nuptake_constant(self, project_day, fsoilT):
+        """ Constant N uptake, nuptake_model 0 """
+        nuptake = self.params.nuptakez
+
+        return nuptake
+
+    def nuptake_inorgn(self, project_day, fsoilT):
+        """ N uptake proportional to the inorganic N pool, nuptake_model 1
+        """
+        # evaluate nuptake : proportional to dynamic inorganic N pool
+        nuptake = self.params.rateuptake * self.state.inorgn
+
+        return nuptake
+
+    def nuptake_root_biomass(self, project_day, fsoilT):
+        """ N uptake saturating with root biomass, nuptake_model 2
+
+        Reference:
+        ----------
+        * Dewar and McMurtrie, 1996, Tree Physiology, 16, 161-171.
+        """
+        # N uptake is a saturating function on root biomass following
+        # Dewar and McMurtrie, 1996.
+
+        # supply rate of available mineral N
+        U0 = self.params.rateuptake * self.state.inorgn
+        Kr = self.params.kr
+        nuptake = max(U0 * self.state.root / (self.state.root + Kr), 0.0)
+
+        # Make minimum uptake rate supply rate for deciduous_model cases
+        # otherwise it is possible when growing from scratch we don't have
+        # enough root mass to obtain N at the annual time step
+        # I don't see an obvious better solution?
+        #if self.control.deciduous_model:
+        #    nuptake = max(U0 * self.state.root / (self.state.root + Kr), U0)
+
+        return nuptake
+
+    def nuptake_soil_moisture(self, project_day, fsoilT):
+        """ N uptake as a function of available soil N and soil moisture,
+        nuptake_model 3
+
+        Reference:
+        ----------
         * Raich et al. 1991, Ecological Applications, 1, 399-429.
-            
         """
-        if self.control.nuptake_model == 0:
-            # Constant N uptake
-            nuptake = self.params.nuptakez
-        elif self.control.nuptake_model == 1:
-            # evaluate nuptake : proportional to dynamic inorganic N pool
-            nuptake = self.params.rateuptake * self.state.inorgn
-        elif self.control.nuptake_model == 2:
-            # N uptake is a saturating function on root biomass following
-            # Dewar and McMurtrie, 1996.
-            
-            # supply rate of available mineral N
-            U0 = self.params.rateuptake * self.state.inorgn
-            Kr = self.params.kr
-            nuptake = max(U0 * self.state.root / (self.state.root + Kr), 0.0)
-            
-            # Make minimum uptake rate supply rate for deciduous_model cases
-            # otherwise it is possible when growing from scratch we don't have
-            # enough root mass to obtain N at the annual time step
-            # I don't see an obvious better solution?
-            #if self.control.deciduous_model:   
-            #    nuptake = max(U0 * self.state.root / (self.state.root + Kr), U0)
-            
-            
-        elif self.control.nuptake_model == 3:
-            # N uptake is a function of available soil N, soil moisture 
-            # following a Michaelis-Menten approach 
-            # See Raich et al. 1991, pg. 423.
-            
-            vcn = 1.0 / 0.0215 # 46.4
-            arg1 = (vcn * self.state.shootn) - self.state.shoot
-            arg2 = (vcn * self.state.shootn) + self.state.shoot
-            self.params.ac += self.params.adapt * arg1 / arg2
-            self.params.ac = max(min(1.0, self.params.ac), 0.0)
-            
-            # soil moisture is assumed to influence nutrient diffusion rate
-            # through the soil, ks [0,1]
-            theta = self.state.pawater_root / self.params.wcapac_root 
-            ks = 0.9 * theta**3.0 + 0.1
-            
-            arg1 = self.params.nmax * ks * self.state.inorgn 
-            arg2 = self.params.knl + (ks * self.state.inorgn)
-            arg3 = exp(0.0693 * self.met_data['tair'][project_day])
-            arg4 = 1.0 - self.params.ac
-            nuptake = (arg1 / arg2) * arg3 * arg4
-        elif self.control.nuptake_model == 4:
-            """ N uptake function as a function of root mass, soil temperature,
-            accounting for plant N status, available inorganic N.
-            
-            Reference:
-            ----------
-            See supplementary material.
-            * S. Zaehle and A. D. Friend (2010) Carbon and nitrogen cycle 
-              dynamics in the O-CN land surface model: 1. Model description, 
-              site-scale evaluation, and sensitivity to parameter estimates.
-              Global Biogeochemical Cycles, 24, GB1005.
-            """
-            max_leaf_NC = 0.04
-            min_leaf_NC = 0.00625
-            
-            # grams m-2
-            N_avail = self.state.inorgn * 100
-            Croot = self.state.root * 100
-            
-            #
-            ## THERE MUST BE A CONVERSION FACTOR HERE?
-            #
-            # maximum N uptake cpcity per unit fine root mass 
-            # (micrograms N g-1 C d-1)
-            vmax = 5.14
-            
-            # rate of N uptake not assoicate with Michaelis-Menten kinetics 
-            # (unitless)
-            K1_Nmin = 0.05 
-            
-            # half saturation concentration of fine root N uptake (g N m-2)
-            K2_Nmin = 0.83 
-            
-            if self.control.deciduous_model:
-                NC_plant = ( (self.state.shootnc + 
-                              self.state.rootnc + 
-                              self.state.nstore/self.state.cstore) / 3.0 )
-            else:
-                NC_plant = ( (self.state.shootnc + 
-                              self.state.rootnc) / 2.0 )
-            f_NC_plant = (max(0.0, (NC_plant - max_leaf_NC) / 
-                                   (max_leaf_NC - min_leaf_NC)))
-            
-            # tonnes/hectare
-            nuptake = (vmax * Nmin * (K1_Nmin + (1.0 / (Nmin + K2_Nmin))) * 
-                       fsoilT * f_NC_plant * Croot) * 0.01
+        # N uptake is a function of available soil N, soil moisture
+        # following a Michaelis-Menten approach
+        # See Raich et al. 1991, pg. 423.
+
+        vcn = 1.0 / 0.0215 # 46.4
+        arg1 = (vcn * self.state.shootn) - self.state.shoot
+        arg2 = (vcn * self.state.shootn) + self.state.shoot
+        self.params.ac += self.params.adapt * arg1 / arg2
+        self.params.ac = max(min(1.0, self.params.ac), 0.0)
+
+        # soil moisture is assumed to influence nutrient diffusion rate
+        # through the soil, ks [0,1]
+        theta = self.state.pawater_root / self.params.wcapac_root
+        ks = 0.9 * theta**3.0 + 0.1
+
+        arg1 = self.params.nmax * ks * self.state.inorgn
+        arg2 = self.params.knl + (ks * self.state.inorgn)
+        arg3 = exp(0.0693 * self.met_data['tair'][project_day])
+        arg4 = 1.0 - self.params.ac
+        nuptake = (arg1 / arg2) * arg3 * arg4
+
+        return nuptake
+
+    def nuptake_ocn(self, project_day, fsoilT):
+        """ N uptake as a function of root mass, soil temperature,
+        accounting for plant N status, available inorganic N, nuptake_model 4
+
+        Reference:
+        ----------
+        See supplementary material.
+        * S. Zaehle and A. D. Friend (2010) Carbon and nitrogen cycle
+          dynamics in the O-CN land surface model: 1. Model description,
+          site-scale evaluation, and sensitivity to parameter estimates.
+          Global Biogeochemical Cycles, 24, GB1005.
+        """
+        max_leaf_NC = 0.04
+        min_leaf_NC = 0.00625
 
+        # grams m-2
+        N_avail = self.state.inorgn * 100
+        Croot = self.state.root * 100
 
+        #
+        ## THERE MUST BE A CONVERSION FACTOR HERE?
+        #
+        # maximum N uptake cpcity per unit fine root mass
+        # (micrograms N g-1 C d-1)
+        vmax = 5.14
+
+        # rate of N uptake not assoicate with Michaelis-Menten kinetics
+        # (unitless)
+        K1_Nmin = 0.05
+
+        # half saturation concentration of fine root N uptake (g N m-2)
+        K2_Nmin = 0.83
+
+        if self.control.deciduous_model:
+            NC_plant = ( (self.state.shootnc +
+                          self.state.rootnc +
+                          self.state.nstore/self.state.cstore) / 3.0 )
         else:
-            raise AttributeError('Unknown N uptake option')
-        
+            NC_plant = ( (self.state.shootnc +
+                          self.state.rootnc) / 2.0 )
+        f_NC_plant = (max(0.0, (NC_plant - max_leaf_NC) /
+                               (max_leaf_NC - min_leaf_NC)))
+
+        # tonnes/hectare
+        nuptake = (vmax * Nmin * (K1_Nmin + (1.0 / (Nmin + K2_Nmin))) *
+                   fsoilT * f_NC_plant * Croot) * 0.01
+
         return nuptake
-    
+
     def carbon_allocation(self, nitfac, doy, days_in_yr):
         """ C distribution - allocate available C through system
 
@@ -1,7 +1,10 @@
 import os
 import csv
+from operator import attrgetter
+import numpy as np
 import constants as const
 from _version import __version__ as git_revision
+from output_io import OutputWriter
 
 __author__  = "Martin De Kauwe"
 __version__ = "1.0 (21.03.2011)"
@@ -15,8 +18,15 @@ class PrintOutput(object):
     Potential really to print anything, but for the moment the obvious.
 
     ** Note we are overiding the model data class here
+
+    The daily output is streamed: each day is written as a row of a
+    preallocated float64 block which is written to the file whenever it
+    fills up (and when the file is closed), so memory doesn't grow with the
+    length of the run.
     """
-    def __init__(self, params, state, fluxes, control, files, print_opts):
+    def __init__(self, params, state, fluxes, control, files, print_opts,
+                 chunk_size=1024, append=False, print_vars=None,
+                 truncate_at=None):
         """
         Parameters
         ----------
@@ -30,6 +40,17 @@ class PrintOutput(object):
             model fluxes
         print_opts : object
             output print options
+        chunk_size : int, optional
+            number of days of output held before they are written
+        append : logical, optional
+            add the daily output to the end of an existing output file
+        print_vars : tuple of lists, optional
+            (state, flux) variables to print, in order, e.g. as saved in a
+            checkpoint, rather than in the order of print_opts
+        truncate_at : int, optional
+            when appending, cut the existing output file back to this
+            position first, e.g. where the output had got to when a checkpoint
+            was written, so days which are run again aren't written twice
 
         """
         self.params = params
@@ -49,34 +70,42 @@ class PrintOutput(object):
         # equilibrium
         self.out_param_fname = self.files.out_param_fname
         
-        if self.control.output_ascii:  
-            self.odaily = open(self.files.out_fname, 'wb')
-            self.wr = csv.writer(self.odaily, delimiter=',',
-                                 quoting=csv.QUOTE_NONE, escapechar=' ')
-        else:
-            self.odaily = open(self.files.out_fname, 'wb')
-            binhdr_fname = self.files.out_fname.split(".")[0] + '.bin.hdr' 
-            self.odaily_hdr_fp = open(binhdr_fname, 'wb')
         # daily output file hdr
+        self.append = append
+        self.truncate_at = truncate_at
         try:
             self.print_fluxes = []
             self.print_state = []
-            for i, var in enumerate(self.print_opts):
-                #print var
-                try:
-                    if hasattr(self.state, var):
-                        self.print_state.append(var)
-                    else:
-                        self.print_fluxes.append(var)
-                except AttributeError:
-                    err_msg = "Error accessing var to print: %s" % var
-                    raise AttributeError, err_msg
+            if print_vars is not None:
+                # keep the column order of the output being carried on
+                self.print_state.extend(print_vars[0])
+                self.print_fluxes.extend(print_vars[1])
+            else:
+                for i, var in enumerate(self.print_opts):
+                    #print var
+                    try:
+                        if hasattr(self.state, var):
+                            self.print_state.append(var)
+                        else:
+                            self.print_fluxes.append(var)
+                    except AttributeError:
+                        err_msg = "Error accessing var to print: %s" % var
+                        raise AttributeError, err_msg
 
             self.write_daily_output_header()
         except IOError:
-            raise IOError("Can't open %s file for write" % self.odaily)
-        
-        self.day_output = []
+            raise IOError("Can't open %s file for write" %
+                          self.files.out_fname)
+
+        # daily output buffer: year, doy, state vars, flux vars
+        self.get_state = tuple_getter(self.print_state)
+        self.get_fluxes = tuple_getter(self.print_fluxes)
+        self.st_state = 2
+        self.st_fluxes = 2 + len(self.print_state)
+        self.chunk = np.empty((chunk_size,
+                               self.st_fluxes + len(self.print_fluxes)))
+        self.nbuf = 0
+        self.nrows = 0
 
     def get_vars_to_print(self):
         """ return lists of variable names to print out """
@@ -155,7 +184,7 @@ class PrintOutput(object):
                    'calc_sw_params', 'alloc_model','fixed_stem_nc', \
                    'ps_pathway','gs_model','exudation',\
                    'ncycle','adjust_rtslow', "respiration_model",\
-                   'frost']
+                   'frost', 'soil_model']
         
         self.dump_ini_data("[git]\n", None, ignore, special, 
                             oparams, print_tag=False, print_files=False, git=True)
@@ -194,7 +223,7 @@ class PrintOutput(object):
         try:
             fp.write(ini_section_tag)
             data = [i for i in dir(obj) if not i.startswith('__') \
-                    and i not in ignore]
+                    and i not in ignore and hasattr(obj, i)]
             data.sort()
             
             if print_tag == False and print_files == False and git == False:
@@ -211,49 +240,168 @@ class PrintOutput(object):
             raise IOError("Error writing params file")
 
     def write_daily_output_header(self):
-        
+        """ Open the daily output file and write the header, the binary
+        file is self-describing, see output_io """
+        header = []
+        header.extend(["year","doy"])
+        header.extend(["%s" % (var) for var in self.print_state])
+        header.extend(["%s" % (var) for var in self.print_fluxes])
+
+        fname = self.files.out_fname
         if self.control.output_ascii:
-            self.wr.writerow(["%s:%s" % ("#Git_revision_code", self.revision_code.replace(" ", ""))])
-            header = []
-            header.extend(["year","doy"])
-            header.extend(["%s" % (var) for var in self.print_state])
-            header.extend(["%s" % (var) for var in self.print_fluxes])
-            self.wr.writerow(header)        
+            existing = (self.append and os.path.exists(fname) and
+                        os.path.getsize(fname) > 0)
+            if existing:
+                self.check_daily_output_header(fname, header)
+                if self.truncate_at is not None:
+                    self.truncate_daily_output(fname, self.truncate_at)
+            self.odaily = open(fname, 'ab' if self.append else 'wb')
+            self.wr = csv.writer(self.odaily, delimiter=',',
+                                 quoting=csv.QUOTE_NONE, escapechar=' ')
+            if not existing:
+                self.wr.writerow(["%s:%s" % ("#Git_revision_code", self.revision_code.replace(" ", ""))])
+                self.wr.writerow(header)
         else:
-            self.odaily_hdr_fp.write("%s:%s\n" % \
-                                    ("#Git_revision_code", self.revision_code))
-            buff1 = (",".join(("%s" % (var) for var in self.print_state)))
-            buff2 = (",".join(("%s" % (var) for var in self.print_fluxes)))
-            self.odaily_hdr_fp.write("year,doy,"+ buff1+","+ buff2+"\n")
-            self.odaily_bin_hdr = "year,doy,"+ buff1+","+ buff2
-            
-            
+            self.odaily = OutputWriter(fname, header, self.revision_code,
+                                       append=self.append,
+                                       end=self.truncate_at)
+
+    def check_daily_output_header(self, fname, header):
+        """ Check an existing csv output file has the same columns, in the
+        same order, before it is appended to
+
+        Parameters:
+        -----------
+        fname : string
+            output filename
+        header : list of strings
+            column names of the output
+        """
+        f = open(fname, 'rb')
+        try:
+            rows = csv.reader(f, delimiter=',', quoting=csv.QUOTE_NONE,
+                              escapechar=' ')
+            existing = None
+            for row in rows:
+                if row and not row[0].startswith("#"):
+                    existing = [var.strip() for var in row]
+                    break
+        finally:
+            f.close()
+        if existing != header:
+            err_msg = ("Can't append to %s, it holds different variables"
+                       % fname)
+            raise RuntimeError, err_msg
+
+    def truncate_daily_output(self, fname, end):
+        """ Cut an existing csv output file back to a position
+
+        Parameters:
+        -----------
+        fname : string
+            output filename
+        end : int
+            position to cut the file back to
+        """
+        if end > os.path.getsize(fname):
+            err_msg = ("Can't append to %s, it doesn't hold the output up to "
+                       "position %d" % (fname, end))
+            raise RuntimeError, err_msg
+        f = open(fname, 'r+b')
+        try:
+            f.truncate(end)
+        finally:
+            f.close()
+
+    def output_end(self):
+        """ Position of the end of the daily output file, once the buffered
+        output has been written, e.g. to store in a checkpoint
+
+        Returns:
+        --------
+        end : int
+            size of the output file
+        """
+        self.flush()
+        if self.control.output_ascii:
+            if not self.odaily.closed:
+                self.odaily.flush()
+            return os.path.getsize(self.files.out_fname)
+        return self.odaily.tell()
+
+    def save_daily_outputs(self, year, doy):
+        """ Save the daily fluxes + state as the next row of the output
+        buffer, writing the buffer out if it is full.
+
+        Parameters:
+        -----------
+        year : float
+            simulation year
+        doy : integer
+            day of year
+        """
+        row = self.chunk[self.nbuf]
+        row[0] = year
+        row[1] = doy
+        try:
+            row[self.st_state:self.st_fluxes] = self.get_state(self.state)
+            row[self.st_fluxes:] = self.get_fluxes(self.fluxes)
+        except TypeError:
+            # something which isn't a number, e.g. an unset None
+            values = (self.get_state(self.state) +
+                      self.get_fluxes(self.fluxes))
+            row[self.st_state:] = [np.nan if v is None else v for v in values]
+
+        self.nbuf += 1
+        if self.nbuf == len(self.chunk):
+            self.flush()
+
+    def flush(self):
+        """ Write out the buffered daily outputs """
+        if self.nbuf == 0:
+            return
+        if self.control.output_ascii:
+            self.write_daily_outputs_file(self.chunk[:self.nbuf])
+        else:
+            self.write_daily_outputs_file_to_binary(self.chunk[:self.nbuf])
+        self.nrows += self.nbuf
+        self.nbuf = 0
+
     def write_daily_outputs_file(self, day_outputs):
         """ Write daily outputs to a csv file """
-        self.wr.writerows(day_outputs)
+        rows = day_outputs.tolist()
+        for row in rows:
+            row[1] = int(row[1]) # doy
+        self.wr.writerows(rows)
 
     def write_daily_outputs_file_to_binary(self, day_outputs):
-        """ Write daily outputs to a binay file 
-        
-        Not properly implemented:
-            - Need to add something to make sure hdr info is attached to output
-              file.
-            - Also need a flag in the control to switch this on.
-        """
-        from numpy import array
-        a = array(day_outputs,'float32')
-        a.tofile(self.odaily)
-        
-        #from array import array
-        #for i in xrange(len(day_outputs)):
-        #    float_array = array('d', day_outputs[i])
-        #    float_array.tofile(self.odaily)
+        """ Write daily outputs to a binary file, as one float64 chunk, see
+        output_io.read_output to read it back """
+        self.odaily.write(day_outputs)
 
-    def clean_up(self, nrows=None):
-        """ close the output file that holds the daily output """
+    def clean_up(self):
+        """ write out anything left in the buffer and close the output
+        file that holds the daily output """
+        self.flush()
         self.odaily.close()
-        if not self.control.output_ascii:
-            self.odaily_hdr_fp.write("nrows=%d\n" % (nrows))
-            self.odaily_hdr_fp.write("ncols=%d\n" % \
-                                     (len(self.odaily_bin_hdr.split(","))))
-            self.odaily_hdr_fp.close()
+
+
+def tuple_getter(names):
+    """ Precompiled getter returning a tuple of the named attributes
+
+    Parameters:
+    -----------
+    names : list of strings
+        attribute names
+
+    Returns:
+    --------
+    getter : function
+        getter(obj) -> tuple of values, in the order of names
+    """
+    if len(names) == 0:
+        return lambda obj: ()
+    elif len(names) == 1:
+        get = attrgetter(names[0])
+        return lambda obj: (get(obj),)
+    return attrgetter(*names)
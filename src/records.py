@@ -0,0 +1,121 @@
+""" Model control, params, state, fluxes and files record objects.
+
+The default_* modules define every model variable and its default value. The
+classes here are built from those modules once, at import, and each model
+instance gets its own record objects rather than sharing (and reloading) the
+module level ones, so models can safely coexist in one process.
+
+Variables which are only created while the model runs (i.e. they have no
+default) are declared in the *_extra lists. Until they are set they are
+absent, exactly as they would be from the modules, i.e. hasattr is False.
+"""
+
+import types
+import default_control
+import default_params
+import default_state
+import default_fluxes
+import default_files
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+# set by the model, but without a default value
+control_extra = ['startday', 'startmonth', 'startyear']
+params_extra = ['Ec', 'Egamma', 'Eo', 'Kc25', 'Ko25', 'Kp25', 'Oi',
+                'alpha_psii', 'delsv', 'delsvp', 'eavp', 'edv', 'edvp',
+                'fspec', 'gbs', 'labs', 'lai_cover', 'rub_sf', 'slainit',
+                'vpmax', 'vpmaxna', 'vpmaxnb', 'vpr', 'xpart_j']
+state_extra = ['c_to_alloc_croot', 'fipar', 'fpar', 'n_to_alloc_croot',
+               'wtfac_tsoil']
+fluxes_extra = ['alcroot', 'bnrate', 'brate', 'cnrate', 'crate', 'gpp_am_pm',
+                'lnrate', 'lrate', 'ninflow', 'nuptake_old', 'temperature',
+                'wnimrate', 'wnmobrate', 'wrate']
+files_extra = []
+
+
+class ModelRecord(object):
+    """ Base for the record classes, subclasses set __slots__ and
+    __defaults__, a tuple of (name, default value) pairs """
+    __slots__ = ()
+    __defaults__ = ()
+
+    def __init__(self):
+        for (name, value) in self.__defaults__:
+            if isinstance(value, list):
+                value = list(value)
+            object.__setattr__(self, name, value)
+
+    def __copy__(self):
+        new = object.__new__(self.__class__)
+        for name in self.__slots__:
+            try:
+                value = getattr(self, name)
+            except AttributeError:
+                continue
+            if isinstance(value, list):
+                value = list(value)
+            object.__setattr__(new, name, value)
+        return new
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__
+                    if hasattr(self, name))
+
+    def __setstate__(self, state):
+        for (name, value) in state.iteritems():
+            object.__setattr__(self, name, value)
+
+
+def default_values(module):
+    """ (name, value) pairs of the variables defined in a default_* module
+
+    Parameters:
+    ----------
+    module : module
+        one of the default_* modules
+
+    Returns:
+    --------
+    defaults : tuple
+        sorted (name, value) pairs
+    """
+    defaults = []
+    for name in sorted(vars(module)):
+        value = getattr(module, name)
+        if (name.startswith('_') or
+            isinstance(value, (types.ModuleType, types.FunctionType))):
+            continue
+        defaults.append((name, value))
+    return tuple(defaults)
+
+def record_class(name, module, extra):
+    """ Build the record class for one of the default_* modules
+
+    Parameters:
+    ----------
+    name : string
+        class name
+    module : module
+        default_* module
+    extra : list
+        variables set while the model runs, without a default
+
+    Returns:
+    --------
+    cls : class
+        ModelRecord subclass with a slot per variable
+    """
+    defaults = default_values(module)
+    slots = sorted(set(n for (n, v) in defaults) | set(extra))
+    return type(name, (ModelRecord,), {"__slots__": tuple(slots),
+                                       "__defaults__": defaults,
+                                       "__module__": __name__})
+
+Control = record_class("Control", default_control, control_extra)
+Params = record_class("Params", default_params, params_extra)
+State = record_class("State", default_state, state_extra)
+Fluxes = record_class("Fluxes", default_fluxes, fluxes_extra)
+Files = record_class("Files", default_files, files_extra)
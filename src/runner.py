@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+""" Run a set of G'DAY simulations (sites, treatments, factorial experiments)
+in parallel across a pool of worker processes.
+
+Each run is described by a spec dictionary:
+
+    {"cfg_fname": "params/NCEAS_DUKE_model_youngforest_amb.cfg",
+     "overrides": {"files.out_fname": "outputs/duke_amb_sla4.csv",
+                   "sla": 4.0},
+     "name": "duke_amb_sla4",
+     "spin_up": False}
+
+only "cfg_fname" is required. Overrides are applied on top of the .cfg file
+(see file_parser.apply_overrides), so runs which share a .cfg file must each
+be given their own "files.out_fname".
+
+Every run is done in its own worker process, so a run which fails or
+misbehaves can't affect any of the others. Each distinct met file is read
+once, before the workers start, into a block of shared memory which every
+worker reads from, so memory use grows with the number of met files rather
+than the number of workers.
+"""
+
+import sys
+import time
+import traceback
+import multiprocessing
+from gday import Gday
+from file_parser import met_filename, read_met_forcing
+from met_forcing import shared_forcing
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+# met forcing by filename, set up by run_experiment before the worker
+# processes are forked, so they inherit it
+SHARED_FORCING = {}
+
+def run_experiment(specs, processes=None, met_header=4, progress=sys.stderr,
+                   share_forcing=True):
+    """ Run every spec across a pool of worker processes.
+
+    Parameters:
+    ----------
+    specs : list of dictionaries
+        run specifications, see module docstring
+    processes : int, optional
+        number of worker processes, defaults to the number of cores
+    met_header : int
+        row number of met file header with variable name
+    progress : file, optional
+        progress messages are written here as runs finish, None to be quiet
+    share_forcing : logical, optional
+        read each met file once into shared memory for all the workers,
+        rather than every run reading its own
+
+    Returns:
+    --------
+    results : list of dictionaries
+        one per spec, in the same order, with keys "name", "ok", "out_fname",
+        "state" (final model state), "error" (traceback) and "elapsed"
+    """
+    for i, spec in enumerate(specs):
+        if "cfg_fname" not in spec:
+            err_msg = "Run spec %d doesn't have a cfg_fname" % i
+            raise RuntimeError, err_msg
+
+    tasks = [(i, spec, met_header) for i, spec in enumerate(specs)]
+    results = [None] * len(tasks)
+    if len(tasks) == 0:
+        return results
+
+    if share_forcing:
+        load_shared_forcing(specs, met_header)
+
+    # one run per worker process so no model state leaks between runs
+    pool = multiprocessing.Pool(processes, maxtasksperchild=1)
+    try:
+        for n, (i, result) in enumerate(pool.imap_unordered(run_spec, tasks)):
+            results[i] = result
+            if progress is not None:
+                status = "ok" if result["ok"] else "FAILED"
+                progress.write("[%d/%d] %s %s (%.1f s)\n" %
+                               (n + 1, len(tasks), result["name"], status,
+                                result["elapsed"]))
+                progress.flush()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        SHARED_FORCING.clear()
+
+    return results
+
+def load_shared_forcing(specs, met_header):
+    """ Read the met file of every spec, once per file, into shared memory.
+
+    A spec whose .cfg or met file can't be read is skipped, the run then
+    fails in its worker and the error is reported with the other results.
+
+    Parameters:
+    ----------
+    specs : list of dictionaries
+        run specifications, see module docstring
+    met_header : int
+        row number of met file header with variable name
+    """
+    SHARED_FORCING.clear()
+    for spec in specs:
+        try:
+            met_fname = met_filename(spec["cfg_fname"], spec.get("overrides"))
+            if met_fname not in SHARED_FORCING:
+                met_data = read_met_forcing(met_fname, met_header)
+                SHARED_FORCING[met_fname] = shared_forcing(met_data)
+        except Exception:
+            continue
+
+def run_spec(task):
+    """ Run a single spec, executed in a worker process.
+
+    Parameters:
+    ----------
+    task : tuple
+        (index, spec, met_header)
+
+    Returns:
+    --------
+    index : int
+        position of the spec in the list passed to run_experiment
+    result : dictionary
+        see run_experiment
+    """
+    (index, spec, met_header) = task
+    name = spec.get("name", spec["cfg_fname"])
+    result = {"name": name, "ok": False, "out_fname": None, "state": None,
+              "error": None, "elapsed": 0.0}
+
+    start_time = time.time()
+    try:
+        spin_up = spec.get("spin_up", False)
+        G = Gday(spec["cfg_fname"], spin_up=spin_up, met_header=met_header,
+                 overrides=spec.get("overrides"), forcing=SHARED_FORCING)
+        if spin_up:
+            G.spin_up_pools()
+        else:
+            G.run_sim()
+
+        result["out_fname"] = G.files.out_fname
+        result["state"] = dict((var, getattr(G.state, var))
+                               for var in dir(G.state)
+                               if not var.startswith("_") and
+                               isinstance(getattr(G.state, var, None),
+                                          (int, float)))
+        result["ok"] = True
+    except Exception:
+        result["error"] = traceback.format_exc()
+    result["elapsed"] = time.time() - start_time
+
+    return (index, result)
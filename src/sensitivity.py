@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+""" Global sensitivity analysis of model outputs to the .cfg parameters.
+
+Parameters are given by name, as in default_params, with the range to vary
+them over (in the units of the .cfg file, i.e. per year), e.g.
+
+    ranges = [("sla", 3.0, 6.0), ("g1", 2.0, 4.0), ("finesoil", 0.2, 0.6)]
+    samples = morris_design(ranges, ntrajectories=20)
+    y = evaluate(fname, ranges, samples, ["npp", "lai"])
+    morris_indices(samples, y["npp"], ranges)["mu_star"]
+
+or with saltelli_design and sobol_indices for first-order and total Sobol
+indices. The samples are run in memory as GdayEnsembles of batch_size
+members, optionally spread over a pool of processes, rather than writing a
+.cfg file for each sample. Each output is reduced to one number per sample by
+a summary function, by default the mean over the run.
+
+References:
+----------
+* Morris, M. D. (1991) Technometrics, 33, 161-174.
+* Campolongo, F. et al. (2007) Environmental Modelling & Software, 22,
+  1509-1518.
+* Saltelli, A. et al. (2010) Computer Physics Communications, 181, 259-270.
+"""
+
+import multiprocessing
+import numpy as np
+import default_params
+from ensemble import GdayEnsemble
+from file_parser import read_config, ModelConfig
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+def check_ranges(ranges):
+    """ Parameter names and bounds, checked
+
+    Parameters:
+    ----------
+    ranges : list of tuples
+        (parameter name, lower bound, upper bound)
+
+    Returns:
+    --------
+    names : list of strings
+        parameter names
+    lower : array
+        lower bounds
+    upper : array
+        upper bounds
+    """
+    if len(ranges) == 0:
+        raise RuntimeError, "Sensitivity analysis needs at least one parameter"
+    names = [r[0] for r in ranges]
+    for (name, low, high) in ranges:
+        if not hasattr(default_params, name):
+            err_msg = "%s isn't a model parameter" % name
+            raise RuntimeError, err_msg
+        if not high > low:
+            err_msg = "Range of %s is empty: %s to %s" % (name, low, high)
+            raise RuntimeError, err_msg
+    if len(set(names)) != len(names):
+        raise RuntimeError, "Parameters can only be given one range each"
+    lower = np.array([float(r[1]) for r in ranges])
+    upper = np.array([float(r[2]) for r in ranges])
+
+    return (names, lower, upper)
+
+def morris_design(ranges, ntrajectories, nlevels=4, seed=None):
+    """ Morris one-at-a-time trajectories
+
+    Each trajectory starts at a random point of a grid of nlevels values
+    across each range and moves one parameter at a time, in random order, by
+    nlevels / (2 (nlevels - 1)) of its range.
+
+    Parameters:
+    ----------
+    ranges : list of tuples
+        (parameter name, lower bound, upper bound)
+    ntrajectories : int
+        number of trajectories
+    nlevels : int
+        number of grid levels, even
+    seed : int, optional
+        seed of the random number generator
+
+    Returns:
+    --------
+    samples : array
+        [ntrajectories * (nparams + 1), nparams] parameter values, one
+        trajectory after another
+    """
+    (names, lower, upper) = check_ranges(ranges)
+    k = len(names)
+    rng = np.random.RandomState(seed)
+    delta = nlevels / (2.0 * (nlevels - 1))
+    levels = np.arange(nlevels) / float(nlevels - 1)
+
+    unit = np.empty((ntrajectories, k + 1, k))
+    for t in xrange(ntrajectories):
+        x = rng.choice(levels, size=k)
+        unit[t,0] = x
+        for (step, i) in enumerate(rng.permutation(k), 1):
+            up = x[i] + delta <= 1.0 + 1E-12
+            down = x[i] - delta >= -1E-12
+            if up and down:
+                up = rng.rand() < 0.5
+            x = x.copy()
+            x[i] = x[i] + delta if up else x[i] - delta
+            unit[t,step] = x
+
+    return lower + unit.reshape(-1, k) * (upper - lower)
+
+def saltelli_design(ranges, nbase, seed=None):
+    """ Saltelli's sampling scheme for the Sobol indices
+
+    Parameters:
+    ----------
+    ranges : list of tuples
+        (parameter name, lower bound, upper bound)
+    nbase : int
+        number of base samples, the design has nbase * (nparams + 2) rows
+    seed : int, optional
+        seed of the random number generator
+
+    Returns:
+    --------
+    samples : array
+        [nbase * (nparams + 2), nparams] parameter values: the A matrix, the
+        B matrix and then for each parameter A with that column from B
+    """
+    (names, lower, upper) = check_ranges(ranges)
+    k = len(names)
+    rng = np.random.RandomState(seed)
+    a = rng.rand(nbase, k)
+    b = rng.rand(nbase, k)
+    blocks = [a, b]
+    for i in xrange(k):
+        ab = a.copy()
+        ab[:,i] = b[:,i]
+        blocks.append(ab)
+
+    return lower + np.concatenate(blocks) * (upper - lower)
+
+def run_mean(output):
+    """ Mean over the run, of an output of shape (ndays, nsamples) """
+    return output.mean(axis=0)
+
+def run_total(output):
+    """ Sum over the run, of an output of shape (ndays, nsamples) """
+    return output.sum(axis=0)
+
+def final_value(output):
+    """ Value on the last day, of an output of shape (ndays, nsamples) """
+    return output[-1]
+
+def evaluate_batch(task):
+    """ Run one batch of samples as an ensemble
+
+    Parameters:
+    ----------
+    task : tuple
+        (fname, names, samples, outputs, summary, base_overrides,
+         met_header)
+
+    Returns:
+    --------
+    y : array
+        [noutputs, nsamples] summary of each output
+    """
+    (fname, names, samples, outputs, summary, base_overrides,
+     met_header) = task
+    overrides = []
+    for row in samples:
+        member = dict(base_overrides)
+        member.update(("params." + name, float(value))
+                      for (name, value) in zip(names, row))
+        overrides.append(member)
+    E = GdayEnsemble(fname, overrides, met_header)
+
+    # only keep the daily output that is needed
+    E.print_state = [var for var in outputs if hasattr(E.state, var)]
+    E.print_fluxes = [var for var in outputs if var not in E.print_state]
+    for var in E.print_fluxes:
+        if not hasattr(E.fluxes, var):
+            err_msg = "%s isn't a model state or flux variable" % var
+            raise RuntimeError, err_msg
+    output = E.run_sim()
+
+    return np.array([summary(output[var]) for var in outputs])
+
+def evaluate(fname, ranges, samples, outputs, summary=run_mean,
+             base_overrides=None, batch_size=100, processes=1, met_header=4):
+    """ Run the model for every sample
+
+    Parameters:
+    ----------
+    fname : string or ModelConfig
+        filename of model parameters, including path, or the parsed .cfg
+        file, see file_parser.read_config
+    ranges : list of tuples
+        (parameter name, lower bound, upper bound)
+    samples : array
+        [nsamples, nparams] parameter values
+    outputs : list of strings
+        state or flux variables to analyse
+    summary : function
+        reduces an output of shape (ndays, nsamples) to (nsamples,), must be
+        defined at module level to be used with processes > 1
+    base_overrides : dictionary, optional
+        overrides applied to every sample, e.g. the met file, see
+        file_parser.apply_overrides
+    batch_size : int
+        number of samples run together as one ensemble
+    processes : int
+        number of worker processes, None for the number of cores
+    met_header : int
+        row number of met file header with variable name
+
+    Returns:
+    --------
+    y : dictionary
+        output name -> [nsamples] summary of the output
+    """
+    (names, lower, upper) = check_ranges(ranges)
+    samples = np.atleast_2d(samples)
+    if samples.shape[1] != len(names):
+        err_msg = ("Samples have %d columns but there are %d parameters" %
+                   (samples.shape[1], len(names)))
+        raise RuntimeError, err_msg
+    if base_overrides is None:
+        base_overrides = {}
+    # the .cfg file is read once and passed to each batch
+    if not isinstance(fname, ModelConfig):
+        fname = read_config(fname)
+    tasks = [(fname, names, samples[i:i+batch_size], list(outputs), summary,
+              base_overrides, met_header)
+             for i in xrange(0, len(samples), batch_size)]
+
+    if processes == 1:
+        results = map(evaluate_batch, tasks)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(evaluate_batch, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    y = np.concatenate(results, axis=1)
+
+    return dict(zip(outputs, y))
+
+def morris_indices(samples, y, ranges):
+    """ Morris elementary effect statistics
+
+    Parameters:
+    ----------
+    samples : array
+        [ntrajectories * (nparams + 1), nparams] samples of morris_design
+    y : array
+        [nsamples] model output for each sample
+    ranges : list of tuples
+        (parameter name, lower bound, upper bound)
+
+    Returns:
+    --------
+    indices : dictionary
+        "names", and arrays [nparams] of "mu" (mean elementary effect),
+        "mu_star" (mean absolute effect) and "sigma" (standard deviation of
+        the effects). Effects are per fraction of each parameter's range.
+    """
+    (names, lower, upper) = check_ranges(ranges)
+    k = len(names)
+    unit = ((np.asarray(samples) - lower) / (upper - lower)).reshape(-1, k + 1,
+                                                                      k)
+    y = np.asarray(y, dtype=np.float64).reshape(-1, k + 1)
+    ntrajectories = unit.shape[0]
+
+    effects = np.empty((ntrajectories, k))
+    for t in xrange(ntrajectories):
+        dx = np.diff(unit[t], axis=0)
+        dy = np.diff(y[t])
+        moved = np.argmax(np.abs(dx), axis=1)
+        effects[t,moved] = dy / dx[np.arange(k),moved]
+
+    return {"names": names,
+            "mu": effects.mean(axis=0),
+            "mu_star": np.abs(effects).mean(axis=0),
+            "sigma": (effects.std(axis=0, ddof=1) if ntrajectories > 1 else
+                      np.zeros(k))}
+
+def sobol_indices(y, nparams):
+    """ First-order and total Sobol indices, from the Saltelli design
+
+    Parameters:
+    ----------
+    y : array
+        [nbase * (nparams + 2)] model output for each sample of
+        saltelli_design
+    nparams : int
+        number of parameters
+
+    Returns:
+    --------
+    indices : dictionary
+        arrays [nparams] of "S1", first-order indices (Saltelli et al. 2010)
+        and "ST", total indices (Jansen's estimator)
+    """
+    y = np.asarray(y, dtype=np.float64).reshape(nparams + 2, -1)
+    (fa, fb, fab) = (y[0], y[1], y[2:])
+    variance = np.var(np.concatenate((fa, fb)))
+    if variance == 0.0:
+        return {"S1": np.zeros(nparams), "ST": np.zeros(nparams)}
+
+    return {"S1": np.mean(fb * (fab - fa), axis=1) / variance,
+            "ST": 0.5 * np.mean((fa - fab)**2, axis=1) / variance}
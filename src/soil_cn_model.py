@@ -9,14 +9,89 @@ Passive pool -> very resistant to decomp, turnover time of > 400 yrs.
 
 from math import exp
 import sys
+import numpy as np
 import constants as const
 from utilities import float_eq, float_lt, float_le, float_gt, float_ge
+from ensemble_utilities import vfloat_lt, vfloat_gt
 
 __author__  = "Martin De Kauwe"
 __version__ = "1.0 (28.08.2013)"
 __email__   = "mdekauwe@gmail.com"
 
 
+# soil pool order used by the matrix form of the model, matches the
+# co2_to_air fluxes
+CPOOLS = ['structsurf', 'structsoil', 'metabsurf', 'metabsoil', 'activesoil',
+          'slowsoil', 'passivesoil']
+NPOOLS = ['structsurfn', 'structsoiln', 'metabsurfn', 'metabsoiln',
+          'activesoiln', 'slowsoiln', 'passivesoiln']
+
+# decayrate index for each pool, note soil structural uses kdec3 and
+# surface metabolic kdec2
+DECAY_INDEX = [0, 2, 1, 3, 4, 5, 6]
+
+# C flux between pools (name, to pool, from pool), the N flux is "n_" + name
+POOL_TRANSFERS = [('surf_struct_to_slow', 5, 0),
+                  ('surf_struct_to_active', 4, 0),
+                  ('soil_struct_to_slow', 5, 1),
+                  ('soil_struct_to_active', 4, 1),
+                  ('surf_metab_to_active', 4, 2),
+                  ('soil_metab_to_active', 4, 3),
+                  ('active_to_slow', 5, 4),
+                  ('active_to_passive', 6, 4),
+                  ('slow_to_active', 4, 5),
+                  ('slow_to_passive', 6, 5),
+                  ('passive_to_active', 4, 6)]
+
+TRANSFER_NAMES = [name for (name, to, frm) in POOL_TRANSFERS]
+TRANSFER_TO = [to for (name, to, frm) in POOL_TRANSFERS]
+TRANSFER_FROM = [frm for (name, to, frm) in POOL_TRANSFERS]
+
+def transfer_matrix(ligshoot, ligroot, frac_microb_resp):
+    """ Pool transfer matrix of the soil C pools, A[j,i] is the fraction of C
+    leaving pool i which enters pool j, A[i,i] = -1 (see
+    CarbonSoilFlows.cfluxes_from_*_pool). Whatever leaves a pool and doesn't
+    enter another is respired.
+
+    Parameters:
+    -----------
+    ligshoot : float
+        lignin:C ratio of the shoot litter
+    ligroot : float
+        lignin:C ratio of the root litter
+    frac_microb_resp : float
+        fraction of C lost due to microbial respiration
+
+    Returns:
+    --------
+    A : array
+        7x7 matrix such that dC/dt = inputs + A . (k * C), in the order of
+        CPOOLS, with trailing member axes if any of the arguments vary
+        between ensemble members
+    """
+    members = np.broadcast(ligshoot, ligroot, frac_microb_resp).shape
+    A = np.zeros((7, 7) + members)
+    A[range(7),range(7)] = -1.0
+    # structural -> slow and active
+    A[5,0] = ligshoot * 0.7
+    A[4,0] = (1.0 - ligshoot) * 0.55
+    A[5,1] = ligroot * 0.7
+    A[4,1] = (1.0 - ligroot) * 0.45
+    # metabolic -> active
+    A[4,2] = 0.45
+    A[4,3] = 0.45
+    # active -> slow and passive
+    A[5,4] = 1.0 - frac_microb_resp - 0.004
+    A[6,4] = 0.004
+    # slow -> active and passive
+    A[4,5] = 0.42
+    A[6,5] = 0.03
+    # passive -> active
+    A[4,6] = 0.45
+
+    return A
+
+
 class CarbonSoilFlows(object):
     """ Plant litter C production is divided btw metabolic and structural """
     
@@ -42,6 +117,9 @@ class CarbonSoilFlows(object):
         self.state = state
         self.met_data = met_data
         
+        # met-only quantities precomputed for the whole record
+        self.derived = getattr(met_data, "derived", None)
+        
         # Fraction of C lost due to microbial respiration
         self.frac_microb_resp = 0.85 - (0.68 * self.params.finesoil)
         
@@ -75,11 +153,7 @@ class CarbonSoilFlows(object):
 
         self.flux_from_grazers() # input from faeces
         self.partition_plant_litter()
-        self.cfluxes_from_structural_pool()
-        self.cfluxes_from_metabolic_pool()
-        self.cfluxes_from_active_pool()
-        self.cfluxes_from_slow_pool()
-        self.cfluxes_from_passive_pool()
+        self.calculate_cfluxes()
         self.fluxes.hetero_resp = self.calculate_soil_respiration()
         
         # update the C pools
@@ -203,6 +277,11 @@ class CarbonSoilFlows(object):
             soil temperature factor [degC]
 
         """
+        if self.derived is not None:
+            self.fluxes.tfac_soil_decomp = \
+                self.derived['tfac_soil_decomp'][project_day]
+            return self.fluxes.tfac_soil_decomp
+
         tsoil = self.met_data['tsoil'][project_day]
 
         if float_gt(tsoil, 0.0):
@@ -357,6 +436,14 @@ class CarbonSoilFlows(object):
         self.fluxes.soil_metab_litter = (self.fluxes.deadroots * 
                                          self.params.fmroot)
 
+    def calculate_cfluxes(self):
+        """ C fluxes out of each pool, to the other pools and the air """
+        self.cfluxes_from_structural_pool()
+        self.cfluxes_from_metabolic_pool()
+        self.cfluxes_from_active_pool()
+        self.cfluxes_from_slow_pool()
+        self.cfluxes_from_passive_pool()
+
     def cfluxes_from_structural_pool(self):
         """C fluxes from structural pools """
 
@@ -597,11 +684,7 @@ class NitrogenSoilFlows(object):
 
         # SOM nitrogen effluxes.  These are assumed to have the source n:c
         # ratio prior to the increase of N:C due to co2 evolution.
-        self.nfluxes_from_structural_pools()
-        self.nfluxes_from_metabolic_pool()
-        self.nfluxes_from_active_pool()
-        self.nfluxes_from_slow_pool()
-        self.nfluxes_from_passive_pool()
+        self.calculate_nfluxes()
         
         # gross N mineralisation 
         self.fluxes.ngross = self.calculate_n_mineralisation()
@@ -731,6 +814,14 @@ class NitrogenSoilFlows(object):
         self.fluxes.n_soil_metab_litter = (nsoil - 
                                            self.fluxes.n_soil_struct_litter)
     
+    def calculate_nfluxes(self):
+        """ N fluxes out of each pool to the other pools """
+        self.nfluxes_from_structural_pools()
+        self.nfluxes_from_metabolic_pool()
+        self.nfluxes_from_active_pool()
+        self.nfluxes_from_slow_pool()
+        self.nfluxes_from_passive_pool()
+
     def nfluxes_from_structural_pools(self):
         """ from structural pool """
         structout_surf = self.state.structsurfn * self.params.decayrate[0]
@@ -1183,3 +1274,344 @@ class NitrogenSoilFlows(object):
             excess = self.state.metabsoiln
             self.fluxes.n_soil_metab_to_active = excess 
             self.state.metabsoiln = 0.0
+
+
+def member_axes(a, ndim):
+    """ Append length one axes to a so it broadcasts against an array with
+    ndim trailing member axes, e.g. a 7x7 matrix shared by an ensemble """
+    a = np.asarray(a)
+    return a.reshape(a.shape + (1,) * (ndim - a.ndim))
+
+def pool_vector(record, names):
+    """ pools of a state record (or items of a list if names are indices) as
+    a [npools, ...] array, the trailing axes are the members if the record is
+    an ensemble """
+    if isinstance(record, list):
+        values = [record[i] for i in names]
+    else:
+        values = [getattr(record, name) for name in names]
+    return stack(values)
+
+def stack(values):
+    """ numbers and/or member arrays as one [len(values), ...] array """
+    vector = np.array(values)
+    if vector.dtype == object:
+        vector = np.array(np.broadcast_arrays(*values))
+    return vector
+
+def unstack(vector):
+    """ inverse of stack, a list of python floats for a single site, which
+    keeps the rest of the model in scalar arithmetic, or of member arrays """
+    if vector.ndim == 1:
+        return vector.tolist()
+    return list(vector)
+
+def member_value(value):
+    """ python float for a single site, else the member array """
+    if value.ndim == 0:
+        return float(value)
+    return value
+
+
+class CarbonSoilMatrix(object):
+    """ Matrix form of the soil C flows.
+
+    Replaces the cfluxes_from_*_pool methods and calculate_cpools of a
+    CarbonSoilFlows (or EnsembleCarbonSoilFlows) with a single update of the
+    pool vector, C' = C + inputs + A . (k * C), where A is the transfer matrix
+    (see transfer_matrix) and k the decay rate of each pool. The named
+    fluxes are filled in from the matrix so the output is unchanged. Every
+    array has optional trailing member axes, so the same code runs a single
+    site or an ensemble.
+
+    Use it ahead of the flow class it modifies, e.g.
+    class MatrixCarbonSoilFlows(CarbonSoilMatrix, CarbonSoilFlows)
+
+    References:
+    ----------
+    * Luo, Y. et al. (2003) Global Biogeochemical Cycles, 17, 1021.
+    """
+    def calculate_cfluxes(self):
+        """ C fluxes out of each pool, to the other pools and the air """
+        params = self.params
+        fluxes = self.fluxes
+
+        cpools = pool_vector(self.state, CPOOLS)
+        ndim = cpools.ndim
+        k = member_axes(pool_vector(params.decayrate, DECAY_INDEX), ndim)
+        A = member_axes(transfer_matrix(params.ligshoot, params.ligroot,
+                                        self.frac_microb_resp), ndim + 1)
+
+        # fraction of the efflux from each pool passed to each other pool,
+        # whatever isn't passed on is respired
+        offdiag = A * member_axes(1.0 - np.eye(7), ndim + 1)
+        self.cout = k * cpools
+        self.ctransfer = offdiag * self.cout[np.newaxis]
+        co2 = (1.0 - offdiag.sum(axis=0)) * self.cout
+
+        for (name, c) in zip(TRANSFER_NAMES,
+                             unstack(self.ctransfer[TRANSFER_TO,TRANSFER_FROM])):
+            setattr(fluxes, name, c)
+        fluxes.co2_to_air = unstack(co2)
+
+    def calculate_cpools(self):
+        """Calculate new soil carbon pools. """
+        fluxes = self.fluxes
+        state = self.state
+
+        cpools = pool_vector(state, CPOOLS)
+        cin = self.ctransfer.sum(axis=1)
+        litter = [fluxes.surf_struct_litter, fluxes.soil_struct_litter,
+                  fluxes.surf_metab_litter, fluxes.soil_metab_litter]
+        cpools[:4] += stack(litter)
+        cpools += cin - self.cout
+        for (name, c) in zip(CPOOLS, unstack(cpools)):
+            setattr(state, name, c)
+
+        # store the C SOM fluxes for Nitrogen calculations
+        (fluxes.c_into_active,
+         fluxes.c_into_slow,
+         fluxes.c_into_passive) = unstack(cin[4:])
+
+        self.precision_control()
+
+
+class NitrogenSoilMatrix(object):
+    """ Matrix form of the soil N flows, see CarbonSoilMatrix.
+
+    The N leaving each pool is split between the receiving pools in the
+    same proportions as the C, i.e. by the transfer matrix with each column
+    normalised. The litter pools then fix or release N to stay within their
+    N:C limits and the SOM pools take up their target N:C, as in
+    NitrogenSoilFlows.calculate_npools.
+
+    Use it ahead of the flow class it modifies, e.g.
+    class MatrixNitrogenSoilFlows(NitrogenSoilMatrix, NitrogenSoilFlows)
+    """
+    def calculate_nfluxes(self):
+        """ N fluxes out of each pool to the other pools """
+        params = self.params
+
+        npools = pool_vector(self.state, NPOOLS)
+        ndim = npools.ndim
+        k = member_axes(pool_vector(params.decayrate, DECAY_INDEX), ndim)
+        A = member_axes(transfer_matrix(params.ligshoot, params.ligroot,
+                                        self.frac_microb_resp), ndim + 1)
+        offdiag = A * member_axes(1.0 - np.eye(7), ndim + 1)
+
+        # soil N efflux has the source N:C, none of it is lost
+        self.nout = k * npools
+        self.ntransfer = (offdiag / offdiag.sum(axis=0) *
+                          self.nout[np.newaxis])
+        for (name, n) in zip(TRANSFER_NAMES,
+                             unstack(self.ntransfer[TRANSFER_TO,TRANSFER_FROM])):
+            setattr(self.fluxes, "n_" + name, n)
+
+    def calculate_n_mineralisation(self):
+        """ N gross mineralisation, the sum of the N outflows from each pool,
+        see NitrogenSoilFlows.calculate_n_mineralisation """
+        return member_value(self.ntransfer.sum(axis=(0,1)))
+
+    def calculate_npools(self, active_nc_slope, slow_nc_slope,
+                         passive_nc_slope):
+        """ Update N pools in the soil, see NitrogenSoilFlows.calculate_npools
+
+        Parameters
+        ----------
+        active_nc_slope : float
+            active NC slope
+        slow_nc_slope: float
+            slow NC slope
+        passive_nc_slope : float
+            passive NC slope
+
+        """
+        params = self.params
+        fluxes = self.fluxes
+        state = self.state
+
+        # litter pools, nothing flows into them from the other pools
+        npools = pool_vector(state, NPOOLS)
+        litter = [fluxes.n_surf_struct_litter, fluxes.n_soil_struct_litter,
+                  fluxes.n_surf_metab_litter, fluxes.n_soil_metab_litter]
+        nlitter = npools[:4] + stack(litter) - self.nout[:4]
+
+        # fix or release N to keep the litter N:C within limits, the
+        # structural pools are only limited if their input N:C is fixed
+        structnc = 1.0 / params.structcn
+        ncmin = stack([structnc, structnc, 1.0/25.0, 1.0/25.0])
+        ncmax = stack([structnc, structnc, 1.0/10.0, 1.0/10.0])
+        clitter = pool_vector(state, CPOOLS[:4])
+        ncmin = member_axes(ncmin, nlitter.ndim)
+        ncmax = member_axes(ncmax, nlitter.ndim)
+        nmax = clitter * ncmax
+        nmin = clitter * ncmin
+        release = vfloat_gt(nlitter, nmax)
+        fixing = ~release & vfloat_lt(nlitter, nmin)
+        if self.control.strfloat:
+            release[:2] = False
+            fixing[:2] = False
+        change = np.where(release, nmax - nlitter,
+                          np.where(fixing, nmin - nlitter, 0.0))
+        nlitter += change
+        fluxes.nlittrelease = member_value(-change.sum(axis=0))
+        for (name, n) in zip(NPOOLS[:4], unstack(nlitter)):
+            setattr(state, name, n)
+
+        # When nothing is being added to the metabolic pools, there is the
+        # potential scenario with the way the model works for tiny bits to be
+        # removed with each timestep. Effectively with time this value which is
+        # zero can end up becoming zero but to a silly decimal place
+        self.precision_control()
+        ntransfer = self.ntransfer.copy()
+        ntransfer[4,2] = fluxes.n_surf_metab_to_active
+        ntransfer[4,3] = fluxes.n_soil_metab_to_active
+
+        # N:C of the SOM pools increases linearly btw prescribed min and max
+        # values as the Nconc of the soil increases.
+        arg = (state.inorgn - params.nmin0 / const.M2_AS_HA *
+               const.G_AS_TONNES)
+        ncmin = stack([params.actncmin, params.slowncmin, params.passncmin])
+        ncmax = stack([params.actncmax, params.slowncmax, params.passncmax])
+        slope = stack([active_nc_slope, slow_nc_slope, passive_nc_slope])
+        ncmin = member_axes(ncmin, npools.ndim)
+        ncmax = member_axes(ncmax, npools.ndim)
+        slope = member_axes(slope, npools.ndim)
+        som_nc = ncmin + slope * arg
+        som_nc = np.where(vfloat_gt(som_nc, ncmax), ncmax, som_nc)
+
+        # release N to Inorganic pool or fix N from the Inorganic pool in order
+        # to normalise the N:C ratio of a net flux
+        n_into = ntransfer[4:].sum(axis=1)
+        n_out = ntransfer[:,4:].sum(axis=0)
+        c_into = stack([fluxes.c_into_active, fluxes.c_into_slow,
+                        fluxes.c_into_passive])
+        fixn = self.nc_flux(c_into, n_into, som_nc)
+        nsom = npools[4:] + (n_into + fixn - n_out)
+        for (name, n) in zip(NPOOLS[4:], unstack(nsom)):
+            setattr(state, name, n)
+
+        # Daily increment of soil inorganic N pool, diff btw in and effluxes
+        # (grazer urine n goes directly into inorganic pool) nb inorgn may be
+        # unstable if rateuptake is large
+        state.inorgn = state.inorgn + ((fluxes.ngross + fluxes.ninflow +
+                                        fluxes.nurine - fluxes.nimmob -
+                                        fluxes.nloss - fluxes.nuptake) +
+                                       fluxes.nlittrelease)
+
+
+class MatrixCarbonSoilFlows(CarbonSoilMatrix, CarbonSoilFlows):
+    """ CarbonSoilFlows with the matrix form of the pool update """
+    pass
+
+
+class MatrixNitrogenSoilFlows(NitrogenSoilMatrix, NitrogenSoilFlows):
+    """ NitrogenSoilFlows with the matrix form of the pool update """
+    pass
+
+
+class SoilSteadyState(object):
+    """ Semi-analytical steady state of the soil C pools, used to speed up
+    the spin-up.
+
+    The CENTURY pools are a linear donor-controlled system: each pool loses C
+    at its decay rate and passes fixed fractions of it to the other pools
+    (see CarbonSoilFlows.cfluxes_from_*_pool). Given the mean litter inputs
+    and mean decay rates over a forcing cycle the equilibrium pools follow
+    from a single 7x7 solve, rather than thousands of simulated years.
+
+    References:
+    ----------
+    * Xia, J. et al. (2012) Geoscientific Model Development, 5, 1259-1271.
+    """
+    # pool order, matches the co2_to_air fluxes
+    cpools = CPOOLS
+    npools = NPOOLS
+    decay_index = DECAY_INDEX
+
+    def __init__(self, control, params, state, fluxes):
+        """
+        Parameters
+        ----------
+        control : integers, object
+            model control flags
+        params: floats, object
+            model parameters
+        state: floats, object
+            model state
+        fluxes : floats, object
+            model fluxes
+
+        """
+        self.params = params
+        self.fluxes = fluxes
+        self.control = control
+        self.state = state
+
+        # Fraction of C lost due to microbial respiration
+        self.frac_microb_resp = 0.85 - (0.68 * self.params.finesoil)
+        self.reset()
+
+    def reset(self):
+        """ zero the accumulated inputs and decay rates """
+        self.inputs = np.zeros(7)
+        self.decay = np.zeros(7)
+        self.ndays = 0
+
+    def accumulate(self):
+        """ add the days litter inputs and decay rates, called after the soil
+        C flows have been calculated """
+        fluxes = self.fluxes
+        decayrate = self.params.decayrate
+        self.inputs[0] += fluxes.surf_struct_litter
+        self.inputs[1] += fluxes.soil_struct_litter
+        self.inputs[2] += fluxes.surf_metab_litter
+        self.inputs[3] += fluxes.soil_metab_litter
+        for i, j in enumerate(self.decay_index):
+            self.decay[i] += decayrate[j]
+        self.ndays += 1
+
+    def transfer_matrix(self):
+        """ Pool transfer matrix, see transfer_matrix """
+        return transfer_matrix(self.params.ligshoot, self.params.ligroot,
+                               self.frac_microb_resp)
+
+    def solve(self):
+        """ Steady state C pools given the mean inputs and decay rates
+
+        Returns:
+        --------
+        cpools : array
+            equilibrium C in each pool [t/ha], in the order of self.cpools
+        """
+        if self.ndays == 0:
+            raise RuntimeError, "No soil inputs have been accumulated"
+
+        inputs = self.inputs / self.ndays
+        k = self.decay / self.ndays
+        A = self.transfer_matrix() * k
+
+        if self.control.passiveconst:
+            # passive pool is fixed, its efflux is just another input
+            cpass = self.state.passivesoil
+            inputs = inputs[:6] + A[:6,6] * cpass
+            cpools = np.linalg.solve(A[:6,:6], -inputs)
+            return np.append(cpools, cpass)
+
+        return np.linalg.solve(A, -inputs)
+
+    def set_pools(self, cpools):
+        """ Put the soil C pools at their steady state, the N pools are scaled
+        to keep each pools N:C ratio
+
+        Parameters:
+        -----------
+        cpools : array
+            C in each pool [t/ha], in the order of self.cpools
+        """
+        state = self.state
+        for (cname, nname, c) in zip(self.cpools, self.npools, cpools):
+            old_c = getattr(state, cname)
+            if float_gt(old_c, 0.0):
+                setattr(state, nname, getattr(state, nname) * c / old_c)
+            setattr(state, cname, float(c))
@@ -0,0 +1,148 @@
+""" On-disk cache of spun-up (equilibrium) model states.
+
+Spinning up is by far the most expensive part of most experiments and many
+experiments spin up exactly the same configuration again. Entries are keyed
+on a digest of everything the spin-up depends on: the control flags, params,
+the starting state, the met forcing, the convergence settings and the code
+revision. Each entry is a checkpoint of the spun-up model (see checkpoint.py),
+so it can also be restarted from with Gday.from_checkpoint. When the cache
+holds more than max_entries the least recently used entries are removed.
+"""
+
+import os
+import glob
+import hashlib
+import tempfile
+import numpy as np
+from checkpoint import CheckpointReader, CHECKPOINT_EXT
+from _version import __version__ as git_revision
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+SPINUP_CACHE_SIZE = 20
+
+
+def spin_up_key(control, params, state, met_data, settings):
+    """ Digest of the inputs of a spin-up
+
+    Parameters:
+    ----------
+    control : object
+        model control flags
+    params : object
+        model parameters
+    state : object
+        model state the spin-up starts from
+    met_data : MetForcing
+        meteorological forcing data
+    settings : tuple
+        anything else the spin-up depends on, e.g. the tolerance
+
+    Returns:
+    --------
+    key : string
+        md5 hex digest
+    """
+    digest = hashlib.md5()
+    digest.update(repr(git_revision))
+    digest.update(repr(settings))
+    for record in (control, params, state):
+        digest.update(repr(sorted(record.__getstate__().iteritems())))
+    digest.update(repr(met_data.var_names))
+    for name in met_data.var_names:
+        digest.update(np.ascontiguousarray(met_data[name]).tostring())
+
+    return digest.hexdigest()
+
+
+class SpinUpCache(object):
+    """ Directory of spun-up model checkpoints, by spin_up_key """
+    def __init__(self, cache_dir, max_entries=SPINUP_CACHE_SIZE):
+        """
+        Parameters:
+        ----------
+        cache_dir : string
+            directory holding the cache, created if need be
+        max_entries : int
+            number of spun-up states kept
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def fname(self, key):
+        return os.path.join(self.cache_dir, key + CHECKPOINT_EXT)
+
+    def load(self, key, met_data, output):
+        """ The spun-up model, if it is in the cache
+
+        Parameters:
+        ----------
+        key : string
+            see spin_up_key
+        met_data : MetForcing
+            meteorological forcing data, including the derived quantities
+        output : PrintOutput
+            daily output writer
+
+        Returns:
+        --------
+        model : Gday or None
+            the model as it was at the end of the spin-up, with the met
+            forcing and output re-attached, None if there isn't an entry
+        """
+        fname = self.fname(key)
+        try:
+            reader = CheckpointReader(fname)
+        except IOError:
+            return None
+        reader.read_records()
+        model = reader.read_model(met_data, output)
+
+        # the modification time marks when an entry was last used
+        os.utime(fname, None)
+
+        return model
+
+    def store(self, key, model):
+        """ Add a spun-up model to the cache
+
+        Parameters:
+        ----------
+        key : string
+            see spin_up_key
+        model : Gday
+            spun-up model
+        """
+        # written to a temporary file first, so another process reading the
+        # cache never sees half an entry
+        (fd, tmp_fname) = tempfile.mkstemp(prefix=".", dir=self.cache_dir)
+        os.close(fd)
+        try:
+            model.save_checkpoint(tmp_fname)
+            os.rename(tmp_fname, self.fname(key))
+        except:
+            if os.path.exists(tmp_fname):
+                os.remove(tmp_fname)
+            raise
+        self.evict()
+
+    def evict(self):
+        """ Remove the least recently used entries beyond max_entries """
+        entries = []
+        for fname in glob.glob(os.path.join(self.cache_dir,
+                                            "*" + CHECKPOINT_EXT)):
+            try:
+                entries.append((os.path.getmtime(fname), fname))
+            except OSError:
+                continue
+        entries.sort(reverse=True)
+        for (mtime, fname) in entries[self.max_entries:]:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
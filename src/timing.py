@@ -0,0 +1,241 @@
+""" Lightweight wall time accounting for the stages of the model day loop.
+
+Unlike running cProfile over the whole model, only the handful of calls that
+make up each stage of the day loop are timed, so the overhead is small and the
+times are reported per model process rather than per python function, e.g.
+
+    G = Gday(fname, timing=True)
+    G.run_sim()
+    sys.stderr.write(G.timer.report(by_year=True))
+
+The timer works by replacing the methods of each stage on the model component
+instances with timed wrappers, so nothing in the model changes (or costs
+anything) when timing isn't switched on. Times are exclusive, i.e. the time
+in allocation isn't counted again in growth, so the stages add up to the
+total time of the run.
+"""
+
+from timeit import default_timer
+
+__author__  = "Martin De Kauwe"
+__version__ = "1.0 (16.10.2026)"
+__email__   = "mdekauwe@gmail.com"
+
+
+# (stage, component attribute of Gday, methods), "" is the Gday instance
+# itself. Methods which are called from within another timed method (e.g.
+# carbon_production from calc_day_growth) are taken off the outer stage.
+GDAY_STAGES = [
+    ("litter", "lf", ["calculate_litter"]),
+    ("disturbance", "db", ["check_for_fire", "hurricane"]),
+    ("phenology", "P", ["calculate_phenology_flows"]),
+    ("growth", "pg", ["calc_day_growth"]),
+    ("carbon_production", "pg", ["carbon_production"]),
+    ("water_balance", "pg.wb", ["calculate_water_balance"]),
+    ("allocation", "pg", ["calc_carbon_allocation_fracs", "carbon_allocation",
+                          "nitrogen_allocation",
+                          "calculate_average_alloc_fractions",
+                          "allocate_stored_c_and_n"]),
+    ("csoil_flows", "cs", ["soil_temp_factor", "calculate_csoil_flows"]),
+    ("nsoil_flows", "ns", ["calculate_nsoil_flows"]),
+    ("day_end", "", ["day_end_calculations"]),
+    ("output", "pr", ["save_daily_outputs", "clean_up"]),
+    ("other", "", ["run_sim"])]
+
+
+class StageTimer(object):
+    """ Wall time spent in each stage of the day loop, by year and by run """
+    def __init__(self, stages=GDAY_STAGES, clock=default_timer):
+        """
+        Parameters:
+        ----------
+        stages : list of tuples
+            (stage, component, methods) to time, see GDAY_STAGES
+        clock : function
+            wall clock, in seconds
+        """
+        self.stages = stages
+        self.clock = clock
+        self.wrapped = []
+        self.reset()
+
+    def reset(self):
+        """ Forget everything timed so far """
+        # time of the year being run, the time of the enclosing timed calls
+        # which has been spent in nested timed calls, the finished years and
+        # the finished runs
+        self.current = {}
+        self.inner = []
+        self.years = []
+        self.runs = []
+        self.run_total = {}
+        self.run_stage = None
+        self.year_start = 0.0
+
+    def attach(self, model):
+        """ Start timing the stages of a model
+
+        Parameters:
+        ----------
+        model : Gday
+            model whose components are timed
+        """
+        self.detach()
+        for (stage, component, methods) in self.stages:
+            obj = model
+            for name in component.split(".") if component else []:
+                obj = getattr(obj, name, None)
+            if obj is None:
+                continue
+            for method in methods:
+                func = getattr(obj, method, None)
+                if func is None:
+                    continue
+                self.wrapped.append((obj, method, obj.__dict__.get(method)))
+                setattr(obj, method, self.wrap(stage, func,
+                                               method == "run_sim"))
+
+    def detach(self):
+        """ Put back the untimed methods, e.g. before the model is pickled """
+        for (obj, method, previous) in reversed(self.wrapped):
+            if previous is None:
+                del obj.__dict__[method]
+            else:
+                obj.__dict__[method] = previous
+        self.wrapped = []
+
+    def wrap(self, stage, func, is_run=False):
+        """ Timed version of a function
+
+        Parameters:
+        ----------
+        stage : string
+            stage the time is added to
+        func : function
+            function to time
+        is_run : logical
+            func runs the model, i.e. each call is a run
+
+        Returns:
+        --------
+        timed : function
+            calls func and adds its time, less the time of any timed calls
+            within it, to the stage
+        """
+        clock = self.clock
+        inner = self.inner
+
+        def timed(*args, **kwargs):
+            if is_run and not inner:
+                self.run_stage = stage
+                self.year_start = clock()
+            inner.append(0.0)
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                self.add(stage, elapsed - inner.pop())
+                if inner:
+                    inner[-1] += elapsed
+                elif is_run:
+                    self.end_run()
+        return timed
+
+    def add(self, stage, seconds):
+        self.current[stage] = self.current.get(stage, 0.0) + seconds
+
+    def end_year(self, year):
+        """ Close the accounts of a simulation year
+
+        Parameters:
+        ----------
+        year : int
+            year which has just been run
+        """
+        # the rest of the year's wall time is the day loop itself, which is
+        # then no longer counted as time of the run
+        now = self.clock()
+        if self.inner:
+            other = now - self.year_start - sum(self.current.values())
+            self.add(self.run_stage, other)
+            self.inner[0] += other
+        self.year_start = now
+        self.years.append((year, self.current))
+        add_times(self.run_total, self.current)
+        self.current = {}
+
+    def end_run(self):
+        """ Close the accounts of a run, i.e. a call to run_sim """
+        add_times(self.run_total, self.current)
+        self.current = {}
+        self.runs.append(self.run_total)
+        self.run_total = {}
+
+    def totals(self):
+        """ Time in each stage summed over all the runs
+
+        Returns:
+        --------
+        totals : dictionary
+            seconds by stage
+        """
+        totals = {}
+        for run in self.runs:
+            add_times(totals, run)
+        add_times(totals, self.run_total)
+        add_times(totals, self.current)
+
+        return totals
+
+    def report(self, by_year=False):
+        """ Table of the time in each stage
+
+        Parameters:
+        ----------
+        by_year : logical
+            add a table with a row for each simulation year
+
+        Returns:
+        --------
+        report : string
+            seconds and percentage of the total for each stage, for each
+            run and for all the runs together
+        """
+        stages = [s[0] for s in self.stages]
+        lines = []
+        if by_year and self.years:
+            names = stages + ["total"]
+            widths = [max(8, len(name)) for name in names]
+            lines.append(" ".join(["%-6s" % "year"] +
+                                  ["%*s" % (w, name) for (w, name) in
+                                   zip(widths, names)]))
+            for (year, times) in self.years:
+                seconds = [times.get(s, 0.0) for s in stages]
+                seconds.append(sum(times.values()))
+                lines.append(" ".join(["%-6d" % year] +
+                                      ["%*.3f" % (w, t) for (w, t) in
+                                       zip(widths, seconds)]))
+            lines.append("")
+
+        tables = [("run %d" % (i + 1), run) for (i, run) in
+                  enumerate(self.runs)]
+        if len(tables) != 1:
+            tables.append(("all runs", self.totals()))
+        for (title, times) in tables:
+            total = sum(times.values())
+            lines.append("%-18s %10s %7s" % (title, "seconds", "%"))
+            for stage in stages + sorted(set(times) - set(stages)):
+                seconds = times.get(stage, 0.0)
+                lines.append("%-18s %10.3f %7.1f" %
+                             (stage, seconds,
+                              100.0 * seconds / total if total > 0.0 else 0.0))
+            lines.append("%-18s %10.3f" % ("total", total))
+            lines.append("")
+
+        return "\n".join(lines)
+
+
+def add_times(totals, times):
+    for (stage, seconds) in times.iteritems():
+        totals[stage] = totals.get(stage, 0.0) + seconds
@@ -3,11 +3,16 @@
 from math import fabs, exp, sqrt, sin, pi, cos, tan, acos, asin
 import sys
 from collections import deque
+import numpy as np
 
 __author__  = "Martin De Kauwe"
 __version__ = "1.0 (09.03.2011)"
 __email__   = "mdekauwe@gmail.com"
 
+# daylength of every day of the year by (latitude, days in the year), shared
+# by all the models in the process, see daylength_table
+DAYLENGTH_CACHE = {}
+
 def float_eq(arg1, arg2, tol=1E-14):
     """arg1 == arg2"""
     return fabs(arg1 - arg2) < tol + tol * fabs(arg2)
@@ -53,7 +58,7 @@ def day_length(doy, yr_days, latitude):
     Returns:
     --------
     dayl : float
-        daylength [hrs]
+        daylength [hrs], 24 in the polar day and 0 in the polar night
 
     """
     deg2rad = pi / 180.0
@@ -61,7 +66,8 @@ def day_length(doy, yr_days, latitude):
     sindec = -sin(23.5 * deg2rad) * cos(2.0 * pi * (doy + 10.0) / yr_days)
     a = sin(latr) * sindec
     b = cos(latr) * cos(asin(sindec))
-    dayl = 12.0 * (1.0 + (2.0 / pi) * asin(a / b))
+    # polar day or night
+    dayl = 12.0 * (1.0 + (2.0 / pi) * asin(clip(a / b, -1.0, 1.0)))
     
     return dayl
 
@@ -87,7 +93,64 @@ def uniq(inlist):
 
 def calculate_daylength(yr_days, latitude):
     """ wrapper to put the day length into a list """
-    return [day_length(d+1, yr_days, latitude) for d in xrange(yr_days)]
+    return daylength_table(yr_days, latitude).tolist()
+
+def daylength_table(yr_days, latitude):
+    """ Daylength [hrs] of every day of the year, see day_length.
+
+    The table is only calculated the first time a (latitude, yr_days) pair is
+    asked for, afterwards the cached table is handed back.
+
+    Parameters:
+    -----------
+    yr_days : int
+        number of days in a year, 365 or 366
+    latitude : float
+        latitude [degrees]
+
+    Returns:
+    --------
+    dayl : array
+        read-only daylength [hrs], dayl[doy-1]
+    """
+    key = (float(latitude), int(yr_days))
+    if key not in DAYLENGTH_CACHE:
+        daylength_tables(yr_days, [latitude])
+
+    return DAYLENGTH_CACHE[key]
+
+def daylength_tables(yr_days, latitudes):
+    """ Daylength [hrs] of every day of the year for many latitudes at once,
+    e.g. the cells of a grid, the tables are added to the cache
+
+    Parameters:
+    -----------
+    yr_days : int
+        number of days in a year, 365 or 366
+    latitudes : array
+        latitude [degrees] of each site
+
+    Returns:
+    --------
+    dayl : array
+        read-only daylength [hrs], [len(latitudes), yr_days], 24 in the polar
+        day and 0 in the polar night
+    """
+    deg2rad = pi / 180.0
+    latr = np.asarray(latitudes, dtype=np.float64).reshape(-1, 1) * deg2rad
+    doy = np.arange(yr_days) + 1.0
+    sindec = (-np.sin(23.5 * deg2rad) *
+              np.cos(2.0 * pi * (doy + 10.0) / float(yr_days)))
+    a = np.sin(latr) * sindec
+    b = np.cos(latr) * np.cos(np.arcsin(sindec))
+    # polar day or night
+    dayl = 12.0 * (1.0 + (2.0 / pi) * np.arcsin(np.clip(a / b, -1.0, 1.0)))
+    dayl.flags.writeable = False
+
+    for (latitude, table) in zip(np.ravel(latitudes), dayl):
+        DAYLENGTH_CACHE.setdefault((float(latitude), int(yr_days)), table)
+
+    return dayl
 
 def str2boolean(value):
     """ Take the string value and return the boolean value, check case etc..."""
@@ -98,6 +161,34 @@ def str2boolean(value):
         elif value.lower() in ['false', 'f', '0']: return False
     else:  
         raise ValueError("%s is no recognized as a boolean value" % value)
+
+def aitken_limit(values, ratio_tol=0.1):
+    """ Aitken's delta-squared estimate of the limit of a sequence which
+    converges geometrically, e.g. a pool at the end of successive spin-up
+    cycles.
+
+    Parameters:
+    ----------
+    values : list of floats
+        the last four terms of the sequence
+    ratio_tol : float
+        the ratio of the successive differences must agree to within this
+        fraction of the distance still to go, i.e. (1 - ratio)
+
+    Returns:
+    --------
+    limit : float or None
+        projected limit, None if the sequence doesn't look geometric (yet)
+    """
+    (d1, d2, d3) = [values[i+1] - values[i] for i in xrange(3)]
+    if float_eq(d1, 0.0) or float_eq(d2, 0.0) or float_eq(d3, 0.0):
+        return None
+    r1 = d2 / d1
+    r2 = d3 / d2
+    if r2 <= 0.0 or r2 >= 1.0 or fabs(r2 - r1) > ratio_tol * (1.0 - r2):
+        return None
+
+    return values[-1] + d3 * r2 / (1.0 - r2)
     
 class SimpleMovingAverage():
     def __init__(self, window_size, previous_state=None):
@@ -125,7 +216,41 @@ class SimpleMovingAverage():
     
     def reset_stream(self):
         self.data = deque()
- 
+
+class ControlStrategies(object):
+    """ Base for model components which choose how to do a calculation from
+    the control flags once, when they are built, rather than testing the
+    flags every day.
+
+    Subclasses list (attribute, control flags, {setting: method name}) in
+    STRATEGIES, the setting being a tuple if there is more than one flag. The
+    chosen methods are bound to the attributes by bind_strategies. They aren't
+    pickled but bound again when the component is unpickled, e.g. from a
+    checkpoint whose control flags have been changed.
+    """
+    STRATEGIES = ()
+
+    def bind_strategies(self):
+        """ Bind the method for each strategy to its attribute """
+        for (attribute, flags, methods) in self.STRATEGIES:
+            setting = tuple(getattr(self.control, flag) for flag in flags)
+            if len(flags) == 1:
+                setting = setting[0]
+            if setting not in methods:
+                err_msg = "Unknown %s: %s" % (", ".join(flags), setting)
+                raise RuntimeError, err_msg
+            setattr(self, attribute, getattr(self, methods[setting]))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for (attribute, flags, methods) in self.STRATEGIES:
+            state.pop(attribute, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.bind_strategies()
+
 if __name__ == '__main__':
 
     print float_eq(0.0, 0.0)
@@ -2,7 +2,7 @@
 
 from math import log, exp, sqrt, pi
 
-from utilities import float_gt, float_eq, float_le, clip
+from utilities import float_gt, float_eq, float_le, clip, ControlStrategies
 import constants as const
 import sys
 
@@ -11,7 +11,7 @@ __version__ = "1.0 (02.05.2012)"
 __email__   = "mdekauwe@gmail.com"
 
           
-class WaterBalance(object):
+class WaterBalance(ControlStrategies):
     """Dynamic water balance model.
 
     Contains a few extra routinues to do with WUE calculation from MATE
@@ -23,6 +23,16 @@ class WaterBalance(object):
         30, 415-423.
 
     """
+    # (attribute, control flags, {setting: method}), see bind_strategies
+    STRATEGIES = (
+        ("transpiration", ("trans_model", "assim_model"),
+         {(0, "MATE"): "transpiration_wue",
+          (0, "BEWDY"): "transpiration_wue",
+          (1, "MATE"): "transpiration_penmon_am_pm",
+          (1, "BEWDY"): "transpiration_penmon_day",
+          (2, "MATE"): "transpiration_priestley_taylor",
+          (2, "BEWDY"): "transpiration_priestley_taylor"}),)
+
     def __init__(self, control, params, state, fluxes, met_data):
         """
         Parameters
@@ -44,10 +54,21 @@ class WaterBalance(object):
         self.control = control
         self.state = state
         self.met_data = met_data
+        
+        # met-only quantities precomputed for the whole record
+        self.derived = getattr(met_data, "derived", None)
+        
+        self.update_parameters()
+
+    def update_parameters(self):
+        """ Set up what is taken from the params and control flags, again
+        if they have been changed, e.g. on restarting from a checkpoint """
         self.P = PenmanMonteith(dz0v_dh=self.params.dz0v_dh,
                                 displace_ratio=self.params.displace_ratio,
                                 z0h_z0m=self.params.z0h_z0m)
         
+        self.bind_strategies()
+        
     def calculate_water_balance(self, day, daylen):
         """ Calculate water balance
 
@@ -66,72 +87,103 @@ class WaterBalance(object):
          sw_rad_day, vpd_am, vpd_pm, vpd_day, wind_am, wind_pm, wind_day, 
          ca, press) = self.get_met_data(day, daylen)
         
-        net_rad_day = self.calc_radiation(tair_day, sw_rad_day, daylen)
-        net_rad_am = self.calc_radiation(tair_am, sw_rad_am, half_day)
-        net_rad_pm = self.calc_radiation(tair_pm, sw_rad_pm, half_day)
-                        
-        # calculate water fluxes
-        if self.control.trans_model == 0:
-            # transpiration calculated from WUE...
-            self.calc_transpiration()
-        elif self.control.trans_model == 1:
+        if self.derived is not None:
+            net_rad_day = self.derived['net_rad_day'][day]
+            net_rad_am = self.derived['net_rad_am'][day]
+            net_rad_pm = self.derived['net_rad_pm'][day]
             
-            # Whilst the AM and PM response to CO2 are proportional, because
-            # we sum AM and PM values within the code it results in a larger
-            # than proportional WUE response to CO2. Currently as I see it the
-            # best way to minimise this is to calculate gs at the daily time
-            # scale to reduce the influence of AM/PM VPD. I think the only
-            # correct fix would be to replace MATE with a daily time step GPP
-            # calculation.
-            #self.calc_transpiration_penmon(vpd_day, net_rad_day, tair_day, 
-            #                                wind_day, ca, daylen, press)
-                                               
-            if self.control.assim_model == "BEWDY":
-                self.calc_transpiration_penmon(vpd_day, net_rad_day, tair_day, 
-                                               wind_day, ca, daylen, press)
+            # latent heat, slope of the svp curve and air density
+            met_terms_day = self.get_met_terms(day, "day")
+            met_terms_am = self.get_met_terms(day, "am")
+            met_terms_pm = self.get_met_terms(day, "pm")
+        else:
+            net_rad_day = self.calc_radiation(tair_day, sw_rad_day, daylen)
+            net_rad_am = self.calc_radiation(tair_am, sw_rad_am, half_day)
+            net_rad_pm = self.calc_radiation(tair_pm, sw_rad_pm, half_day)
             
-            elif self.control.assim_model == "MATE":
-                # local vars for readability
-                penm = self.calc_transpiration_penmon_am_pm
-                gpp_am = self.fluxes.gpp_am
-                gpp_pm = self.fluxes.gpp_pm
-                
-                (trans_am, omegax_am, 
-                 gs_mol_m2_hfday_am, 
-                 ga_mol_m2_hfday_am) = penm(net_rad_am, wind_am, ca, daylen, 
-                                            press, vpd_am, tair_am, gpp_am)
-                 
-                (trans_pm, omegax_pm, 
-                 gs_mol_m2_hfday_pm, 
-                 ga_mol_m2_hfday_pm) = penm(net_rad_pm, wind_pm, ca, daylen, 
-                                            press, vpd_pm, tair_pm, gpp_pm)
-                
-                # Unit conversions...
-                DAY_2_SEC = 1.0 / (60.0 * 60.0 * daylen)
-                self.fluxes.omega = (omegax_am + omegax_pm) / 2.0                                  
-    
-                # output in mol H20 m-2 s-1
-                self.fluxes.gs_mol_m2_sec = ((gs_mol_m2_hfday_am + 
-                                              gs_mol_m2_hfday_pm) * DAY_2_SEC)
-                self.fluxes.ga_mol_m2_sec = ((ga_mol_m2_hfday_am + 
-                                              ga_mol_m2_hfday_pm) * DAY_2_SEC)
-    
-                # mm day-1
-                self.fluxes.transpiration = trans_am + trans_pm
-        
-        
-        elif self.control.trans_model == 2:
-            self.calc_transpiration_priestay(net_rad_day, tair_day, press)
+            met_terms_day = met_terms_am = met_terms_pm = None
+                        
+        # calculate water fluxes
+        self.transpiration(daylen, ca, press,
+                           (tair_am, vpd_am, wind_am, net_rad_am, met_terms_am),
+                           (tair_pm, vpd_pm, wind_pm, net_rad_pm, met_terms_pm),
+                           (tair_day, vpd_day, wind_day, net_rad_day,
+                            met_terms_day))
     
         self.calc_infiltration(rain)
         self.fluxes.soil_evap = self.calc_soil_evaporation(tair_day, 
                                                            net_rad_day,
                                                            press, daylen, 
-                                                           sw_rad_day)
+                                                           sw_rad_day,
+                                                           met_terms_day)
         self.fluxes.et = (self.fluxes.transpiration + self.fluxes.soil_evap +
                           self.fluxes.interception)
         self.fluxes.runoff = self.update_water_storage()
        
+    # transpiration is bound to one of these by trans_model (and for
+    # Penman-Monteith by assim_model). Each takes the day length, CO2,
+    # pressure and the (air temperature, vpd, wind, net radiation, met terms)
+    # of the morning, afternoon and whole day.
+    def transpiration_wue(self, daylen, ca, press, am, pm, day):
+        """ Transpiration calculated from WUE, trans_model 0 """
+        self.calc_transpiration()
+
+    def transpiration_penmon_day(self, daylen, ca, press, am, pm, day):
+        """ Penman-Monteith at the daily time scale, trans_model 1 with BEWDY
+        """
+        (tair_day, vpd_day, wind_day, net_rad_day, met_terms_day) = day
+        self.calc_transpiration_penmon(vpd_day, net_rad_day, tair_day,
+                                       wind_day, ca, daylen, press)
+
+    def transpiration_penmon_am_pm(self, daylen, ca, press, am, pm, day):
+        """ Penman-Monteith for the morning and afternoon, trans_model 1 with
+        MATE """
+        # Whilst the AM and PM response to CO2 are proportional, because
+        # we sum AM and PM values within the code it results in a larger
+        # than proportional WUE response to CO2. Currently as I see it the
+        # best way to minimise this is to calculate gs at the daily time
+        # scale to reduce the influence of AM/PM VPD. I think the only
+        # correct fix would be to replace MATE with a daily time step GPP
+        # calculation.
+        (tair_am, vpd_am, wind_am, net_rad_am, met_terms_am) = am
+        (tair_pm, vpd_pm, wind_pm, net_rad_pm, met_terms_pm) = pm
+
+        # local vars for readability
+        penm = self.calc_transpiration_penmon_am_pm
+        gpp_am = self.fluxes.gpp_am
+        gpp_pm = self.fluxes.gpp_pm
+
+        (trans_am, omegax_am,
+         gs_mol_m2_hfday_am,
+         ga_mol_m2_hfday_am) = penm(net_rad_am, wind_am, ca, daylen,
+                                    press, vpd_am, tair_am, gpp_am,
+                                    met_terms=met_terms_am)
+
+        (trans_pm, omegax_pm,
+         gs_mol_m2_hfday_pm,
+         ga_mol_m2_hfday_pm) = penm(net_rad_pm, wind_pm, ca, daylen,
+                                    press, vpd_pm, tair_pm, gpp_pm,
+                                    met_terms=met_terms_pm)
+
+        # Unit conversions...
+        DAY_2_SEC = 1.0 / (60.0 * 60.0 * daylen)
+        self.fluxes.omega = (omegax_am + omegax_pm) / 2.0
+
+        # output in mol H20 m-2 s-1
+        self.fluxes.gs_mol_m2_sec = ((gs_mol_m2_hfday_am +
+                                      gs_mol_m2_hfday_pm) * DAY_2_SEC)
+        self.fluxes.ga_mol_m2_sec = ((ga_mol_m2_hfday_am +
+                                      ga_mol_m2_hfday_pm) * DAY_2_SEC)
+
+        # mm day-1
+        self.fluxes.transpiration = trans_am + trans_pm
+
+    def transpiration_priestley_taylor(self, daylen, ca, press, am, pm, day):
+        """ Priestley-Taylor, trans_model 2 """
+        (tair_day, vpd_day, wind_day, net_rad_day, met_terms_day) = day
+        self.calc_transpiration_priestay(net_rad_day, tair_day, press,
+                                         met_terms=met_terms_day)
+
     def get_met_data(self, day, daylen):
         """ Grab the days met data out of the structure and return day values.
 
@@ -190,6 +242,26 @@ class WaterBalance(object):
                 sw_rad_day, vpd_am, vpd_pm, vpd_day, wind_am, wind_pm, wind_day, 
                 ca, press)
 
+    def get_met_terms(self, day, period):
+        """ Grab the precomputed temperature dependent Penman-Monteith terms
+
+        Parameters:
+        ----------
+        day : int
+            project day.
+        period : string
+            "day", "am" or "pm"
+
+        Returns:
+        -------
+        met_terms : tuple
+            latent heat of vapourisation [MJ kg-1], slope of the saturation
+            vapour pressure curve [kPa degC-1] and density of air [kg m-3]
+        """
+        return (self.derived['lambda_' + period][day],
+                self.derived['slope_' + period][day],
+                self.derived['rho_' + period][day])
+
     def calc_infiltration(self, rain):
         """ Estimate "effective" rain, or infiltration I guess.
 
@@ -228,7 +300,8 @@ class WaterBalance(object):
         else:
             self.fluxes.transpiration = 0.0
 
-    def calc_transpiration_priestay(self, net_rad, tavg, press):
+    def calc_transpiration_priestay(self, net_rad, tavg, press, 
+                                    met_terms=None):
         """ Calculate canopy transpiration using the Priestley Taylor eqn
         units (mm/day)
 
@@ -240,11 +313,14 @@ class WaterBalance(object):
             net radiation [mj m-2 s-1]
         press : float
             average daytime pressure [kPa]
+        met_terms : tuple, optional
+            precomputed (latent heat, svp slope, air density)
 
         """
         P = PriestleyTaylor()
         self.fluxes.transpiration = P.calc_evaporation(net_rad, tavg, press,
-                                                        pt_coeff=1.26)
+                                                        pt_coeff=1.26,
+                                                        met_terms=met_terms)
 
     def calc_transpiration_penmon(self, vpd, net_rad, tavg, wind, ca, daylen, 
                                   press):
@@ -293,7 +369,7 @@ class WaterBalance(object):
         self.fluxes.transpiration = transp * SEC_2_DAY
         
     def calc_transpiration_penmon_am_pm(self, net_rad, wind, ca, daylen, 
-                                        press, vpd, tair, gpp):
+                                        press, vpd, tair, gpp, met_terms=None):
         """ Calculate canopy transpiration using the Penman-Monteith equation
         using am and pm data [mm/day]
         
@@ -315,6 +391,8 @@ class WaterBalance(object):
             daylength in hours
         press : float
             average daytime pressure [kPa]
+        met_terms : tuple, optional
+            precomputed (latent heat, svp slope, air density)
 
         """
         # local
@@ -344,7 +422,8 @@ class WaterBalance(object):
         (trans, 
          omegax) = self.P.calc_evaporation(vpd, wind, gs_m_per_sec, 
                                            net_rad, tair, press, canht=canht, 
-                                           ga=ga_m_per_sec)
+                                           ga=ga_m_per_sec, 
+                                           met_terms=met_terms)
         
         # convert to mm/half day
         trans *= SEC_2_HALF_DAY
@@ -431,7 +510,8 @@ class WaterBalance(object):
         
         return net_rad * tconv # MJ m-2 s-1
 
-    def calc_soil_evaporation(self, tavg, net_rad, press, daylen, sw_rad):
+    def calc_soil_evaporation(self, tavg, net_rad, press, daylen, sw_rad,
+                              met_terms=None):
         """ Use Penman eqn to calculate top soil evaporation flux at the
         potential rate.
 
@@ -466,6 +546,8 @@ class WaterBalance(object):
             net radiation [mj m-2 day-1]
         press : float
             average daytime pressure [kPa]
+        met_terms : tuple, optional
+            precomputed (latent heat, svp slope, air density)
 
         Returns:
         --------
@@ -474,7 +556,7 @@ class WaterBalance(object):
 
         """
         P = Penman()
-        soil_evap = P.calc_evaporation(net_rad, tavg, press)
+        soil_evap = P.calc_evaporation(net_rad, tavg, press, met_terms)
         
         # Surface radiation is reduced by overstory LAI cover. This empirical
         # fit comes from Ritchie (1972) and is formed by a fit between the LAI
@@ -564,6 +646,10 @@ class SoilMoisture(object):
     -----------
     * Cosby et al. (1984) Water Resources Research, 20, 682-690.
     """
+    # were the Landsberg and Waring params derived from the soil texture, so
+    # they are derived again if initialise_parameters is called again
+    lw_params_derived = False
+    
     def __init__(self, control, params, state, fluxes):
         
         self.params = params
@@ -616,16 +702,17 @@ class SoilMoisture(object):
             
         # calculate Landsberg and Waring SW modifier parameters if not
         # specified by the user based on a site calibration
-        if (self.params.ctheta_topsoil is None and 
-            self.params.ntheta_topsoil is None and
-            self.params.ctheta_root is None and 
-            self.params.ntheta_root is None):      
+        if ((self.params.ctheta_topsoil is None and 
+             self.params.ntheta_topsoil is None and
+             self.params.ctheta_root is None and 
+             self.params.ntheta_root is None) or self.lw_params_derived):
            
             (self.params.ctheta_topsoil, 
              self.params.ntheta_topsoil) = self.get_soil_params(topsoil_type)
             
             (self.params.ctheta_root, 
              self.params.ntheta_root) = self.get_soil_params(rootsoil_type)  
+            self.lw_params_derived = True
         
         #check values derived
         #print self.params.wcapac_topsoil
@@ -937,7 +1024,7 @@ class PenmanMonteith(object):
         self.z0h_z0m = z0h_z0m
         
     def calc_evaporation(self, vpd, wind, gs, net_rad, tavg, press, canht=None, 
-                         ga=None):
+                         ga=None, met_terms=None):
 
         """
         Parameters:
@@ -954,6 +1041,8 @@ class PenmanMonteith(object):
             daytime average temperature [degC]
         press : float
             average daytime pressure [kPa]
+        met_terms : tuple, optional
+            precomputed (latent heat, svp slope, air density) for tavg
 
         Returns:
         --------
@@ -965,10 +1054,13 @@ class PenmanMonteith(object):
         if press == None:
             press = self.calc_atmos_pressure()
         
-        lambdax = self.calc_latent_heat_of_vapourisation(tavg)
+        if met_terms is None:
+            lambdax = self.calc_latent_heat_of_vapourisation(tavg)
+            slope = self.calc_slope_of_saturation_vapour_pressure_curve(tavg)
+            rho = self.calc_density_of_air(tavg)
+        else:
+            (lambdax, slope, rho) = met_terms
         gamma = self.calc_pyschrometric_constant(lambdax, press)
-        slope = self.calc_slope_of_saturation_vapour_pressure_curve(tavg)
-        rho = self.calc_density_of_air(tavg)
         if ga is None:
             ga = self.canopy_boundary_layer_conductance(wind, canht)
        
@@ -1188,7 +1280,7 @@ class Penman(PenmanMonteith):
       Physics, pg. 185-187.
     """
 
-    def calc_evaporation(self, net_rad, tavg, press):
+    def calc_evaporation(self, net_rad, tavg, press, met_terms=None):
         """ Equilibrium evaporation
 
         Parameters:
@@ -1199,6 +1291,8 @@ class Penman(PenmanMonteith):
             daytime average temperature [degC]
         press : float
             average daytime pressure [kPa]
+        met_terms : tuple, optional
+            precomputed (latent heat, svp slope, air density) for tavg
 
         Returns:
         --------
@@ -1209,9 +1303,12 @@ class Penman(PenmanMonteith):
         if press == None:
             press = self.calc_atmos_pressure()
 
-        lambdax = self.calc_latent_heat_of_vapourisation(tavg)
+        if met_terms is None:
+            lambdax = self.calc_latent_heat_of_vapourisation(tavg)
+            slope = self.calc_slope_of_saturation_vapour_pressure_curve(tavg)
+        else:
+            (lambdax, slope, rho) = met_terms
         gamma = self.calc_pyschrometric_constant(lambdax, press)
-        slope = self.calc_slope_of_saturation_vapour_pressure_curve(tavg)
 
         return ((slope / (slope + gamma)) * net_rad) / lambdax
 
@@ -1240,7 +1337,8 @@ class PriestleyTaylor(PenmanMonteith):
       81-82.
     """
 
-    def calc_evaporation(self, net_rad, tavg, press, pt_coeff=1.26):
+    def calc_evaporation(self, net_rad, tavg, press, pt_coeff=1.26,
+                         met_terms=None):
         """
         Parameters:
         -----------
@@ -1252,15 +1350,20 @@ class PriestleyTaylor(PenmanMonteith):
             average daytime pressure [kPa]
         pt_coeff : float, optional
             Priestley-Taylor coefficient
+        met_terms : tuple, optional
+            precomputed (latent heat, svp slope, air density) for tavg
 
         Returns:
         --------
         transpiration : float
             transpiration [mm day-1]
         """
-        lambdax = self.calc_latent_heat_of_vapourisation(tavg)
+        if met_terms is None:
+            lambdax = self.calc_latent_heat_of_vapourisation(tavg)
+            slope = self.calc_slope_of_saturation_vapour_pressure_curve(tavg)
+        else:
+            (lambdax, slope, rho) = met_terms
         gamma = self.calc_pyschrometric_constant(lambdax, press)
-        slope = self.calc_slope_of_saturation_vapour_pressure_curve(tavg)
 
         return (pt_coeff / lambdax) * (slope / (slope + gamma)) * net_rad
 
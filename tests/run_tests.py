@@ -7,22 +7,53 @@ when new code has been changed.
 
 import os
 import sys
+import shutil
+import tempfile
+import subprocess
 import numpy as np
 import unittest
 from math import exp, sqrt, sin, pi
+from timeit import default_timer
+from StringIO import StringIO
+from collections import Counter, OrderedDict
 from gday.mate import MateC3, MateC4
-from gday.file_parser import read_met_forcing
+import gday.file_parser as file_parser
+from gday.file_parser import read_met_forcing, apply_overrides, read_config
+from gday.adjust_gday_param_file import adjust_param_file
 import gday.default_control as control
 import gday.default_files as files
 import gday.default_params as params
 import gday.default_fluxes as fluxes
 import gday.default_state as state
+import gday.constants as const
 from gday.water_balance import WaterBalance, SoilMoisture
+from gday.records import Control, Params, State, Fluxes, Files
+from gday.soil_cn_model import (CarbonSoilFlows, NitrogenSoilFlows,
+                                MatrixCarbonSoilFlows, MatrixNitrogenSoilFlows,
+                                CPOOLS, NPOOLS)
+from gday.sensitivity import (saltelli_design, sobol_indices, morris_design,
+                              morris_indices)
+from gday.config_schema import parse_section
+from gday.utilities import day_length, daylength_tables
+from gday.gday import Gday
+from gday.ensemble import GdayEnsemble
+from gday.grid import GdayGrid
+from gday.timing import StageTimer
+from gday.output_io import read_output
+from gday.spinup_cache import SpinUpCache
+from gday.runner import run_experiment
+import gday.components as components
 
 __author__  = "Martin De Kauwe"
 __version__ = "1.0 (09.012.2014)"
 __email__   = "mdekauwe@gmail.com"
 
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.pardir, "example")
+EXAMPLE_CFG = os.path.join(EXAMPLE_DIR, "params",
+                           "NCEAS_DUKE_model_youngforest_amb.cfg")
+EXAMPLE_MET = os.path.join(EXAMPLE_DIR, "met_data",
+                           "DUKE_met_data_amb_co2.csv")
 
 
 def setup_metdata(day):
@@ -300,7 +331,620 @@ def testPhotosynthesis(ps_pathway=None, debug=False):
         print fluxes.gpp_am
         print fluxes.gpp_pm
    
-     
+
+def testPhotosynthesisBatch(ps_pathway=None):
+    """ GPP from photosynthesis_batch and, day by day, from the scalar 
+    calculate_photosynthesis for a range of LAI, canopy N and water stress """
+    day = 100
+    params = setup_params()
+    met_data = setup_metdata(day)
+    daylen = 12.0
+    
+    lai = np.array([0.0, 0.005, 0.5, 1.5, 3.0, 4.5, 8.0])
+    ncontent = np.array([0.0, 0.01, 1.2, 2.5, 4.5, 6.0, 9.0])
+    wtfac_root = np.array([1.0, 0.9, 0.05, 0.4, 0.8, 1.0, 0.6])
+    fipar = 1.0 - np.exp(-params.kext * lai)
+    
+    if ps_pathway == "C3":
+        M = MateC3(control, params, state, fluxes, met_data)
+    elif ps_pathway == "C4":
+        M = MateC4(control, params, state, fluxes, met_data)
+    
+    keys = ["apar", "gpp_gCm2", "gpp_am", "gpp_pm", "gpp"]
+    scalar = dict((key, []) for key in keys)
+    for i in xrange(len(lai)):
+        state.lai = lai[i].item()
+        state.ncontent = ncontent[i].item()
+        state.wtfac_root = wtfac_root[i].item()
+        state.fipar = fipar[i].item()
+        M.calculate_photosynthesis(day, daylen)
+        for key in keys:
+            scalar[key].append(getattr(fluxes, key))
+    
+    met_arrays = dict((var, met_data[var][day]) 
+                      for var in ("tam", "tpm", "vpd_am", "vpd_pm", "co2", 
+                                  "par"))
+    met_arrays["daylen"] = daylen
+    batch = M.photosynthesis_batch(met_arrays, lai, ncontent, fipar, 
+                                   wtfac_root)
+    
+    return (scalar, batch)
+
+def testSoil(matrix=False, strfloat=False):
+    """ One day of the soil C & N pool updates, with the pool by pool flux 
+    methods or the transfer matrix form """
+    sc = Control()
+    sp = Params()
+    ss = State()
+    sf = Fluxes()
+    sc.strfloat = strfloat
+    sp.decayrate = [0.011, 0.032, 0.009, 0.041, 0.019, 0.0006, 0.00002]
+    pools = [4.2, 1.3, 1e-9, 0.35, 2.4, 44.3, 59.5]
+    for (cname, nname, c) in zip(CPOOLS, NPOOLS, pools):
+        setattr(ss, cname, c)
+        setattr(ss, nname, c / 60.0)
+    ss.inorgn = 0.028
+    sf.surf_struct_litter = 0.012
+    sf.soil_struct_litter = 0.004
+    sf.surf_metab_litter = 0.002
+    sf.soil_metab_litter = 0.001
+    sf.n_surf_struct_litter = 0.00008
+    sf.n_soil_struct_litter = 0.00003
+    sf.n_surf_metab_litter = 0.0001
+    sf.n_soil_metab_litter = 0.00005
+    (sf.ninflow, sf.nurine, sf.nloss, sf.nuptake) = (0.00001, 0.0, 0.0, 0.0)
+    
+    if matrix:
+        cs = MatrixCarbonSoilFlows(sc, sp, ss, sf, None)
+        ns = MatrixNitrogenSoilFlows(sc, sp, ss, sf, None)
+    else:
+        cs = CarbonSoilFlows(sc, sp, ss, sf, None)
+        ns = NitrogenSoilFlows(sc, sp, ss, sf, None)
+    cs.calculate_cfluxes()
+    sf.hetero_resp = cs.calculate_soil_respiration()
+    cs.calculate_cpools()
+    ns.calculate_nfluxes()
+    sf.ngross = ns.calculate_n_mineralisation()
+    (sf.nimmob, active_nc_slope, 
+     slow_nc_slope, passive_nc_slope) = ns.calculate_n_immobilisation()
+    ns.calculate_npools(active_nc_slope, slow_nc_slope, passive_nc_slope)
+    
+    values = [getattr(ss, name) for name in CPOOLS + NPOOLS + ["inorgn"]]
+    values += [sf.hetero_resp, sf.ngross, sf.nimmob, sf.nlittrelease,
+               sf.c_into_active, sf.surf_metab_to_active,
+               sf.n_surf_metab_to_active, sf.n_slow_to_passive]
+    
+    return values
+
+def testSensitivity():
+    """ Sobol indices and Morris effects of the Ishigami function, any
+    parameter names will do as the function is evaluated directly """
+    ranges = [("sla", -pi, pi), ("g1", -pi, pi), ("finesoil", -pi, pi)]
+    def ishigami(x):
+        return (np.sin(x[:,0]) + 7.0 * np.sin(x[:,1])**2 +
+                0.1 * x[:,2]**4 * np.sin(x[:,0]))
+    
+    x = saltelli_design(ranges, 20000, seed=1)
+    sobol = sobol_indices(ishigami(x), len(ranges))
+    x = morris_design(ranges, 50, seed=2)
+    morris = morris_indices(x, ishigami(x), ranges)
+    
+    return (sobol, morris)
+
+def testConfigSchema():
+    """ Typed options of a .cfg file section and the errors in it """
+    good = parse_section("control", [("ncycle", "false"), ("grazing", "0"),
+                                     ("modeljm", "true"),
+                                     ("soil_model", "matrix")])
+    bad = parse_section("params", [("sla", "4.4"), ("sla_typo", "4.4"),
+                                   ("finesoil", "fine"),
+                                   ("topsoil_type", "clay_loam"),
+                                   ("b_root", "None")])
+    
+    return (good, bad)
+
+def testOverrides(overrides):
+    """ Model control flags and params after applying overrides, or the
+    error message if they are rejected """
+    (c, p, s, f) = (Control(), Params(), State(), Files())
+    try:
+        apply_overrides(overrides, p, s, c, f)
+    except RuntimeError, e:
+        return str(e)
+    
+    return (c, p)
+
+def testConfigCache(values=("0.52", "0.53", "0.54"), cache_size=2):
+    """ finesoil read from a .cfg file as it is rewritten between reads
+    without changing its size or modification time, and the number of parsed
+    files kept """
+    tmp_dir = tempfile.mkdtemp()
+    saved_size = file_parser.CONFIG_CACHE_SIZE
+    file_parser.CONFIG_CACHE_SIZE = cache_size
+    try:
+        fname = os.path.join(tmp_dir, "model.cfg")
+        shutil.copy(EXAMPLE_CFG, fname)
+        stat = os.stat(fname)
+        finesoil = [read_config(fname).sections["params"]["finesoil"]]
+        for value in values:
+            adjust_param_file(fname, {"finesoil": value})
+            os.utime(fname, (stat.st_atime, stat.st_mtime))
+            finesoil.append(read_config(fname).sections["params"]["finesoil"])
+        ncached = len(file_parser.CONFIG_CACHE)
+    finally:
+        file_parser.CONFIG_CACHE_SIZE = saved_size
+        shutil.rmtree(tmp_dir)
+    
+    return (finesoil, ncached)
+
+def testStreamedOutput():
+    """ Daily output of a run in csv and binary, the number of rows written
+    and the size of the output buffer at the end of the run """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        outputs = []
+        for output_ascii in (True, False):
+            fname = os.path.join(tmp_dir, "out.csv")
+            overrides = {"files.met_fname": EXAMPLE_MET,
+                         "files.out_fname": fname,
+                         "files.out_param_fname": fname + ".cfg",
+                         "control.output_ascii": output_ascii}
+            G = Gday(EXAMPLE_CFG, overrides=overrides)
+            G.run_sim()
+            if output_ascii:
+                lines = [line for line in open(fname).read().splitlines()
+                         if not line.startswith("#")]
+                var_names = lines[0].split(",")
+                rows = [[float(x) for x in line.split(",")]
+                        for line in lines[1:]]
+                output = dict((var, np.array([row[j] for row in rows]))
+                              for (j, var) in enumerate(var_names))
+            else:
+                output = read_output(fname)
+                output = dict((var, np.array(output[var]))
+                              for var in output.var_names)
+            outputs.append((output, G.pr.nrows, len(G.pr.chunk)))
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return outputs
+
+def testRestart(output_ascii=True, checkpoint_freq=7):
+    """ Daily output of a run, and after restarting it from its last
+    checkpoint, appending to its output file """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        out_fname = os.path.join(tmp_dir, "out.csv")
+        chk_fname = os.path.join(tmp_dir, "out.chk")
+        overrides = {"files.met_fname": EXAMPLE_MET,
+                     "files.out_fname": out_fname,
+                     "files.out_param_fname": os.path.join(tmp_dir, "out.cfg"),
+                     "files.checkpoint_fname": chk_fname,
+                     "control.output_ascii": output_ascii,
+                     "control.checkpoint_freq": checkpoint_freq}
+        outputs = []
+        G = Gday(EXAMPLE_CFG, overrides=overrides)
+        for i in xrange(2):
+            G.run_sim()
+            if output_ascii:
+                outputs.append(open(out_fname).readlines())
+            else:
+                output = read_output(out_fname)
+                outputs.append(np.array([output[var]
+                                         for var in output.var_names]))
+            G = Gday.from_checkpoint(chk_fname, append_output=True)
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return outputs
+
+def testMetForcing(years=("1996", "1997")):
+    """ Met forcing read into columns and the rows of the met file parsed
+    one by one, as they used to be """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmp_dir, "met.csv")
+        write_short_met(fname, years)
+        met_data = read_met_forcing(fname, 4, cache=False)
+        lines = open(fname).read().splitlines()
+        var_names = lines[4].replace("#", " ").strip().split(",")
+        rows = [[float(x) for x in line.split(",")] for line in lines[5:]]
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return (met_data, var_names, rows)
+
+def testMetCache():
+    """ Met forcing read through the sidecar cache and parsed from the text,
+    as the met file is written and then changed """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmp_dir, "met.csv")
+        reads = []
+        for years in (("1996",), ("1997",)):
+            write_short_met(fname, years)
+            read_met_forcing(fname, 4)
+            # from the sidecar written by the first read
+            cached = read_met_forcing(fname, 4)
+            parsed = read_met_forcing(fname, 4, cache=False)
+            # the sidecar is mapped read-only
+            reads.append([(not cached[var].flags.writeable,
+                           np.array(cached[var]), parsed[var])
+                          for var in parsed.var_names])
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return reads
+
+def testSharedForcing(latitudes=(35.9, -60.0)):
+    """ Daily output of a run, on its own and with the met forcing shared
+    with models at other latitudes built after it """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        forcing = read_met_forcing(EXAMPLE_MET, 4)
+        outputs = []
+        for shared in (None, forcing):
+            models = []
+            for (i, latitude) in enumerate(latitudes):
+                fname = os.path.join(tmp_dir, "out%d.csv" % i)
+                overrides = {"files.met_fname": EXAMPLE_MET,
+                             "files.out_fname": fname,
+                             "files.out_param_fname": fname + ".cfg",
+                             "params.latitude": latitude}
+                models.append(Gday(EXAMPLE_CFG, overrides=overrides,
+                                   forcing=shared))
+                if shared is None:
+                    break
+            models[0].run_sim()
+            outputs.append(open(models[0].files.out_fname).readlines())
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return outputs
+
+def testEnsemble(ncycle=True, trans_model=1):
+    """ Daily output of an ensemble and of each member run on its own """
+    members = [{"params.finesoil": 0.2, "params.rdecay": 0.3,
+                "params.sla": 4.0},
+               {"params.finesoil": 0.6, "params.rdecay": 0.6,
+                "params.sla": 6.0}]
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        overrides = []
+        for member in members:
+            member = dict(member)
+            member.update({"files.met_fname": EXAMPLE_MET,
+                           "control.ncycle": ncycle,
+                           "control.trans_model": trans_model})
+            overrides.append(member)
+        ensemble = GdayEnsemble(EXAMPLE_CFG, overrides).run_sim()
+        
+        alone = []
+        for member in overrides:
+            member = dict(member)
+            fname = os.path.join(tmp_dir, "out.bin")
+            member.update({"files.out_fname": fname,
+                           "files.out_param_fname": fname + ".cfg",
+                           "control.output_ascii": False})
+            Gday(EXAMPLE_CFG, overrides=member).run_sim()
+            output = read_output(fname)
+            alone.append(dict((var, np.array(output[var]))
+                              for var in output.var_names))
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return (ensemble, alone)
+
+def testGrid():
+    """ Daily output of a grid, with cells in two groups of control flags
+    and two met files, and of each cell run on its own """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        met_fnames = [os.path.join(tmp_dir, "met%d.csv" % i)
+                      for i in xrange(2)]
+        for met_fname in met_fnames:
+            write_short_met(met_fname)
+        cells = [{"files.met_fname": met_fnames[i % 2],
+                  "params.latitude": 30.0 + 10.0 * i,
+                  "params.finesoil": 0.3 + 0.1 * i} for i in xrange(3)]
+        cells[2]["control.nuptake_model"] = 1
+        G = GdayGrid(EXAMPLE_CFG, cells)
+        grid = G.run_sim()
+        
+        alone = []
+        for cell in cells:
+            cell = dict(cell)
+            fname = os.path.join(tmp_dir, "out.bin")
+            cell.update({"files.out_fname": fname,
+                         "files.out_param_fname": fname + ".cfg",
+                         "control.output_ascii": False})
+            Gday(EXAMPLE_CFG, overrides=cell).run_sim()
+            output = read_output(fname)
+            alone.append(dict((var, np.array(output[var]))
+                              for var in output.var_names))
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return (len(G.groups), grid, alone)
+
+def testFork():
+    """ Daily output of a model forked off a checkpoint with overrides and
+    of a model set up with the same overrides """
+    fork = {"params.finesoil": 0.1, "params.rdecay": 0.5,
+            "params.dz0v_dh": 0.2, "params.measurement_temp": 20.0,
+            "control.soil_model": "MATRIX", "control.nuptake_model": 2}
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        chk_fname = os.path.join(tmp_dir, "out.chk")
+        outputs = []
+        for i in xrange(2):
+            fname = os.path.join(tmp_dir, "out%d.csv" % i)
+            overrides = {"files.met_fname": EXAMPLE_MET,
+                         "files.out_fname": fname,
+                         "files.out_param_fname": fname + ".cfg"}
+            if i == 0:
+                Gday(EXAMPLE_CFG, overrides=overrides).save_checkpoint(
+                                                                    chk_fname)
+                overrides.update(fork)
+                G = Gday.from_checkpoint(chk_fname, overrides=overrides)
+            else:
+                overrides.update(fork)
+                G = Gday(EXAMPLE_CFG, overrides=overrides)
+            G.run_sim()
+            outputs.append(open(fname).readlines())
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return outputs
+
+def bound_strategies(G):
+    """ Names of the N uptake and transpiration methods a model uses """
+    return (G.pg.calculate_nuptake.__name__, G.pg.wb.transpiration.__name__)
+
+def testStrategies():
+    """ Names of the methods bound for N uptake and transpiration, as set up,
+    after changing the control flags, on restarting from a checkpoint with
+    them overridden, and the error for an unknown setting """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmp_dir, "out.csv")
+        overrides = {"files.met_fname": EXAMPLE_MET, "files.out_fname": fname,
+                     "files.out_param_fname": fname + ".cfg"}
+        G = Gday(EXAMPLE_CFG, overrides=overrides)
+        names = [bound_strategies(G)]
+        G.control.nuptake_model = 3
+        G.control.trans_model = 2
+        G.update_components()
+        names.append(bound_strategies(G))
+        
+        chk_fname = os.path.join(tmp_dir, "out.chk")
+        G.save_checkpoint(chk_fname)
+        overrides.update({"control.nuptake_model": 0,
+                          "control.trans_model": 0})
+        G = Gday.from_checkpoint(chk_fname, overrides=overrides)
+        names.append(bound_strategies(G))
+        
+        G.control.nuptake_model = 7
+        try:
+            G.update_components()
+            err_msg = None
+        except RuntimeError, e:
+            err_msg = str(e)
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return (names, err_msg)
+
+def testDaylength(latitudes=(35.9, 67.0, 70.0, -80.0), yr_days=365):
+    """ Daylength table of each latitude and the daylength of each day """
+    tables = daylength_tables(yr_days, latitudes)
+    days = np.array([[day_length(doy, yr_days, latitude)
+                      for doy in xrange(1, yr_days + 1)]
+                     for latitude in latitudes])
+    
+    return (tables, days)
+
+def write_short_met(fname, years=("1996",)):
+    """ Write the example forcing cut down to a few years, to spin up on """
+    f = open(fname, "w")
+    for line in open(EXAMPLE_MET):
+        if line.startswith("#") or line.split(",", 1)[0] in years:
+            f.write(line)
+    f.close()
+
+def testSpinUpCache():
+    """ The spun-up model and its final state file, from a spin-up and from
+    the spin-up cache """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        met_fname = os.path.join(tmp_dir, "met.csv")
+        write_short_met(met_fname)
+        overrides = {"files.met_fname": met_fname,
+                     "files.out_fname": os.path.join(tmp_dir, "out.csv"),
+                     "files.out_param_fname": os.path.join(tmp_dir, "out.cfg"),
+                     "files.spinup_cache_dir": os.path.join(tmp_dir, "cache"),
+                     "control.print_options": "END"}
+        models = []
+        for i in xrange(2):
+            G = Gday(EXAMPLE_CFG, spin_up=True, overrides=overrides)
+            # a single block of the forcing cycles is enough here
+            G.spin_up_pools(tol=1000.0)
+            models.append((open(overrides["files.out_param_fname"]).read(),
+                           G.params.__getstate__(), list(G.pg.sma.data)))
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return models
+
+class CheckpointStub(object):
+    """ Stands in for a model when filling the spin-up cache """
+    def save_checkpoint(self, fname):
+        open(fname, "w").write("stub")
+
+def testSpinUpCacheEviction(max_entries=2):
+    """ Keys left in the cache after adding one more than it holds """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        cache = SpinUpCache(tmp_dir, max_entries)
+        keys = ["key%d" % i for i in xrange(max_entries + 1)]
+        for (i, key) in enumerate(keys):
+            cache.store(key, CheckpointStub())
+            # in the order they were last used
+            os.utime(cache.fname(key), (1E9 + i, 1E9 + i))
+        kept = [key for key in keys if os.path.exists(cache.fname(key))]
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return (keys, kept)
+
+def testSpinUpEquilibrium(modes=("plain", "accelerate", "extrapolate"),
+                          tol=5E-03):
+    """ Plant & soil C [kg m-2] at the end of the spin-up, plain and with
+    each faster spin-up. The litter, soil and wood turnover is sped up, with
+    the N cycle off, so the pools settle within a century or so. """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        met_fname = os.path.join(tmp_dir, "met.csv")
+        write_short_met(met_fname)
+        overrides = {"files.met_fname": met_fname,
+                     "files.out_fname": os.path.join(tmp_dir, "out.csv"),
+                     "files.out_param_fname": os.path.join(tmp_dir, "out.cfg"),
+                     "control.print_options": "END", "control.ncycle": False,
+                     "params.kdec6": 2.0, "params.kdec7": 0.2,
+                     "params.wdecay": 0.2, "params.bdecay": 0.2,
+                     "params.crdecay": 0.2}
+        pools = {}
+        for mode in modes:
+            G = Gday(EXAMPLE_CFG, spin_up=True, overrides=overrides)
+            G.spin_up_pools(tol=tol, cache_dir="",
+                            accelerate=(mode == "accelerate"),
+                            extrapolate=(mode == "extrapolate"))
+            pools[mode] = (G.state.plantc * const.TONNES_HA_2_KG_M2,
+                           G.state.soilc * const.TONNES_HA_2_KG_M2)
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return pools
+
+def testRunner():
+    """ Results and progress messages of an experiment with a run that works
+    and one that fails """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        met_fname = os.path.join(tmp_dir, "met.csv")
+        write_short_met(met_fname)
+        specs = []
+        for name in ("good", "bad"):
+            out_fname = os.path.join(tmp_dir, name + ".csv")
+            specs.append({"cfg_fname": EXAMPLE_CFG, "name": name,
+                          "overrides": {"files.met_fname": met_fname,
+                                        "files.out_fname": out_fname,
+                                        "files.out_param_fname":
+                                        out_fname + ".cfg"}})
+        specs[1]["overrides"]["files.met_fname"] = os.path.join(tmp_dir,
+                                                                "missing.csv")
+        progress = StringIO()
+        results = run_experiment(specs, processes=2, progress=progress)
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return (results, progress.getvalue())
+
+class ClockStub(object):
+    """ Clock which only moves when it's told to """
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+class SoilStub(object):
+    """ Timed component, takes 2 s a day """
+    def __init__(self, clock):
+        self.clock = clock
+    
+    def calculate_csoil_flows(self):
+        self.clock.now += 2.0
+
+class ModelStub(object):
+    """ Runs three days of a year, each taking 1 s outside the timed soil
+    component """
+    def __init__(self, clock):
+        self.clock = clock
+        self.cs = SoilStub(clock)
+        self.timer = None
+    
+    def run_sim(self):
+        for day in xrange(3):
+            self.cs.calculate_csoil_flows()
+            self.clock.now += 1.0
+        self.timer.end_year(1996)
+
+def testStageTimer(nruns=2):
+    """ Stage totals of a model stub timed with a stub clock, and of the
+    model """
+    clock = ClockStub()
+    M = ModelStub(clock)
+    M.timer = StageTimer(clock=clock)
+    M.timer.attach(M)
+    for i in xrange(nruns):
+        M.run_sim()
+    
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        met_fname = os.path.join(tmp_dir, "met.csv")
+        write_short_met(met_fname, ("1996", "1997"))
+        overrides = {"files.met_fname": met_fname,
+                     "files.out_fname": os.path.join(tmp_dir, "out.csv"),
+                     "files.out_param_fname": os.path.join(tmp_dir, "out.cfg")}
+        G = Gday(EXAMPLE_CFG, overrides=overrides, timing=True)
+        start = default_timer()
+        G.run_sim()
+        elapsed = default_timer() - start
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    return (M.timer, G.timer, elapsed)
+
+def testLazyComponents():
+    """ Submodels built and modules imported by a MATE run (in a process of
+    its own, this one has imported them all), and the classes found for a
+    registered component """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        met_fname = os.path.join(tmp_dir, "met.csv")
+        write_short_met(met_fname)
+        overrides = {"files.met_fname": met_fname,
+                     "files.out_fname": os.path.join(tmp_dir, "out.csv"),
+                     "files.out_param_fname": os.path.join(tmp_dir, "out.cfg"),
+                     "control.assim_model": "MATE"}
+        script = ("import sys\n"
+                  "from gday.gday import Gday\n"
+                  "G = Gday(%r, overrides=%r)\n"
+                  "G.run_sim()\n"
+                  "print sorted(G.pg.submodels)\n"
+                  "print sorted(name.split('.')[-1] for name in sys.modules\n"
+                  "             if name.startswith('gday.'))\n" %
+                  (EXAMPLE_CFG, overrides))
+        lines = subprocess.check_output([sys.executable, "-c", script],
+                                        stderr=open(os.devnull, "w"))
+        (submodels, modules) = [eval(line) for line in lines.splitlines()[-2:]]
+    finally:
+        shutil.rmtree(tmp_dir)
+    
+    classes = []
+    try:
+        for cls in ("Counter", "OrderedDict"):
+            components.register_component("test_component", "collections",
+                                          cls)
+            for i in xrange(2):
+                classes.append(components.component_class("test_component"))
+    finally:
+        components.COMPONENTS.pop("test_component", None)
+        components.RESOLVED.pop("test_component", None)
+    
+    return (submodels, modules, classes)
+
 def testWater(ps_pathway=None, debug=False):
     # Setup stuff
     day = 100
@@ -390,6 +1034,258 @@ class GdayTests(unittest.TestCase):
             correct_value = 0.903215104306     
             self.assertAlmostEqual(correct_value, fluxes.gpp_pm)
     
+    def testMateBatch(self):
+        print "Testing Photosynthesis - batch"
+        print 
+        for ps_pathway in ("C3", "C4"):
+            (scalar, batch) = testPhotosynthesisBatch(ps_pathway)
+            for key in scalar:
+                self.assertEqual(scalar[key], batch[key].tolist())
+    
+    def testSoilMatrix(self):
+        print "Testing Soil C & N - matrix form"
+        print 
+        for strfloat in (False, True):
+            flux = testSoil(matrix=False, strfloat=strfloat)
+            matrix = testSoil(matrix=True, strfloat=strfloat)
+            for (a, b) in zip(flux, matrix):
+                self.assertAlmostEqual(a, b, places=14)
+    
+    def testSensitivity(self):
+        print "Testing Sensitivity indices"
+        print 
+        (sobol, morris) = testSensitivity()
+        # analytical values
+        for (a, b) in zip(sobol["S1"], [0.3139, 0.4424, 0.0]):
+            self.assertAlmostEqual(a, b, places=1)
+        for (a, b) in zip(sobol["ST"], [0.5576, 0.4424, 0.2437]):
+            self.assertAlmostEqual(a, b, places=1)
+        # x3 only acts through its interaction with x1
+        self.assertTrue(abs(morris["mu"][2]) < morris["mu_star"][2])
+    
+    def testConfigSchema(self):
+        print "Testing .cfg file schema"
+        print 
+        ((control, control_errors), (params, params_errors)) = \
+            testConfigSchema()
+        self.assertEqual(control, {"ncycle": False, "grazing": 0, 
+                                   "modeljm": 1, "soil_model": "MATRIX"})
+        self.assertEqual(control_errors, [])
+        self.assertEqual(params, {"sla": 4.4, "topsoil_type": "clay_loam",
+                                  "b_root": None})
+        # every bad option is reported
+        self.assertEqual(len(params_errors), 2)
+    
+    def testOverrides(self):
+        print "Testing overrides checked against the .cfg file schema"
+        print 
+        (c, p) = testOverrides({"control.ncycle": "false", "grazing": "1",
+                                "control.soil_model": "matrix",
+                                "params.sla": np.float64(4.4),
+                                "finesoil": "0.5", "control.modeljm": True})
+        self.assertTrue(c.ncycle is False)
+        self.assertEqual(c.grazing, 1)
+        self.assertEqual(c.soil_model, "MATRIX")
+        self.assertEqual(c.modeljm, 1)
+        self.assertEqual(p.sla, 4.4)
+        self.assertEqual(p.finesoil, 0.5)
+        err_msg = testOverrides({"control.ncycle": "flase", "sla": "4,4",
+                                 "control.soil_model": "FLUXES",
+                                 "control.output_ascii": 2.0,
+                                 "params.sla_typo": 4.4})
+        # every bad override is reported
+        for key in ("ncycle", "sla", "soil_model", "output_ascii", 
+                    "sla_typo"):
+            self.assertTrue(key in err_msg)
+    
+    def testConfigCache(self):
+        print "Testing parsed .cfg file cache"
+        print 
+        (finesoil, ncached) = testConfigCache()
+        self.assertEqual(finesoil, [0.51, 0.52, 0.53, 0.54])
+        self.assertEqual(ncached, 2)
+    
+    def testStreamedOutput(self):
+        print "Testing streamed daily output"
+        print 
+        ((ascii, ascii_rows, ascii_chunk),
+         (binary, binary_rows, binary_chunk)) = testStreamedOutput()
+        # every day is written, through a buffer which doesn't grow
+        ndays = len(binary["year"])
+        self.assertTrue(ndays > binary_chunk)
+        self.assertEqual(binary_chunk, 1024)
+        self.assertEqual(ascii_chunk, 1024)
+        self.assertEqual(binary_rows, ndays)
+        self.assertEqual(ascii_rows, ndays)
+        self.assertEqual(sorted(ascii), sorted(binary))
+        for var in binary:
+            np.testing.assert_array_equal(ascii[var], binary[var])
+    
+    def testRestart(self):
+        print "Testing checkpoint restart"
+        print 
+        for output_ascii in (True, False):
+            (full, restarted) = testRestart(output_ascii)
+            # the header is only written once, the columns don't move and
+            # the days after the checkpoint aren't written twice
+            np.testing.assert_array_equal(full, restarted)
+    
+    def testMetForcing(self):
+        print "Testing columnar met forcing"
+        print 
+        (met_data, var_names, rows) = testMetForcing()
+        self.assertEqual(met_data.var_names, var_names)
+        for (j, var) in enumerate(var_names):
+            column = met_data[var]
+            self.assertEqual(column.dtype, np.float64)
+            self.assertTrue(column.flags.c_contiguous)
+            np.testing.assert_array_equal(column, [row[j] for row in rows])
+        # a day of the forcing is a python float
+        self.assertTrue(type(met_data["tair"][0]) is float)
+        self.assertEqual(met_data.years, [1996.0, 1997.0])
+        self.assertEqual(met_data.days_in_year, [366, 365])
+        self.assertEqual(met_data.year_start, [0, 366])
+        self.assertEqual(met_data.year_slice(1997.0), slice(366, 731))
+    
+    def testMetCache(self):
+        print "Testing met forcing sidecar cache"
+        print 
+        reads = testMetCache()
+        for columns in reads:
+            for (mapped, cached, parsed) in columns:
+                self.assertTrue(mapped)
+                np.testing.assert_array_equal(cached, parsed)
+        # the cache was rebuilt for the changed met file
+        self.assertNotEqual(len(reads[0][0][1]), len(reads[1][0][1]))
+    
+    def testSharedForcing(self):
+        print "Testing shared met forcing"
+        print 
+        (alone, shared) = testSharedForcing()
+        self.assertEqual(len(alone), len(shared))
+        # the later model's latitude doesn't change the first one's daylength
+        for (a, b) in zip(alone, shared):
+            self.assertEqual(a, b)
+    
+    def testEnsemble(self):
+        print "Testing Ensemble against single runs"
+        print 
+        # with each of the vectorised transpiration models
+        for (ncycle, trans_model) in ((True, 1), (False, 1), (True, 0),
+                                      (True, 2)):
+            (ensemble, alone) = testEnsemble(ncycle, trans_model)
+            for (i, output) in enumerate(alone):
+                for var in output:
+                    if var in ensemble and ensemble[var].ndim == 2:
+                        np.testing.assert_array_equal(ensemble[var][:,i],
+                                                      output[var])
+    
+    def testGrid(self):
+        print "Testing Grid against single runs"
+        print 
+        (ngroups, grid, alone) = testGrid()
+        self.assertEqual(ngroups, 2)
+        for (i, output) in enumerate(alone):
+            for var in output:
+                if var in grid and grid[var].ndim == 2:
+                    np.testing.assert_array_equal(grid[var][:,i], output[var])
+    
+    def testFork(self):
+        print "Testing checkpoint fork with overrides"
+        print 
+        (forked, fresh) = testFork()
+        self.assertEqual(len(forked), len(fresh))
+        for (a, b) in zip(forked, fresh):
+            self.assertEqual(a, b)
+    
+    def testStrategies(self):
+        print "Testing control flag strategies"
+        print 
+        (names, err_msg) = testStrategies()
+        self.assertEqual(names, [("nuptake_root_biomass",
+                                  "transpiration_penmon_am_pm"),
+                                 ("nuptake_soil_moisture",
+                                  "transpiration_priestley_taylor"),
+                                 ("nuptake_constant", "transpiration_wue")])
+        self.assertEqual(err_msg, "Unknown nuptake_model: 7")
+    
+    def testDaylength(self):
+        print "Testing Daylength at high latitudes"
+        print 
+        (tables, days) = testDaylength()
+        np.testing.assert_array_equal(tables, days)
+        self.assertFalse(np.isnan(tables).any())
+        # polar day and night
+        for table in tables[1:]:
+            self.assertEqual(table.max(), 24.0)
+            self.assertEqual(table.min(), 0.0)
+    
+    def testSpinUpCache(self):
+        print "Testing Spin-up cache"
+        print 
+        (fresh, cached) = testSpinUpCache()
+        self.assertEqual(fresh, cached)
+        (keys, kept) = testSpinUpCacheEviction()
+        # the least recently used entry goes
+        self.assertEqual(kept, keys[1:])
+    
+    def testSpinUpEquilibrium(self):
+        print "Testing accelerated and extrapolated spin-up"
+        print 
+        tol = 5E-03
+        pools = testSpinUpEquilibrium(tol=tol)
+        (plantc, soilc) = pools.pop("plain")
+        for mode in pools:
+            self.assertTrue(abs(pools[mode][0] - plantc) < tol)
+            self.assertTrue(abs(pools[mode][1] - soilc) < tol)
+    
+    def testRunner(self):
+        print "Testing experiment runner"
+        print 
+        (results, progress) = testRunner()
+        (good, bad) = results
+        self.assertTrue(good["ok"])
+        self.assertEqual(good["error"], None)
+        self.assertTrue(good["state"]["plantc"] > 0.0)
+        # the failed run is reported, with its error, not raised
+        self.assertFalse(bad["ok"])
+        self.assertTrue("Could not read met file" in bad["error"])
+        self.assertTrue("bad FAILED" in progress)
+        self.assertTrue("good ok" in progress)
+    
+    def testStageTimer(self):
+        print "Testing stage timing"
+        print 
+        (stub, model, elapsed) = testStageTimer()
+        # the soil time isn't counted again in the run
+        self.assertEqual(stub.totals(), {"csoil_flows": 12.0, "other": 6.0})
+        self.assertEqual(len(stub.runs), 2)
+        self.assertEqual(len(stub.years), 2)
+        # the stages add up to the time of the run, the years to all of it
+        # but the end of the run, e.g. writing the output file
+        self.assertEqual([year for (year, times) in model.years],
+                         [1996, 1997])
+        totals = model.totals()
+        total = sum(totals.values())
+        self.assertTrue(total <= elapsed and total > elapsed - 0.01)
+        for stage in totals:
+            self.assertTrue(totals[stage] >= 0.0)
+            years = sum(times.get(stage, 0.0) for (year, times) in model.years)
+            self.assertTrue(years <= totals[stage] + 1E-9)
+    
+    def testLazyComponents(self):
+        print "Testing lazy model components"
+        print 
+        (submodels, modules, classes) = testLazyComponents()
+        self.assertEqual(submodels, ["mate_c3"])
+        self.assertTrue("mate" in modules)
+        self.assertFalse("bewdy" in modules)
+        self.assertFalse("optimal_root_model" in modules)
+        # imported once, and again after it is registered anew
+        self.assertEqual(classes, [Counter, Counter, OrderedDict, OrderedDict])
+        self.assertRaises(RuntimeError, components.component_class,
+                          "test_component")
+    
     def testWaterBalance3(self):
         print "Testing Water Balance"
         print 